@@ -1,16 +1,20 @@
-from flask import Flask, request, render_template
-from docxtpl import DocxTemplate
-import pandas as pd
+from flask import Flask, request, render_template, jsonify, send_file, abort
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import secure_filename
+import io
 import os
-import platform
-import subprocess
+import re
+import hmac
 import sys
-from datetime import datetime
+import shutil
+import tempfile
+import uuid
 from pathlib import Path
-from collections import defaultdict
 import webbrowser
 import threading
 import logging
+import time
+from collections import Counter, deque
 
 log_path = Path.cwd() / "app.log"
 sys.stdout = open(log_path, "w", buffering=1)
@@ -21,69 +25,120 @@ log = logging.getLogger('werkzeug')
 log.disabled = True
 
 
-# Detectar sistema operativo
-ON_WINDOWS = platform.system() == "Windows"
-if ON_WINDOWS:
-    try:
-        from docx2pdf import convert  # solo en Windows
-        import pythoncom
-    except ImportError as e:
-        logging.error(f"Error importando docx2pdf o pythoncom: {e}")
+from utils import (
+    resource_path,
+    get_downloads_folder,
+    get_plantilla_path,
+    leer_hojas,
+    validar_subtrabajos,
+    pendientes_mask,
+    procesar_lote,
+    open_folder,
+    registro,
+    abrir_journal,
+    id_trabajo,
+    plantillas_del_lote,
+    carpeta_en_curso,
+    abrir_indice,
+    VistaPrevia,
+    planificar,
+    entrega_por_defecto,
+    abrir_cola,
+    procesar_distribuido,
+    ejecutar_trabajador,
+    planificador,
+    Admision,
+)
 
 # Configurar logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Configuración para PyInstaller
-def resource_path(relative_path):
-    """Obtener ruta absoluta de recursos, funciona tanto en desarrollo como en .exe"""
-    try:
-        # PyInstaller crea una carpeta temporal y almacena la ruta en _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-    
-    return os.path.join(base_path, relative_path)
-
 app = Flask(__name__, 
            template_folder=resource_path('templates'),
            static_folder=resource_path('static'))
 
+# Tipo de plantilla por defecto: "docx" o "pptx"
+app.config["TIPO_PLANTILLA"] = os.environ.get("CERTIFICADOS_PLANTILLA", "docx")
+# Lotes que se generan a la vez (los demás esperan en cola, primero los de menos
+# filas) y segundos tras los cuales un lote en espera pasa adelante por orden de llegada
+app.config["MAX_TRABAJOS"] = int(os.environ.get("CERTIFICADOS_MAX_TRABAJOS", "2"))
+app.config["ESPERA_ADMISION"] = float(os.environ.get("CERTIFICADOS_ESPERA_ADMISION", "30"))
+# En modo servidor cada trabajo escribe en su propia carpeta y no se abre el explorador
+app.config["AISLAR_TRABAJOS"] = False
+app.config["ABRIR_CARPETA"] = True
+# Carpeta compartida con la cola de trabajo; con ella, las filas se reparten entre
+# las máquinas que corren app.py --trabajador (y esta misma)
+app.config["COLA"] = os.environ.get("CERTIFICADOS_COLA") or None
+# Clave de administrador (prioridad, pausa, lista de trabajos); sin ella, en modo
+# servidor esas rutas quedan cerradas y en modo escritorio no se pide
+app.config["CLAVE_ADMIN"] = os.environ.get("CERTIFICADOS_CLAVE_ADMIN") or None
+# Firma de los enlaces de cada trabajo en modo servidor; sin ella se genera una
+# por proceso (los enlaces dejan de valer al reiniciar)
+app.config["CLAVE_TRABAJOS"] = os.environ.get("CERTIFICADOS_CLAVE_TRABAJOS") or uuid.uuid4().hex
+
+admision = Admision(app.config["MAX_TRABAJOS"], app.config["ESPERA_ADMISION"])
+
+# Consultas por cédula (/verificar?cedula=) permitidas por cliente y por minuto,
+# para que no se pueda recorrer el registro de emisiones probando cédulas
+app.config["CONSULTAS_POR_MINUTO"] = int(os.environ.get("CERTIFICADOS_CONSULTAS_POR_MINUTO", "10"))
+consultas = {}
+consultas_lock = threading.Lock()
+
+# Certificados de muestra (/preview), en caché en una carpeta temporal
+vista_previa = VistaPrevia()
+
+# Archivos subidos que esperan confirmación tras la validación
+UPLOADS_DIR = Path(tempfile.gettempdir()) / "certificados_subidas"
+
+def nombre_subida(nombre, usados):
+    """Nombre seguro para guardar un archivo subido; los repetidos reciben _2, _3...
+
+    usados (nombres ya tomados en la misma subida) se actualiza.
+    """
+    ruta = Path(nombre or "")
+    base = secure_filename(ruta.stem) or "archivo"
+    extension = secure_filename(ruta.suffix.lstrip("."))
+    sufijo = f".{extension}" if extension else ""
+    candidato, n = f"{base}{sufijo}", 1
+    while candidato.casefold() in usados:
+        n += 1
+        candidato = f"{base}_{n}{sufijo}"
+    usados.add(candidato.casefold())
+    return candidato
+
+def guardar_subida(excel_files, reporte):
+    """Guardar los archivos subidos y su reporte de validación; devuelve el token"""
+    token = uuid.uuid4().hex
+    carpeta = UPLOADS_DIR / token
+    os.makedirs(carpeta / "archivos", exist_ok=True)
+    usados = set()
+    for excel_file in excel_files:
+        excel_file.stream.seek(0)
+        excel_file.save(str(carpeta / "archivos" / nombre_subida(excel_file.filename, usados)))
+    reporte.to_csv(carpeta / "reporte_validacion.csv", index=False, encoding="utf-8-sig")
+    return token
+
+def carpeta_subida(token):
+    if not re.fullmatch(r"[0-9a-f]{32}", token or ""):
+        abort(404)
+    carpeta = UPLOADS_DIR / token
+    if not carpeta.is_dir():
+        abort(404)
+    return carpeta
+
+def archivos_subidos(token):
+    archivos = sorted((carpeta_subida(token) / "archivos").iterdir())
+    if not archivos:
+        abort(404)
+    return archivos
+
 def open_browser():
     try:
         webbrowser.open_new("http://127.0.0.1:5000/")
     except Exception as e:
         logger.error(f"Error abriendo navegador: {e}")
 
-def get_downloads_folder():
-    try:
-        home = Path.home()
-        downloads = home / "Downloads"
-        if not downloads.exists():
-            downloads = home / "Descargas"  # Para sistemas en español
-            if not downloads.exists():
-                downloads = home
-        return downloads
-    except Exception as e:
-        logger.error(f"Error obteniendo carpeta de descargas: {e}")
-        return Path.cwd()
-
-def get_plantilla_path():
-    """Buscar plantilla.docx en diferentes ubicaciones"""
-    possible_paths = [
-        resource_path("plantilla_final.docx"),  # Empaquetada con exe
-        "plantilla.docx",  # Directorio actual
-        Path.cwd() / "plantilla.docx",  # Directorio de trabajo
-        get_downloads_folder() / "certificados" / "plantilla.docx"  # En carpeta certificados
-    ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            logger.info(f"Plantilla encontrada en: {path}")
-            return str(path)
-    
-    raise FileNotFoundError("No se encontró plantilla.docx en ninguna ubicación")
-
 @app.route('/')
 def index():
     try:
@@ -92,219 +147,388 @@ def index():
         logger.error(f"Error en ruta index: {e}")
         return f"Error cargando página: {str(e)}", 500
 
-@app.route('/procesar', methods=['POST'])
-def procesar():
-    try:
-        # Inicializar COM solo en Windows
-        if ON_WINDOWS:
-            try:
-                pythoncom.CoInitialize()
-            except:
-                pass  # Ya está inicializado
-        
-        logger.info("Iniciando procesamiento...")
-        
-        if 'excel_file' not in request.files:
-            logger.error("No se subió archivo Excel")
-            return "No se subió archivo Excel", 400
-
-        excel_file = request.files['excel_file']
-        if excel_file.filename == '':
-            return "No se seleccionó archivo", 400
-    
-        logger.info(f"Archivo Excel recibido: {excel_file.name}")
-        # Leer Excel
+def output_folder():
+    if app.config["COLA"]:
+        # Los trabajadores escriben en la carpeta compartida
+        return Path(app.config["COLA"]) / "Certificados"
+    return get_downloads_folder() / "Certificados"
+
+def carpeta_trabajo(trabajo_id):
+    """Carpeta de salida de un trabajo; aislada por trabajo en modo servidor"""
+    if app.config["AISLAR_TRABAJOS"]:
+        return output_folder() / "trabajos" / trabajo_id
+    return output_folder()
+
+def leer_archivos(archivos):
+    """Leer todas las hojas de todos los libros. Devuelve (subtrabajos, hojas_ignoradas)"""
+    subtrabajos, hojas_ignoradas = [], []
+    for excel_filename, excel_file in archivos:
         try:
-            df = pd.read_excel(excel_file)
-            logger.info(f"Excel leído correctamente. Filas: {len(df)}")
-            excel_filename = excel_file.filename
-            logger.info(f"Archivo Excel recibido: {excel_filename}")
+            subs, errores = leer_hojas(excel_file, excel_filename)
         except Exception as e:
-            logger.error(f"Error leyendo Excel: {e}")
-            return f"Error leyendo archivo Excel: {str(e)}", 400
-
-        required_mapping = {
-            'item': ['item', 'Item', 'ITEM'],
-            'nombre': ['nombre', 'Nombre', 'NOMBRE'],
-            'cedula': ['cedula', 'Cedula', 'CÉDULA', 'cédula', 'Cédula', 'CEDULA'],
-            'fecha': ['fecha', 'Fecha', 'FECHA'],
-            'compañia': ['compañia', 'Compañia', 'COMPAÑÍA', 'compania', 'Compania', 'empresa', 'Empresa', 'COMPAÑIA'],
-            'certificado': ['certificado', 'Certificado', 'CERTIFICADO'],
-            'horas': ['horas', 'Horas', 'HORAS'],
-            'id_formacion': ['id_formacion', 'Id_Formacion', 'ID_FORMACION', 'id formación', 'Id Formación', 'ID FORMACIÓN']
-        }
-        
-        # Normalizar nombres de columnas
-        column_mapping = {}
-        for standard_name, variations in required_mapping.items():
-            found = False
-            for variation in variations:
-                if variation in df.columns:
-                    column_mapping[variation] = standard_name
-                    found = True
-                    break
-            if not found:
-                return f"No se encontró la columna '{standard_name}' en el Excel. Columnas disponibles: {list(df.columns)}", 400
-        
-        # Renombrar columnas para estandarizar
-        df = df.rename(columns=column_mapping)
-
-        # Se valida que haya al menos un 'no' en la columna 'certificado'
-        certificados_pendientes = df["certificado"].astype(str).str.lower().str.strip() == "no"
-        if not certificados_pendientes.any():
-            return render_template("error.html")
-        
-        # Obtener plantilla
+            raise ValueError(f"Error leyendo archivo Excel {excel_filename}: {e}") from e
+        logger.info(f"Archivo Excel recibido: {excel_filename} ({len(subs)} hojas)")
+        subtrabajos += subs
+        hojas_ignoradas += errores.values()
+    return subtrabajos, hojas_ignoradas
+
+def archivos_de_peticion():
+    """(nombre, archivo) subidos en la petición, o guardados bajo el token del formulario"""
+    token = request.form.get("token")
+    if token:
+        return [(path.name, path) for path in archivos_subidos(token)]
+    return [(f.filename, f) for f in request.files.getlist('excel_file') if f.filename]
+
+def plantilla_por_defecto():
+    return get_plantilla_path(app.config["TIPO_PLANTILLA"])
+
+def simular_trabajo(archivos, token=None):
+    """Modo simulación: qué se generaría y cuánto tardaría, sin generar nada"""
+    try:
+        subtrabajos, hojas_ignoradas = leer_archivos(archivos)
+    except ValueError as e:
+        logger.error(str(e))
+        return str(e), 400
+    if not subtrabajos:
+        return hojas_ignoradas[0], 400
+    try:
+        plantilla_path = plantilla_por_defecto()
+    except FileNotFoundError as e:
+        return f"Error: {str(e)}", 400
+
+    reporte = validar_subtrabajos(subtrabajos)
+    journal = abrir_journal(output_folder())
+    trabajo_id = id_trabajo(archivos, plantillas_del_lote(subtrabajos, plantilla_path))
+    plan = planificar(subtrabajos, plantilla_path, journal.rendimiento(), journal, trabajo_id)
+    plan["hojas_ignoradas"] = hojas_ignoradas
+    if request.form.get("formato") == "json":
+        return jsonify(plan)
+
+    # Los archivos quedan guardados para poder generar sin volver a subirlos
+    token = token or guardar_subida([f for _, f in archivos], reporte)
+    return render_template("plan.html", plan=plan, token=token)
+
+def ejecutar_trabajo(archivos, solo_validas=False, token=None, plantilla_path=None, enviar_correo=False):
+    """Leer, validar y procesar los archivos; devuelve la respuesta para el navegador.
+
+    archivos es una lista de (nombre, archivo) donde archivo es un archivo
+    subido o una ruta en disco. Con enviar_correo, los certificados generados
+    se envían por correo al terminar (ver utils.correo).
+    """
+    # Leer todas las hojas de todos los libros
+    try:
+        subtrabajos, hojas_ignoradas = leer_archivos(archivos)
+    except ValueError as e:
+        logger.error(str(e))
+        return str(e), 400
+
+    if not subtrabajos:
+        return hojas_ignoradas[0], 400
+
+    # Se valida que haya al menos un 'no' en la columna 'certificado'
+    if not any(pendientes_mask(sub.df).any() for sub in subtrabajos):
+        return render_template("error.html")
+
+    # Validar todas las filas antes de empezar a generar
+    reporte = validar_subtrabajos(subtrabajos)
+    if len(reporte) and not solo_validas:
+        token = token or guardar_subida([f for _, f in archivos], reporte)
+        filas_con_error = len(set(zip(reporte["archivo"], reporte["hoja"], reporte.index)))
+        return render_template(
+            "validacion.html",
+            token=token,
+            errores=reporte.head(500).to_dict("records"),
+            total_errores=len(reporte),
+            filas_con_error=filas_con_error,
+        ), 422
+
+    # Obtener plantilla
+    if plantilla_path is None:
         try:
-            plantilla_path = get_plantilla_path()
+            plantilla_path = plantilla_por_defecto()
         except FileNotFoundError as e:
             logger.error(str(e))
             return f"Error: {str(e)}", 400
 
-        # Crear carpetas de salida
-        downloads_folder = get_downloads_folder()
-        output_dir = downloads_folder / "Certificados"
-        os.makedirs(output_dir, exist_ok=True)
-        logger.info(f"Carpeta de salida: {output_dir}")
-
-        certificados_por_compania = defaultdict(list)
-        certificados_creados = 0
-
-        # Procesar cada fila
-        for index, row in df.iterrows():
-            try:
-                if str(row["certificado"]).lower().strip() == "no":
-                    logger.info(f"Procesando certificado para: {row['nombre']}")
-                    
-                    # Preparar contexto
-                    meses = {
-                        "01": "Enero", "02": "Febrero", "03": "Marzo",
-                        "04": "Abril", "05": "Mayo", "06": "Junio",
-                        "07": "Julio", "08": "Agosto", "09": "Septiembre",
-                        "10": "Octubre", "11": "Noviembre", "12": "Diciembre"
-                    }
-
-                    fecha = row["fecha"] if not pd.isna(row["fecha"]) else None
-                    if fecha:
-                        dia = fecha.strftime("%d")
-                        mes = meses[fecha.strftime("%m")]
-                        año = fecha.strftime("%Y")
-                    else:
-                        dia = mes = año = ""
-
-                    id_form = row.get("id_formacion", "")
-                    item = row.get("item", "")
-
-                    certificado_code = ""
-                    if pd.notna(id_form) and id_form != "" and pd.notna(item) and item != "":
-                        try:
-                            certificado_code = f"{int(id_form):04d}-{int(item):04d}"
-                        except Exception:
-                            certificado_code = f"{id_form}-{item}"
-
-                    contexto = { 
-                        "NOMBRE": str(row["nombre"]),
-                        "CEDULA": str(row["cedula"]),
-                        "DIA": dia,
-                        "MES": mes,
-                        "AÑO": año,
-                        "COMPANIA": str(row["compañia"]),
-                        "HORAS": str(row.get("horas", "")),
-                        
-                        "CERTIFICADO": certificado_code
-                        
-                    }
-
-                    # Crear subcarpeta por compañía
-                    compania_folder = output_dir / str(row["compañia"]).replace(" ", "_").replace("/", "_")
-                    os.makedirs(compania_folder, exist_ok=True)
-
-                    # Generar nombres de archivo
-                    plantilla_name = str(row.get("horas", "general"))
-                    nombre_base = f"certificado_0{plantilla_name}_horas_{row['nombre'].replace(' ', '_')}"
-                    nombre_base = "".join(c for c in nombre_base if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                    
-                    docx_file = compania_folder / f"{nombre_base}.docx"
-                    pdf_file = compania_folder / f"{nombre_base}.pdf"
-
-                    # Generar certificado
-                    plantilla = DocxTemplate(plantilla_path)
-                    plantilla.render(contexto)
-                    plantilla.save(str(docx_file))
-                    
-                    
-                    # Actualizar DataFrame
-                    df.at[index, "certificado"] = "si"
-
-                    # Conversión a PDF 
-                    if ON_WINDOWS:
-                        try:
-                            convert(str(docx_file), str(pdf_file))
-                            os.remove(docx_file)
-                            logger.info(f"Certificado PDF creado: {pdf_file}")
-                        except Exception as e:
-                            logger.error(f"Error convirtiendo a PDF: {e}")
-                            # Mantener DOCX si falla la conversión a PDF
-                    else:
-                        # LibreOffice (Linux/Mac)
-                        try:
-                            subprocess.run([        
-                                "soffice", "--headless", "--convert-to", "pdf", 
-                                "--outdir", str(compania_folder), str(docx_file)
-                            ], check=True)
-                            os.remove(docx_file)
-                        except subprocess.CalledProcessError as e:
-                            logger.error(f"Error con LibreOffice: {e}")
-
-                    certificados_por_compania[row["compañia"]].append(f"{nombre_base}.pdf")
-                    certificados_creados += 1
-
-            except Exception as e:
-                logger.error(f"Error procesando fila {index}: {e}")
-                continue
-
-        # Se guarda el Excel actualizado
-
-# Guardar Excel actualizado en carpeta Certificados con el mismo nombre del archivo subido
-        try:
-            original_name = Path(excel_file.filename).name  # nombre original del archivo
-            excel_actualizado = output_dir / original_name  # lo guardamos con el mismo nombre
-            df.to_excel(excel_actualizado, index=False)
-            logger.info(f"Excel actualizado guardado: {excel_actualizado}")
-        except Exception as e:
-            logger.error(f"Error guardando Excel: {e}")
-
-        # Limpiar COM
-        if ON_WINDOWS:
-            try:
-                pythoncom.CoUninitialize()
-            except:
-                pass
-        try:
-            if ON_WINDOWS:
-                os.startfile(str(output_dir))
-            elif platform.system() == "Darwin":  # Mac
-                subprocess.run(["open", str(output_dir)])
-            else:  # Linux
-                subprocess.run(["xdg-open", str(output_dir)])
-        except Exception as e:
-            logger.error(f"No se pudo abrir automáticamente la carpeta: {e}")
+    entrega = None
+    if enviar_correo:
+        entrega = entrega_por_defecto()
+        if entrega is None:
+            return "Para enviar por correo configura el servidor SMTP (CERTIFICADOS_SMTP_HOST)", 400
 
-        logger.info(f"Procesamiento completado. Certificados creados: {certificados_creados}")
+    # Límite global de lotes simultáneos (por memoria): los demás esperan en cola,
+    # y dentro del límite el planificador reparte render y conversores
+    filas = sum(int(pendientes_mask(sub.df).sum()) for sub in subtrabajos)
+    try:
+        with admision.turno(filas):
+            # El journal permite reanudar el trabajo si algo falla a mitad de camino
+            journal = abrir_journal(output_folder())
+            trabajo_id = id_trabajo(archivos, plantillas_del_lote(subtrabajos, plantilla_path))
+            journal.iniciar(trabajo_id, archivos, plantilla_path)
+
+            # Hojas y libros se procesan a la vez; cada libro se guarda actualizado
+            # Se escribe en una carpeta temporal del trabajo que se publica al terminar
+            opciones = dict(journal=journal, trabajo_id=trabajo_id,
+                            en_curso=carpeta_en_curso(output_folder(), trabajo_id),
+                            indice=abrir_indice(output_folder()), entrega=entrega)
+            if app.config["COLA"]:
+                resultados = procesar_distribuido(subtrabajos, plantilla_path, abrir_cola(app.config["COLA"]),
+                                                  carpeta_trabajo(trabajo_id), **opciones)
+            else:
+                resultados = procesar_lote(subtrabajos, plantilla_path, carpeta_trabajo(trabajo_id), **opciones)
+    finally:
+        if entrega is not None:
+            entrega.cerrar()
+
+    if token:
+        shutil.rmtree(UPLOADS_DIR / token, ignore_errors=True)
+
+    if app.config["ABRIR_CARPETA"]:
+        open_folder(resultados[0].output_dir)
+
+    envios = sum((r.envios for r in resultados), Counter()) if entrega is not None else None
+    descarga = None
+    if app.config["AISLAR_TRABAJOS"]:
+        descarga = f"/jobs/{trabajo_id}/descarga?acceso={acceso_trabajo(trabajo_id)}"
+    return render_template("success.html", envios=envios, descarga=descarga)
 
-        return render_template("success.html")
+@app.route('/procesar', methods=['POST'])
+def procesar():
+    try:
+        logger.info("Iniciando procesamiento...")
+        
+        token = request.form.get("token")
+        solo_validas = request.form.get("solo_validas") == "1"
+
+        # Con token: confirmación después de ver el reporte de validación o la simulación
+        if not token and 'excel_file' not in request.files:
+            logger.error("No se subió archivo Excel")
+            return "No se subió archivo Excel", 400
+        archivos = archivos_de_peticion()
+        if not archivos:
+            return "No se seleccionó archivo", 400
 
-       
+        if request.form.get("simular") == "1":
+            return simular_trabajo(archivos, token)
+        enviar_correo = request.form.get("enviar_correo") == "1"
+        return ejecutar_trabajo(archivos, solo_validas, token, enviar_correo=enviar_correo)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error general en procesamiento: {e}")
-        if ON_WINDOWS:
-            try:
-                pythoncom.CoUninitialize()
-            except:
-                pass
         return f"Error interno: {str(e)}", 500
 
+@app.route('/preview', methods=['POST'])
+def preview():
+    """Certificados de las primeras filas pendientes (?n=3), como PDF o como PNG (?formato=png&pagina=1)"""
+    try:
+        archivos = archivos_de_peticion()
+        if not archivos:
+            return "No se subió archivo Excel", 400
+        n = min(max(request.values.get("n", 3, type=int), 1), 20)
+        subtrabajos, hojas_ignoradas = leer_archivos(archivos)
+        if not subtrabajos:
+            return hojas_ignoradas[0], 400
+        pdf = vista_previa.generar(subtrabajos, plantilla_por_defecto(), n)
+
+        if request.values.get("formato") == "png":
+            png = vista_previa.pagina_png(pdf, request.values.get("pagina", 1, type=int))
+            if png is None:
+                return "La vista previa en imagen necesita PyMuPDF o pdftoppm; usa formato=pdf", 501
+            return send_file(io.BytesIO(png), mimetype="image/png")
+        return send_file(pdf, mimetype="application/pdf", download_name="vista_previa.pdf")
+
+    except HTTPException:
+        raise
+    except (ValueError, FileNotFoundError, RuntimeError) as e:
+        return f"Error en la vista previa: {str(e)}", 400
+    except Exception as e:
+        logger.error(f"Error en vista previa: {e}")
+        return f"Error interno: {str(e)}", 500
+
+@app.route('/jobs')
+def jobs():
+    # En modo servidor la lista de trabajos de todos los usuarios es solo para el administrador
+    if app.config["AISLAR_TRABAJOS"] and not es_admin():
+        abort(403)
+    return jsonify(abrir_journal(output_folder()).listar())
+
+@app.route('/jobs/<trabajo_id>')
+def job(trabajo_id):
+    if not puede_ver_trabajo(trabajo_id):
+        abort(403)
+    resumen = abrir_journal(output_folder()).resumen(trabajo_id)
+    if resumen is None:
+        abort(404)
+    en_curso = planificador().trabajo(trabajo_id)
+    if en_curso is not None:
+        resumen["planificacion"] = en_curso.estado()
+    return jsonify(resumen)
+
+@app.route('/jobs/<trabajo_id>/resume', methods=['POST'])
+def resume_job(trabajo_id):
+    """Continuar un trabajo interrumpido desde las filas que faltan"""
+    if not puede_ver_trabajo(trabajo_id):
+        abort(403)
+    try:
+        trabajo = abrir_journal(output_folder()).trabajo(trabajo_id)
+        if trabajo is None:
+            abort(404)
+        if trabajo["estado"] == "completado":
+            # Las copias de los archivos subidos se borran al completar el trabajo
+            return "El trabajo ya está completo; no hay nada que reanudar", 409
+        archivos = [(Path(p).name, Path(p)) for p in trabajo["fuentes"]]
+        plantilla_path = trabajo["plantilla"] if os.path.exists(trabajo["plantilla"] or "") else None
+        # El trabajo ya se confirmó cuando se inició
+        return ejecutar_trabajo(archivos, solo_validas=True, plantilla_path=plantilla_path)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error reanudando trabajo {trabajo_id}: {e}")
+        return f"Error interno: {str(e)}", 500
+
+def es_admin():
+    clave = app.config["CLAVE_ADMIN"]
+    if not clave:
+        # Sin clave solo se administra en modo escritorio; el servidor queda cerrado
+        return not app.config["AISLAR_TRABAJOS"]
+    enviada = request.headers.get("X-Clave-Admin") or request.form.get("clave") or ""
+    return hmac.compare_digest(enviada.encode(), clave.encode())
+
+def acceso_trabajo(trabajo_id):
+    """Clave de acceso a un trabajo, que recibe quien lo envió (enlace de descarga)"""
+    firma = hmac.new(app.config["CLAVE_TRABAJOS"].encode(), trabajo_id.encode(), "sha256")
+    return firma.hexdigest()[:32]
+
+def puede_ver_trabajo(trabajo_id):
+    """Si quien pide puede consultar, reanudar o descargar el trabajo.
+
+    En modo servidor solo el administrador o quien tenga la clave de acceso
+    del trabajo (?acceso= o cabecera X-Acceso-Trabajo).
+    """
+    if not app.config["AISLAR_TRABAJOS"] or es_admin():
+        return True
+    enviada = request.headers.get("X-Acceso-Trabajo") or request.values.get("acceso") or ""
+    return hmac.compare_digest(enviada.encode(), acceso_trabajo(trabajo_id).encode())
+
+@app.route('/planificador')
+def estado_planificador():
+    """Lotes admitidos y en cola, turnos libres y, por trabajo en curso, su peso, espera y procesamiento"""
+    estado = planificador().estado()
+    estado["admision"] = admision.estado()
+    return jsonify(estado)
+
+@app.route('/jobs/<trabajo_id>/prioridad', methods=['POST'])
+def prioridad_trabajo(trabajo_id):
+    """Cambiar el peso de un trabajo en curso (peso=3: tres veces más turnos que uno normal)"""
+    if not es_admin():
+        abort(403)
+    try:
+        peso = float(request.values.get("peso", ""))
+    except ValueError:
+        return "El parámetro peso debe ser un número", 400
+    if not peso > 0:
+        return "El peso debe ser mayor que cero", 400
+    trabajo = planificador().cambiar_peso(trabajo_id, peso)
+    if trabajo is None:
+        abort(404)
+    return jsonify(trabajo.estado())
+
+@app.route('/jobs/<trabajo_id>/pausar', methods=['POST'])
+def pausar_trabajo(trabajo_id):
+    if not es_admin():
+        abort(403)
+    trabajo = planificador().pausar(trabajo_id)
+    if trabajo is None:
+        abort(404)
+    return jsonify(trabajo.estado())
+
+@app.route('/jobs/<trabajo_id>/reanudar', methods=['POST'])
+def reanudar_trabajo(trabajo_id):
+    if not es_admin():
+        abort(403)
+    trabajo = planificador().reanudar(trabajo_id)
+    if trabajo is None:
+        abort(404)
+    return jsonify(trabajo.estado())
+
+@app.route('/jobs/<trabajo_id>/descarga')
+def descargar_trabajo(trabajo_id):
+    """ZIP con los certificados y libros de un trabajo (modo servidor)"""
+    if not re.fullmatch(r"[0-9a-f]{16}", trabajo_id) or not app.config["AISLAR_TRABAJOS"]:
+        abort(404)
+    if not puede_ver_trabajo(trabajo_id):
+        abort(403)
+    carpeta = carpeta_trabajo(trabajo_id)
+    if not carpeta.is_dir():
+        abort(404)
+    base = Path(tempfile.mkdtemp(prefix="certificados_zip_")) / f"certificados_{trabajo_id}"
+    zip_path = shutil.make_archive(str(base), "zip", carpeta)
+    return send_file(zip_path, as_attachment=True, download_name=f"certificados_{trabajo_id}.zip")
+
+@app.route('/cola')
+def cola():
+    """Tareas por estado y máquinas trabajadoras de la cola compartida"""
+    if not app.config["COLA"]:
+        abort(404)
+    return jsonify(abrir_cola(app.config["COLA"]).resumen())
+
+def consulta_permitida():
+    """Si el cliente no pasó de CONSULTAS_POR_MINUTO en el último minuto (y registrar esta)"""
+    ahora = time.monotonic()
+    with consultas_lock:
+        recientes = consultas.setdefault(request.remote_addr, deque())
+        while recientes and ahora - recientes[0] > 60:
+            recientes.popleft()
+        if len(recientes) >= app.config["CONSULTAS_POR_MINUTO"]:
+            return False
+        recientes.append(ahora)
+        # Olvidar los clientes sin consultas recientes
+        for cliente in [c for c, d in consultas.items() if not d]:
+            del consultas[cliente]
+        return True
+
+@app.route('/verificar')
+def verificar_cedula():
+    """Certificados emitidos a una cédula (?cedula=...), con límite de consultas por cliente"""
+    if not consulta_permitida():
+        return "Demasiadas consultas; intenta de nuevo en un minuto", 429, {"Retry-After": "60"}
+    cedula = request.args.get("cedula", "").strip()
+    if not cedula:
+        return "Falta el parámetro cedula", 400
+    emisiones = abrir_indice(output_folder()).por_cedula(cedula)
+    return jsonify({"cedula": cedula, "emitido": bool(emisiones), "certificados": emisiones}), 200 if emisiones else 404
+
+@app.route('/verificar/<codigo>')
+def verificar(codigo):
+    """¿Se emitió el certificado con este código, y a quién?"""
+    emisiones = abrir_indice(output_folder()).por_codigo(codigo)
+    return jsonify({"codigo": codigo, "emitido": bool(emisiones), "certificados": emisiones}), 200 if emisiones else 404
+
+@app.route('/emisiones.csv')
+def exportar_emisiones():
+    """Exportación de las emisiones (?compania=...&desde=AAAA-MM-DD), solo para el administrador"""
+    if not es_admin():
+        abort(403)
+    destino = Path(tempfile.mkdtemp(prefix="certificados_emisiones_")) / "emisiones.csv"
+    abrir_indice(output_folder()).exportar(destino, request.args.get("compania"), request.args.get("desde"))
+    return send_file(destino, as_attachment=True, download_name="emisiones.csv")
+
+@app.route('/validacion/<token>/reporte.csv')
+def reporte_validacion(token):
+    return send_file(carpeta_subida(token) / "reporte_validacion.csv",
+                     as_attachment=True, download_name="reporte_validacion.csv")
+
+@app.route('/templates')
+def templates():
+    """Plantillas cargadas con sus variables y hora de carga"""
+    try:
+        return jsonify(registro.listar())
+    except Exception as e:
+        logger.error(f"Error listando plantillas: {e}")
+        return f"Error listando plantillas: {str(e)}", 500
+
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"Error 500: {error}")
@@ -312,18 +536,77 @@ def internal_error(error):
 
 
 
+def configurar_servidor(max_trabajos=None):
+    """Ajustes para usar la aplicación como servidor compartido"""
+    global admision
+    app.config["AISLAR_TRABAJOS"] = True
+    app.config["ABRIR_CARPETA"] = False
+    if max_trabajos:
+        app.config["MAX_TRABAJOS"] = max_trabajos
+    admision = Admision(app.config["MAX_TRABAJOS"], app.config["ESPERA_ADMISION"])
+    if not app.config["CLAVE_ADMIN"]:
+        logger.warning("Sin CERTIFICADOS_CLAVE_ADMIN las rutas de administración quedan cerradas")
+
+# Con gunicorn/waitress-serve (app:app) el modo servidor se activa por entorno
+if os.environ.get("CERTIFICADOS_SERVIDOR") == "1":
+    configurar_servidor()
+
+def servir_produccion(host, port, hilos):
+    """Servir con waitress (servidor WSGI multihilo) en lugar del servidor de desarrollo"""
+    try:
+        from waitress import serve
+    except ImportError:
+        logger.error("waitress no está instalado (pip install waitress); usando el servidor de desarrollo")
+        app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
+        return
+    logger.info(f"Servidor de producción en http://{host}:{port}/ con {hilos} hilos, "
+                f"máximo {app.config['MAX_TRABAJOS']} trabajos simultáneos")
+    serve(app, host=host, port=port, threads=hilos)
+
+def parse_args(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generador de certificados")
+    parser.add_argument("--servidor", action="store_true",
+                        help="modo servidor compartido (waitress, carpetas de salida por trabajo)")
+    parser.add_argument("--host", default=os.environ.get("CERTIFICADOS_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("CERTIFICADOS_PORT", "5000")))
+    parser.add_argument("--hilos", type=int, default=int(os.environ.get("CERTIFICADOS_HILOS", "8")),
+                        help="hilos del servidor para atender peticiones")
+    parser.add_argument("--max-trabajos", type=int, default=None,
+                        help="trabajos de conversión simultáneos")
+    parser.add_argument("--cola", default=os.environ.get("CERTIFICADOS_COLA"),
+                        help="carpeta compartida para repartir los lotes entre varias máquinas")
+    parser.add_argument("--trabajador", action="store_true",
+                        help="solo generar las tareas de la cola compartida (sin interfaz web)")
+    return parser.parse_args(argv)
+
+
+
 if __name__ == "__main__":
     try:
+        args = parse_args()
+
         # Verificar archivos necesarios
         template_path = resource_path('templates')
         if not os.path.exists(template_path):
             logger.warning(f"ADVERTENCIA: No se encuentra carpeta templates en {template_path}")
         
-        # Abrir navegador después de un delay
-        threading.Timer(2.0, open_browser).start()
-        
-        # Ejecutar Flask
-        app.run(host='127.0.0.1', port=5000, debug=False, use_reloader=False)
+        if args.cola:
+            app.config["COLA"] = args.cola
+        if args.trabajador:
+            if not args.cola:
+                raise SystemExit("--trabajador necesita --cola (o CERTIFICADOS_COLA)")
+            ejecutar_trabajador(args.cola)
+        elif args.servidor:
+            configurar_servidor(args.max_trabajos)
+            servir_produccion(args.host, args.port, args.hilos)
+        else:
+            # Abrir navegador después de un delay
+            threading.Timer(2.0, open_browser).start()
+
+            # Ejecutar Flask
+            app.run(host=args.host, port=args.port, debug=False, use_reloader=False)
         
     except Exception as e:
         logger.error(f"Error iniciando aplicación: {e}")
\ No newline at end of file
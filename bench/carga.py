@@ -0,0 +1,404 @@
+"""Prueba de carga de POST /procesar con un conversor simulado.
+
+Sube N libros generados a la vez (cada usuario sube --rondas libros seguidos)
+y mide la latencia de /procesar, la de / mientras hay trabajos en curso, el
+pico de memoria residente del servidor y el rendimiento en filas por segundo.
+El render de las plantillas es el real; solo la conversión a PDF se reemplaza
+por una espera de --demora segundos, así no hace falta LibreOffice ni Word.
+
+    python bench/carga.py --usuarios 4 --filas 500
+    python bench/carga.py --modo local --usuarios 8 --filas 2000 --max-trabajos 2 --json carga.json
+
+En modo "proceso" la aplicación corre en este mismo proceso (Flask test
+client, un hilo por usuario); la memoria medida incluye la de los libros
+generados. En modo "local" se levanta un servidor (waitress si está
+instalado) en 127.0.0.1 y se le habla por HTTP; la memoria es solo la del
+servidor. Todo se escribe en una carpeta temporal (app.log incluido).
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+# app.py redirige stdout a app.log; el reporte siempre va a la consola
+consola = sys.__stdout__
+
+
+def pdf_minimo():
+    """Un PDF válido de una página vacía (estructura, xref y %%EOF)"""
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] >>",
+    ]
+    salida = io.BytesIO()
+    salida.write(b"%PDF-1.4\n")
+    posiciones = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posiciones.append(salida.tell())
+        salida.write(b"%d 0 obj\n%s\nendobj\n" % (numero, objeto))
+    xref = salida.tell()
+    salida.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1))
+    for posicion in posiciones:
+        salida.write(b"%010d 00000 n \n" % posicion)
+    salida.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref))
+    return salida.getvalue()
+
+
+def instalar_conversor_simulado(demora):
+    """Reemplazar la conversión de los backends por una espera y un PDF fijo"""
+    from utils import backends
+
+    contenido = pdf_minimo()
+
+    def convert(self, doc_path, pdf_path):
+        time.sleep(demora)
+        Path(pdf_path).write_bytes(contenido)
+        return True
+
+    backends.DocxBackend.convert = convert
+    backends.PptxBackend.convert = convert
+
+
+def preparar_app(carpeta, demora, max_trabajos=None, espera_admision=None):
+    """Importar app.py aislado en carpeta, con el conversor simulado y en modo servidor"""
+    os.chdir(carpeta)  # app.log y los archivos relativos quedan en la carpeta temporal
+    import app as aplicacion
+
+    instalar_conversor_simulado(demora)
+    # Las plantillas y recursos siguen siendo los del repositorio
+    aplicacion.app.template_folder = str(RAIZ / "templates")
+    aplicacion.app.static_folder = str(RAIZ / "static")
+    plantilla = RAIZ / f"plantilla_final.{aplicacion.app.config['TIPO_PLANTILLA']}"
+    aplicacion.plantilla_por_defecto = lambda: str(plantilla)
+    aplicacion.get_downloads_folder = lambda: Path(carpeta)
+    aplicacion.configurar_servidor(max_trabajos)
+    if espera_admision is not None:
+        aplicacion.app.config["ESPERA_ADMISION"] = espera_admision
+    return aplicacion
+
+
+def generar_libro(numero, filas, formato="xlsx"):
+    """Libro con filas pendientes y válidas; cada libro es distinto (otro id de trabajo)"""
+    import pandas as pd
+
+    df = pd.DataFrame({
+        "item": range(1, filas + 1),
+        "nombre": [f"Participante {numero} {i}" for i in range(filas)],
+        "cedula": [f"{numero:04d}{i:07d}" for i in range(filas)],
+        "fecha": "15/03/2025",
+        "compañia": [f"Empresa {i % 5}" for i in range(filas)],
+        "certificado": "no",
+        "horas": 20,
+        "id_formacion": 100 + numero,
+    })
+    salida = io.BytesIO()
+    if formato == "csv":
+        df.to_csv(salida, index=False)
+    else:
+        df.to_excel(salida, index=False)
+    return f"carga_{numero:04d}.{formato}", salida.getvalue()
+
+
+def memoria_actual(pid):
+    """Memoria residente (bytes) de un proceso, o None si no se puede medir"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Muestreo:
+    """Hilo que repite una medición cada intervalo hasta detener()"""
+
+    def __init__(self, medir, intervalo):
+        self.medir = medir
+        self.intervalo = intervalo
+        self.valores = []
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._correr, daemon=True)
+
+    def _correr(self):
+        while not self._detener.is_set():
+            valor = self.medir()
+            if valor is not None:
+                self.valores.append(valor)
+            self._detener.wait(self.intervalo)
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+        self._hilo.join()
+        return self.valores
+
+
+class ClienteProceso:
+    """Peticiones a la aplicación importada en este proceso (un test client por hilo)"""
+
+    def __init__(self, aplicacion):
+        self.app = aplicacion.app
+        self._local = threading.local()
+
+    def _cliente(self):
+        if not hasattr(self._local, "cliente"):
+            self._local.cliente = self.app.test_client()
+        return self._local.cliente
+
+    def subir(self, nombre, contenido):
+        respuesta = self._cliente().post(
+            "/procesar", data={"excel_file": (io.BytesIO(contenido), nombre)},
+            content_type="multipart/form-data",
+        )
+        return respuesta.status_code
+
+    def obtener(self, ruta):
+        return self._cliente().get(ruta).status_code
+
+
+class ClienteHTTP:
+    """Peticiones HTTP a un servidor en localhost"""
+
+    def __init__(self, url, timeout=3600):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _abrir(self, peticion):
+        try:
+            with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+                respuesta.read()
+                return respuesta.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def subir(self, nombre, contenido):
+        limite = uuid.uuid4().hex
+        cuerpo = b"".join([
+            f"--{limite}\r\n".encode(),
+            f'Content-Disposition: form-data; name="excel_file"; filename="{nombre}"\r\n'.encode(),
+            b"Content-Type: application/octet-stream\r\n\r\n",
+            contenido,
+            f"\r\n--{limite}--\r\n".encode(),
+        ])
+        peticion = urllib.request.Request(
+            f"{self.url}/procesar", data=cuerpo, method="POST",
+            headers={"Content-Type": f"multipart/form-data; boundary={limite}"},
+        )
+        return self._abrir(peticion)
+
+    def obtener(self, ruta):
+        return self._abrir(urllib.request.Request(f"{self.url}{ruta}"))
+
+
+def medir(funcion, *args):
+    """(segundos, resultado) de una llamada; las excepciones cuentan como estado"""
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion(*args)
+    except Exception as e:
+        resultado = type(e).__name__
+    return time.perf_counter() - inicio, resultado
+
+
+def percentiles(valores, puntos=(50, 90, 95, 99)):
+    """Percentiles por rango más cercano, en milisegundos"""
+    if not valores:
+        return {}
+    ordenados = sorted(valores)
+    resumen = {f"p{p}": ordenados[min(len(ordenados) - 1, max(0, -(-p * len(ordenados) // 100) - 1))] * 1000
+               for p in puntos}
+    resumen["max"] = ordenados[-1] * 1000
+    return resumen
+
+
+def esperar_servidor(cliente, proceso, limite=60):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise SystemExit(f"El servidor terminó al arrancar (código {proceso.returncode})")
+        try:
+            if cliente.obtener("/") == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("El servidor no respondió a tiempo")
+
+
+def puerto_libre():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def ejecutar_carga(args, carpeta):
+    libros = [generar_libro(numero, args.filas, args.formato) for numero in range(args.usuarios * args.rondas)]
+
+    servidor = None
+    if args.modo == "local":
+        puerto = args.port or puerto_libre()
+        comando = [sys.executable, str(Path(__file__).resolve()), "--servir", "--port", str(puerto),
+                   "--carpeta", str(carpeta), "--demora", str(args.demora), "--hilos", str(args.hilos)]
+        if args.max_trabajos:
+            comando += ["--max-trabajos", str(args.max_trabajos)]
+        if args.espera_admision is not None:
+            comando += ["--espera-admision", str(args.espera_admision)]
+        servidor = subprocess.Popen(comando, cwd=carpeta)
+        cliente = ClienteHTTP(f"http://127.0.0.1:{puerto}")
+        esperar_servidor(cliente, servidor)
+        pid = servidor.pid
+    else:
+        cliente = ClienteProceso(preparar_app(carpeta, args.demora, args.max_trabajos, args.espera_admision))
+        pid = os.getpid()
+
+    try:
+        memoria_base = memoria_actual(pid)
+        memoria = Muestreo(lambda: memoria_actual(pid), 0.05).iniciar()
+        portada = Muestreo(lambda: medir(cliente.obtener, "/"), args.intervalo)
+
+        def usuario(numero):
+            resultados = []
+            for ronda in range(args.rondas):
+                nombre, contenido = libros[numero * args.rondas + ronda]
+                resultados.append(medir(cliente.subir, nombre, contenido))
+            return resultados
+
+        inicio = time.perf_counter()
+        portada.iniciar()
+        with ThreadPoolExecutor(args.usuarios) as ejecutor:
+            subidas = [r for lista in ejecutor.map(usuario, range(args.usuarios)) for r in lista]
+        duracion = time.perf_counter() - inicio
+        latencias_portada = portada.detener()
+        muestras_memoria = memoria.detener()
+    finally:
+        if servidor is not None:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+    estados = {}
+    for _, estado in subidas:
+        estados[str(estado)] = estados.get(str(estado), 0) + 1
+    completadas = [segundos for segundos, estado in subidas if estado == 200]
+    filas = len(completadas) * args.filas
+    pico = max(muestras_memoria, default=None)
+    concurrentes = min(args.usuarios, args.max_trabajos or int(os.environ.get("CERTIFICADOS_MAX_TRABAJOS", "2")))
+    return {
+        "modo": args.modo,
+        "usuarios": args.usuarios,
+        "rondas": args.rondas,
+        "filas_por_libro": args.filas,
+        "formato": args.formato,
+        "demora_conversion": args.demora,
+        "tamano_libro_kb": sum(len(c) for _, c in libros) / len(libros) / 1024,
+        "duracion_s": duracion,
+        "estados": estados,
+        "procesar_ms": percentiles([segundos for segundos, _ in subidas]),
+        "procesar_ok_ms": percentiles(completadas),
+        "portada_ms": percentiles([segundos for segundos, _ in latencias_portada]),
+        "portada_errores": sum(1 for _, estado in latencias_portada if estado != 200),
+        "filas_por_segundo": filas / duracion if duracion else 0.0,
+        "trabajos_por_minuto": len(completadas) * 60 / duracion if duracion else 0.0,
+        "memoria_base_mb": memoria_base / 2**20 if memoria_base else None,
+        "memoria_pico_mb": pico / 2**20 if pico else None,
+        "memoria_por_trabajo_mb": (pico - memoria_base) / 2**20 / concurrentes if pico and memoria_base else None,
+    }
+
+
+def _ms(resumen):
+    return "  ".join(f"{clave} {valor:.0f}" for clave, valor in resumen.items()) or "sin datos"
+
+
+def imprimir_reporte(r):
+    def linea(texto=""):
+        print(texto, file=consola)
+
+    linea(f"Carga: {r['usuarios']} usuarios x {r['rondas']} libros de {r['filas_por_libro']} filas "
+          f"({r['formato']}, {r['tamano_libro_kb']:.0f} KB), modo {r['modo']}, conversión simulada "
+          f"de {r['demora_conversion']} s")
+    linea(f"Duración total: {r['duracion_s']:.1f} s   respuestas: "
+          + ", ".join(f"{estado} x{n}" for estado, n in sorted(r["estados"].items())))
+    linea(f"/procesar (ms):      {_ms(r['procesar_ms'])}")
+    linea(f"/procesar 200 (ms):  {_ms(r['procesar_ok_ms'])}")
+    linea(f"/ durante la carga:  {_ms(r['portada_ms'])}   errores {r['portada_errores']}")
+    linea(f"Rendimiento: {r['filas_por_segundo']:.1f} filas/s, {r['trabajos_por_minuto']:.1f} trabajos/min")
+    if r["memoria_pico_mb"] is not None:
+        linea(f"Memoria residente: base {r['memoria_base_mb']:.0f} MB, pico {r['memoria_pico_mb']:.0f} MB, "
+              f"~{r['memoria_por_trabajo_mb']:.0f} MB por trabajo simultáneo")
+    else:
+        linea("Memoria residente: no se pudo medir (instala psutil)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de /procesar con un conversor simulado")
+    parser.add_argument("--modo", choices=["proceso", "local"], default="proceso",
+                        help="aplicación en este proceso o servidor en 127.0.0.1")
+    parser.add_argument("--usuarios", type=int, default=4, help="subidas simultáneas")
+    parser.add_argument("--rondas", type=int, default=1, help="libros que sube cada usuario, uno tras otro")
+    parser.add_argument("--filas", type=int, default=200, help="filas por libro")
+    parser.add_argument("--formato", choices=["xlsx", "csv"], default="xlsx")
+    parser.add_argument("--demora", type=float, default=0.05, help="segundos por conversión simulada")
+    parser.add_argument("--max-trabajos", type=int, default=None, help="trabajos simultáneos del servidor")
+    parser.add_argument("--espera-admision", type=float, default=None,
+                        help="segundos en cola tras los que un trabajo pasa adelante")
+    parser.add_argument("--hilos", type=int, default=16, help="hilos del servidor en modo local")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--intervalo", type=float, default=0.25, help="segundos entre peticiones a /")
+    parser.add_argument("--json", default=None, help="guardar también el reporte en este archivo")
+    parser.add_argument("--conservar", action="store_true", help="no borrar la carpeta temporal")
+    # Uso interno: el proceso servidor del modo local
+    parser.add_argument("--servir", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--carpeta", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.servir:
+        aplicacion = preparar_app(args.carpeta, args.demora, args.max_trabajos, args.espera_admision)
+        aplicacion.servir_produccion("127.0.0.1", args.port, args.hilos)
+        return
+
+    destino_json = Path(args.json).resolve() if args.json else None
+    origen = os.getcwd()
+    carpeta = Path(tempfile.mkdtemp(prefix="certificados_carga_"))
+    try:
+        reporte = ejecutar_carga(args, carpeta)
+    finally:
+        os.chdir(origen)
+        if args.conservar:
+            print(f"Archivos de la prueba en {carpeta}", file=consola)
+        else:
+            shutil.rmtree(carpeta, ignore_errors=True)
+    imprimir_reporte(reporte)
+    if destino_json:
+        destino_json.write_text(json.dumps(reporte, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
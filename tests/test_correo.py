@@ -0,0 +1,235 @@
+import smtplib
+import tempfile
+import threading
+import unittest
+import socketserver
+from email.message import EmailMessage
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import pandas as pd
+
+from utils.correo import ConfigSMTP, Entrega, PoolSMTP
+from utils.lotes import SubTrabajo
+from utils.motor import ResultadoProceso
+from utils.trabajos import Journal, JournalHoja
+
+
+class PoolFalso:
+    """Pool SMTP que solo guarda los mensajes"""
+
+    def __init__(self):
+        self.config = SimpleNamespace(remitente="certificados@ejemplo.com", conexiones=1)
+        self.conexiones_abiertas = 0
+        self.mensajes = []
+
+    def enviar(self, mensaje):
+        self.mensajes.append(mensaje)
+        return {}
+
+    def cerrar(self):
+        pass
+
+
+class SesionSMTP(socketserver.StreamRequestHandler):
+    """Una conexión al servidor SMTP de prueba (lo justo del protocolo para smtplib)"""
+
+    def responder(self, linea):
+        self.wfile.write(f"{linea}\r\n".encode())
+
+    def handle(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.conexiones += 1
+        self.responder("220 localhost prueba")
+        remitente, destinatarios = None, []
+        for linea in self.rfile:
+            comando = linea.decode().strip()
+            verbo = comando.split(" ", 1)[0].upper()
+            if verbo in ("EHLO", "HELO"):
+                self.responder("250 localhost")
+            elif verbo == "MAIL":
+                with servidor.lock:
+                    respuesta = servidor.respuestas_mail.pop(0) if servidor.respuestas_mail else "250 OK"
+                    servidor.intentos += 1
+                if respuesta.startswith("250"):
+                    remitente, destinatarios = comando, []
+                self.responder(respuesta)
+            elif verbo == "RCPT":
+                direccion = comando.split(":", 1)[1].strip("<> ")
+                if direccion in servidor.rechazados:
+                    self.responder("550 5.1.1 buzón inexistente")
+                else:
+                    destinatarios.append(direccion)
+                    self.responder("250 OK")
+            elif verbo == "DATA":
+                self.responder("354 Fin con <CRLF>.<CRLF>")
+                datos = []
+                for linea in self.rfile:
+                    if linea in (b".\r\n", b".\n"):
+                        break
+                    datos.append(linea)
+                with servidor.lock:
+                    servidor.mensajes.append((remitente, destinatarios, b"".join(datos)))
+                self.responder("250 OK")
+            elif verbo in ("RSET", "NOOP"):
+                self.responder("250 OK")
+            elif verbo == "QUIT":
+                self.responder("221 Adiós")
+                return
+            else:
+                self.responder("502 Comando no implementado")
+
+
+class ServidorSMTP(socketserver.ThreadingTCPServer):
+    """Servidor SMTP en localhost que guarda los mensajes recibidos.
+
+    respuestas_mail son las respuestas a los próximos MAIL FROM (por ejemplo
+    un 451 para simular un error temporal); a las direcciones de rechazados
+    se les responde 550 en el RCPT TO.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SesionSMTP)
+        self.lock = threading.Lock()
+        self.conexiones = 0
+        self.intentos = 0
+        self.mensajes = []
+        self.respuestas_mail = []
+        self.rechazados = set()
+
+
+def mensaje(destinatario):
+    msg = EmailMessage()
+    msg["From"] = "certificados@ejemplo.com"
+    msg["To"] = destinatario
+    msg["Subject"] = "Tu certificado"
+    msg.set_content("Adjuntamos tu certificado.")
+    return msg
+
+
+class ConServidorSMTP(unittest.TestCase):
+    def setUp(self):
+        self.servidor = ServidorSMTP()
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.config = ConfigSMTP("127.0.0.1", self.servidor.server_address[1], seguridad="ninguna",
+                                 remitente="certificados@ejemplo.com", conexiones=1, por_segundo=0,
+                                 reintentos=2, timeout=5.0)
+        # Sin esperas entre reintentos
+        parche = mock.patch("utils.correo.time.sleep")
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def tearDown(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class PoolSMTPTest(ConServidorSMTP):
+    def test_reutiliza_la_conexion(self):
+        pool = PoolSMTP(self.config)
+        for i in range(3):
+            self.assertEqual(pool.enviar(mensaje(f"p{i}@ejemplo.com")), {})
+        pool.cerrar()
+        self.assertEqual(len(self.servidor.mensajes), 3)
+        self.assertEqual(self.servidor.conexiones, 1)
+        self.assertEqual(pool.conexiones_abiertas, 1)
+
+    def test_reintenta_un_error_temporal(self):
+        self.servidor.respuestas_mail = ["451 4.3.0 inténtelo más tarde"]
+        pool = PoolSMTP(self.config)
+        pool.enviar(mensaje("ana@ejemplo.com"))
+        pool.cerrar()
+        self.assertEqual(self.servidor.intentos, 2)
+        self.assertEqual(len(self.servidor.mensajes), 1)
+        # La sesión con error se descarta y el reintento abre otra
+        self.assertEqual(pool.conexiones_abiertas, 2)
+
+    def test_no_reintenta_un_error_permanente(self):
+        self.servidor.rechazados = {"nadie@ejemplo.com"}
+        pool = PoolSMTP(self.config)
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            pool.enviar(mensaje("nadie@ejemplo.com"))
+        pool.cerrar()
+        self.assertEqual(self.servidor.intentos, 1)
+        self.assertEqual(self.servidor.mensajes, [])
+
+
+class EntregaRepetidaTest(unittest.TestCase):
+    def setUp(self):
+        self.carpeta = Path(tempfile.mkdtemp())
+        self.journal = Journal(self.carpeta)
+        self.pdfs = []
+        for i in range(2):
+            pdf = self.carpeta / f"certificado_{i}.pdf"
+            pdf.write_bytes(b"%PDF-1.4\n%%EOF\n")
+            self.pdfs.append(pdf)
+
+    def tearDown(self):
+        self.journal.cerrar()
+
+    def corrida(self):
+        """Una corrida del trabajo "t1" sobre el libro original (certificado = no, envio vacío)"""
+        df = pd.DataFrame({
+            "nombre": ["Ana", "Luis"],
+            "cedula": ["1", "2"],
+            "compañia": ["Acme", "Acme"],
+            "certificado": ["no", "no"],
+            "correo": ["ana@ejemplo.com", "luis@ejemplo.com"],
+        })
+        sub = SubTrabajo(None, "libro.xlsx", "Hoja1", df)
+        sub.resultado = ResultadoProceso(df, self.carpeta)
+        sub.resultado.journal = JournalHoja(self.journal, "t1", "libro.xlsx", "Hoja1")
+        sub.resultado.journal.registrar([0, 1])
+        sub.resultado.generadas = [0, 1]
+        sub.resultado.archivos = dict(enumerate(self.pdfs))
+        return sub
+
+    def test_no_reenvia_al_repetir_el_trabajo(self):
+        pool = PoolFalso()
+        primera = Entrega(pool).enviar([self.corrida()])
+        self.assertEqual(primera["enviados"], 2)
+        self.assertEqual(len(pool.mensajes), 2)
+
+        sub = self.corrida()
+        segunda = Entrega(pool).enviar([sub])
+        self.assertEqual(len(pool.mensajes), 2)
+        self.assertEqual(segunda["enviados"], 0)
+        self.assertEqual(segunda["ya_enviados"], 2)
+        self.assertTrue(sub.resultado.df["envio"].str.startswith("enviado").all())
+
+
+class EntregaSMTPTest(ConServidorSMTP, EntregaRepetidaTest):
+    """La misma repetición del trabajo, enviando por SMTP al servidor de prueba"""
+
+    def setUp(self):
+        ConServidorSMTP.setUp(self)
+        EntregaRepetidaTest.setUp(self)
+
+    def tearDown(self):
+        EntregaRepetidaTest.tearDown(self)
+        ConServidorSMTP.tearDown(self)
+
+    def test_no_reenvia_al_repetir_el_trabajo(self):
+        entrega = Entrega(PoolSMTP(self.config))
+        primera = entrega.enviar([self.corrida()])
+        entrega.cerrar()
+        self.assertEqual(primera["enviados"], 2)
+        self.assertEqual(sorted(d for _, destinatarios, _ in self.servidor.mensajes for d in destinatarios),
+                         ["ana@ejemplo.com", "luis@ejemplo.com"])
+
+        entrega = Entrega(PoolSMTP(self.config))
+        segunda = entrega.enviar([self.corrida()])
+        entrega.cerrar()
+        self.assertEqual(segunda["ya_enviados"], 2)
+        self.assertEqual(len(self.servidor.mensajes), 2)
+        envios = self.journal.envios("t1", "libro.xlsx", "Hoja1")
+        self.assertTrue(all(estado.startswith("enviado") for estado in envios.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
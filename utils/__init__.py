@@ -0,0 +1,44 @@
+"""Motor de generación de certificados, independiente de la interfaz web."""
+
+from .backends import (
+    TemplateBackend,
+    DocxBackend,
+    PptxBackend,
+    PlantillaCargada,
+    BACKENDS,
+    backend_for,
+    cargar_plantilla,
+    register_backend,
+)
+from .motor import (
+    ColumnasFaltantesError,
+    ResultadoProceso,
+    build_context,
+    get_plantilla_path,
+    guardar_excel,
+    guardar_libro,
+    leer_excel,
+    normalizar_columnas,
+    preparar_trabajo,
+    ejecutar_tarea,
+    procesar_dataframe,
+    resolver_plantillas,
+)
+from .columnas import normalizar_encabezado, resolver_columnas, recargar_alias
+from .escritura import EscritorEstado
+from .formatos import FORMATOS_TABLA, leer_tabla, guardar_tabla, detectar_csv
+from .lotes import SubTrabajo, leer_hojas, validar_subtrabajos, procesar_lote, plantillas_del_lote
+from .distribuido import ColaTrabajo, Trabajador, abrir_cola, procesar_distribuido, ejecutar_trabajador
+from .trabajos import Journal, JournalHoja, abrir_journal, id_trabajo
+from .emisiones import IndiceEmisiones, abrir_indice
+from .correo import ConfigSMTP, PoolSMTP, Entrega, cargar_contactos, entrega_por_defecto
+from .pipeline import Pipeline, Etapa
+from .planificador import Admision, Planificador, planificador
+from .salidas import PlanSalidas, sanitizar, carpeta_en_curso, publicar
+from .plantillas import RegistroPlantillas, registro
+from .compactacion import CompactadorPDF, compactador, pdf_valido
+from .conversor import OrquestadorConversion, orquestador
+from .lienzo import RenderizadorPDF, renderizador
+from .vista_previa import VistaPrevia, planificar, primeras_pendientes
+from .validacion import validar_dataframe, filas_invalidas, pendientes_mask
+from .rutas import ON_WINDOWS, resource_path, get_downloads_folder, get_config_folder, open_folder
@@ -0,0 +1,175 @@
+import io
+import os
+import re
+import subprocess
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from .compactacion import pdf_valido
+from .conversor import orquestador
+from .rutas import ON_WINDOWS, perfil_libreoffice
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_RE = re.compile(r"\{\{\s*([^{}\s]+)\s*\}\}")
+
+
+class PlantillaCargada:
+    """Plantilla leída una sola vez al inicio del trabajo y mantenida en memoria"""
+
+    def __init__(self, path, datos, backend, mtime=None):
+        self.path = str(path)
+        self.datos = datos
+        self.backend = backend
+        self.mtime = mtime
+        self.cargada_en = datetime.now()
+        self.placeholders = backend.placeholders(self)
+
+    @property
+    def nombre(self):
+        return Path(self.path).name
+
+    def abrir(self):
+        """Flujo en memoria con el contenido original de la plantilla"""
+        return io.BytesIO(self.datos)
+
+    def render(self, contexto, out_path):
+        self.backend.render(self, contexto, out_path)
+
+
+class TemplateBackend:
+    """Interfaz común para los tipos de plantilla (docx, pptx, pdf directo)"""
+
+    extension = ""
+    nombre = ""
+
+    def load(self, plantilla_path):
+        """Leer la plantilla del disco una sola vez"""
+        with open(plantilla_path, "rb") as f:
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+            return PlantillaCargada(plantilla_path, f.read(), self, mtime)
+
+    def placeholders(self, plantilla):
+        """Variables {{ }} que usa la plantilla"""
+        return []
+
+    def render(self, plantilla, contexto, out_path):
+        """Renderizar la plantilla cargada con el contexto y guardarla en out_path"""
+        raise NotImplementedError
+
+    def convert(self, doc_path, pdf_path):
+        """Convertir el documento renderizado a PDF. Devuelve True si hubo éxito"""
+        raise NotImplementedError
+
+
+class DocxBackend(TemplateBackend):
+    """Plantillas Word renderizadas con docxtpl"""
+
+    extension = ".docx"
+    nombre = "docx"
+
+    def render(self, plantilla, contexto, out_path):
+        from docxtpl import DocxTemplate
+
+        documento = DocxTemplate(plantilla.abrir())
+        documento.render(contexto)
+        documento.save(str(out_path))
+
+    def placeholders(self, plantilla):
+        try:
+            from docxtpl import DocxTemplate
+
+            return sorted(DocxTemplate(plantilla.abrir()).get_undeclared_template_variables())
+        except Exception as e:
+            logger.error(f"No se pudieron leer las variables de {plantilla.path}: {e}")
+            return []
+
+    def convert(self, doc_path, pdf_path):
+        if ON_WINDOWS:
+            try:
+                from docx2pdf import convert  # solo en Windows
+                convert(str(doc_path), str(pdf_path))
+                logger.info(f"Certificado PDF creado: {pdf_path}")
+                return True
+            except Exception as e:
+                logger.error(f"Error convirtiendo a PDF: {e}")
+                return False
+
+        # LibreOffice (Linux/Mac), lanzado desde el orquestador: con límite de
+        # procesos y tiempo máximo
+        try:
+            orquestador().ejecutar([
+                "soffice", perfil_libreoffice(), "--headless", "--convert-to", "pdf",
+                "--outdir", str(Path(pdf_path).parent), str(doc_path)
+            ], check=True)
+            if pdf_valido(pdf_path):
+                return True
+            logger.error(f"PDF creado pero parece inválido: {pdf_path}")
+            return False
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            logger.error(f"Error con LibreOffice: {e}")
+            return False
+
+
+class PptxBackend(TemplateBackend):
+    """Plantillas PowerPoint renderizadas con python-pptx"""
+
+    extension = ".pptx"
+    nombre = "pptx"
+
+    def render(self, plantilla, contexto, out_path):
+        from .pptx_conversion import render_pptx_template
+
+        render_pptx_template(plantilla.abrir(), contexto, str(out_path))
+
+    def placeholders(self, plantilla):
+        try:
+            from pptx import Presentation
+
+            encontrados = set()
+            for slide in Presentation(plantilla.abrir()).slides:
+                for shape in slide.shapes:
+                    if shape.has_text_frame:
+                        encontrados.update(PLACEHOLDER_RE.findall(shape.text_frame.text))
+            return sorted(encontrados)
+        except Exception as e:
+            logger.error(f"No se pudieron leer las variables de {plantilla.path}: {e}")
+            return []
+
+    def convert(self, doc_path, pdf_path):
+        from .pptx_conversion import convert_pptx_to_pdf_ultimate
+
+        if not convert_pptx_to_pdf_ultimate(str(doc_path), str(pdf_path)):
+            return False
+        if pdf_valido(pdf_path):
+            return True
+        logger.error(f"PDF creado pero parece inválido: {pdf_path}")
+        return False
+
+
+# Backends disponibles por extensión de plantilla. Un backend de PDF directo
+# solo necesita registrarse aquí para quedar disponible en todo el motor.
+BACKENDS = {
+    DocxBackend.extension: DocxBackend,
+    PptxBackend.extension: PptxBackend,
+}
+
+
+def register_backend(backend_cls):
+    BACKENDS[backend_cls.extension] = backend_cls
+    return backend_cls
+
+
+def backend_for(plantilla_path):
+    """Obtener el backend adecuado según la extensión de la plantilla"""
+    extension = Path(plantilla_path).suffix.lower()
+    try:
+        return BACKENDS[extension]()
+    except KeyError:
+        raise ValueError(f"Tipo de plantilla no soportado: {extension}")
+
+
+def cargar_plantilla(plantilla_path):
+    """Leer una plantilla con el backend que corresponde a su extensión"""
+    return backend_for(plantilla_path).load(plantilla_path)
@@ -0,0 +1,113 @@
+import os
+import re
+import json
+import logging
+import unicodedata
+from pathlib import Path
+
+from .rutas import resource_path
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_REQUERIDAS = ['item', 'nombre', 'cedula', 'fecha', 'compañia', 'certificado', 'horas', 'id_formacion']
+COLUMNAS_OPCIONALES = ['plantilla', 'correo', 'envio']
+
+# Alias aceptados por columna; mayúsculas, tildes y espacios no importan
+ALIAS_POR_DEFECTO = {
+    'item': ['item', 'ítem'],
+    'nombre': ['nombre', 'nombres', 'nombre completo'],
+    'cedula': ['cedula', 'cédula', 'documento', 'numero documento'],
+    'fecha': ['fecha'],
+    'compañia': ['compañia', 'compañía', 'compania', 'empresa'],
+    'certificado': ['certificado'],
+    'horas': ['horas'],
+    'id_formacion': ['id_formacion', 'id formación', 'id_formación'],
+    'plantilla': ['plantilla'],
+    'correo': ['correo', 'email', 'e-mail', 'correo electronico', 'mail'],
+    'envio': ['envio', 'estado envio', 'estado correo'],
+}
+
+# Archivo JSON opcional con alias adicionales: {"nombre": ["participante"], ...}
+ARCHIVO_ALIAS = "columnas.json"
+
+
+def normalizar_encabezado(texto):
+    """'  Cédula_ Participante ' -> 'cedula participante'"""
+    texto = unicodedata.normalize("NFKD", str(texto).casefold())
+    # La ñ se conserva: 'compañia' y 'compania' se declaran por separado
+    texto = "".join(c for c in texto if not unicodedata.combining(c) or c == "\u0303")
+    texto = unicodedata.normalize("NFC", texto)
+    return re.sub(r"[\s_\-]+", " ", texto).strip()
+
+
+def _construir_indice(alias):
+    indice = {}
+    for standard_name, variantes in alias.items():
+        for variante in [standard_name, *variantes]:
+            indice[normalizar_encabezado(variante)] = standard_name
+    return indice
+
+
+def cargar_alias(path):
+    """Leer un archivo JSON de alias adicionales"""
+    with open(path, encoding="utf-8") as f:
+        extra = json.load(f)
+    return {str(k): [str(v) for v in vs] for k, vs in extra.items()}
+
+
+def archivos_alias():
+    candidatos = [os.environ.get("CERTIFICADOS_ALIAS"), resource_path(ARCHIVO_ALIAS), Path.cwd() / ARCHIVO_ALIAS]
+    vistos = set()
+    for path in candidatos:
+        if path and os.path.exists(path) and os.path.abspath(path) not in vistos:
+            vistos.add(os.path.abspath(path))
+            yield path
+
+
+def indice_por_defecto():
+    alias = {k: list(v) for k, v in ALIAS_POR_DEFECTO.items()}
+    for path in archivos_alias():
+        try:
+            for standard_name, variantes in cargar_alias(path).items():
+                alias.setdefault(standard_name, []).extend(variantes)
+            logger.info(f"Alias de columnas cargados desde: {path}")
+        except Exception as e:
+            logger.error(f"Error leyendo alias de columnas {path}: {e}")
+    return _construir_indice(alias)
+
+
+# Índice alias normalizado -> nombre estándar, construido una sola vez
+INDICE = indice_por_defecto()
+
+
+def recargar_alias():
+    global INDICE
+    INDICE = indice_por_defecto()
+    return INDICE
+
+
+def resolver_columnas(columnas, indice=None):
+    """Mapear los encabezados de una hoja a nombres estándar en una sola pasada.
+
+    Devuelve el mapeo {encabezado original: nombre estándar}; si dos
+    encabezados corresponden a la misma columna se usa el primero.
+    """
+    indice = INDICE if indice is None else indice
+    mapping = {}
+    usados = set()
+    for columna in columnas:
+        standard_name = indice.get(normalizar_encabezado(columna))
+        if standard_name and standard_name not in usados:
+            mapping[columna] = standard_name
+            usados.add(standard_name)
+    return mapping
+
+
+def faltantes(mapping):
+    encontradas = set(mapping.values())
+    return [c for c in COLUMNAS_REQUERIDAS if c not in encontradas]
+
+
+def columna_necesaria(columna):
+    """Filtro para usecols de pandas: solo se leen las columnas reconocidas"""
+    return normalizar_encabezado(columna) in INDICE
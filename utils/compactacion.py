@@ -0,0 +1,210 @@
+import io
+import os
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+from pathlib import Path
+
+from .conversor import orquestador
+from .rutas import ON_WINDOWS
+
+logger = logging.getLogger(__name__)
+
+
+def pdf_valido(path):
+    """Comprobación estructural de un PDF en lugar de un tamaño mínimo.
+
+    Exige el encabezado %PDF-, el marcador %%EOF al final y, si pikepdf está
+    instalado, que el archivo se pueda abrir y tenga al menos una página.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return False
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 2048))
+            if b"%%EOF" not in f.read():
+                return False
+    except OSError:
+        return False
+
+    try:
+        import pikepdf
+    except ImportError:
+        return True
+    try:
+        with pikepdf.open(path) as pdf:
+            return len(pdf.pages) > 0
+    except Exception:
+        return False
+
+
+def compactacion_activada():
+    return os.environ.get("CERTIFICADOS_COMPACTAR", "").lower() in ("1", "true", "si", "sí")
+
+
+def _ghostscript():
+    for nombre in (["gswin64c", "gswin32c"] if ON_WINDOWS else []) + ["gs"]:
+        ruta = shutil.which(nombre)
+        if ruta:
+            return ruta
+    return None
+
+
+class CompactadorPDF:
+    """Post-proceso opcional de los PDF generados.
+
+    - Ghostscript (si está instalado): subconjunto de fuentes, imágenes
+      duplicadas detectadas y submuestreadas.
+    - pikepdf (si está instalado): imágenes repetidas dentro del PDF unificadas,
+      imágenes demasiado grandes reducidas y salida linealizada.
+
+    Todos los certificados de una plantilla traen las mismas imágenes, así que
+    cada imagen reducida se guarda en memoria por su contenido y se reutiliza
+    en los demás archivos sin volver a decodificarla.
+    """
+
+    def __init__(self, max_lado=2400, calidad_jpeg=85, dpi=200):
+        self.max_lado = max_lado
+        self.calidad_jpeg = calidad_jpeg
+        self.dpi = dpi
+        self.ghostscript = _ghostscript()
+        self._reducidas = {}
+        self._lock = threading.Lock()
+        try:
+            import pikepdf  # noqa: F401
+            self.pikepdf = True
+        except ImportError:
+            self.pikepdf = False
+        if not self.ghostscript and not self.pikepdf:
+            logger.warning("Compactación de PDF desactivada: instala pikepdf o Ghostscript")
+
+    def _con_ghostscript(self, origen, destino):
+        try:
+            orquestador().ejecutar([
+                self.ghostscript, "-sDEVICE=pdfwrite", "-dNOPAUSE", "-dBATCH", "-dQUIET", "-dSAFER",
+                "-dSubsetFonts=true", "-dCompressFonts=true", "-dDetectDuplicateImages=true",
+                "-dDownsampleColorImages=true", f"-dColorImageResolution={self.dpi}",
+                "-dDownsampleGrayImages=true", f"-dGrayImageResolution={self.dpi}",
+                f"-sOutputFile={destino}", str(origen),
+            ], check=True, timeout=120)
+            return True
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            logger.error(f"Error compactando con Ghostscript: {e}")
+            return False
+
+    def _reducir(self, imagen):
+        """(datos, filtro, ancho, alto, espacio de color) de la versión reducida de una imagen, o None"""
+        import pikepdf
+        from pikepdf import Name
+        from PIL import Image
+
+        if imagen.get("/SMask") is not None or imagen.get("/Mask") is not None:
+            return None
+        ancho, alto = int(imagen.Width), int(imagen.Height)
+        if max(ancho, alto) <= self.max_lado:
+            return None
+
+        clave = hashlib.sha1(imagen.read_raw_bytes()).hexdigest()
+        with self._lock:
+            if clave in self._reducidas:
+                return self._reducidas[clave]
+
+        reducida = None
+        try:
+            pil = pikepdf.PdfImage(imagen).as_pil_image()
+            if pil.mode in ("RGB", "L"):
+                pil.thumbnail((self.max_lado, self.max_lado), Image.LANCZOS)
+                salida = io.BytesIO()
+                pil.save(salida, format="JPEG", quality=self.calidad_jpeg, optimize=True)
+                color = Name.DeviceRGB if pil.mode == "RGB" else Name.DeviceGray
+                reducida = (salida.getvalue(), Name.DCTDecode, pil.width, pil.height, color)
+        except Exception as e:
+            logger.debug(f"Imagen no reducida: {e}")
+        with self._lock:
+            self._reducidas[clave] = reducida
+        return reducida
+
+    def _con_pikepdf(self, origen, destino):
+        import pikepdf
+        from pikepdf import Name
+
+        with pikepdf.open(origen) as pdf:
+            vistas = {}
+            for pagina in pdf.pages:
+                recursos = pagina.obj.get("/Resources")
+                xobjects = recursos.get("/XObject") if recursos is not None else None
+                if xobjects is None:
+                    continue
+                for nombre in list(xobjects.keys()):
+                    imagen = xobjects[nombre]
+                    if imagen.get("/Subtype") != Name.Image:
+                        continue
+                    # La misma imagen repetida en el archivo se guarda una sola vez
+                    clave = hashlib.sha1(imagen.read_raw_bytes()).hexdigest()
+                    if clave in vistas and vistas[clave].objgen != imagen.objgen:
+                        xobjects[nombre] = vistas[clave]
+                        continue
+                    vistas[clave] = imagen
+
+                    reducida = self._reducir(imagen)
+                    if reducida is not None:
+                        datos, filtro, ancho, alto, color = reducida
+                        imagen.write(datos, filter=filtro)
+                        imagen.Width, imagen.Height = ancho, alto
+                        imagen.BitsPerComponent = 8
+                        imagen.ColorSpace = color
+                        if "/DecodeParms" in imagen:
+                            del imagen["/DecodeParms"]
+            pdf.remove_unreferenced_resources()
+            pdf.save(destino, linearize=True, compress_streams=True,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        return True
+
+    def compactar(self, path):
+        """Compactar un PDF en sitio. Devuelve (bytes antes, bytes después).
+
+        El resultado solo reemplaza al original si es un PDF válido y más pequeño.
+        """
+        path = Path(path)
+        antes = path.stat().st_size
+        actual = path
+        temporales = []
+        try:
+            if self.ghostscript:
+                temporal = path.with_name(f".{path.stem}.gs.pdf")
+                temporales.append(temporal)
+                if self._con_ghostscript(actual, temporal) and pdf_valido(temporal):
+                    actual = temporal
+            if self.pikepdf:
+                temporal = path.with_name(f".{path.stem}.min.pdf")
+                temporales.append(temporal)
+                try:
+                    self._con_pikepdf(actual, temporal)
+                    if pdf_valido(temporal):
+                        actual = temporal
+                except Exception as e:
+                    logger.error(f"Error compactando {path.name}: {e}")
+
+            if actual != path and actual.stat().st_size < antes:
+                os.replace(actual, path)
+        finally:
+            for temporal in temporales:
+                if temporal.exists():
+                    temporal.unlink()
+        return antes, path.stat().st_size
+
+
+_compactador = None
+_compactador_lock = threading.Lock()
+
+
+def compactador():
+    """Compactador compartido por todos los hilos (con su caché de imágenes)"""
+    global _compactador
+    with _compactador_lock:
+        if _compactador is None:
+            _compactador = CompactadorPDF()
+        return _compactador
@@ -0,0 +1,144 @@
+import os
+import signal
+import asyncio
+import logging
+import threading
+import subprocess
+
+from .entorno import entero_env, real_env
+from .rutas import ON_WINDOWS
+
+logger = logging.getLogger(__name__)
+
+
+def limite_por_defecto():
+    """Procesos externos simultáneos en todo el proceso (todos los trabajos juntos)"""
+    return entero_env("CERTIFICADOS_CONVERSORES", max(2, os.cpu_count() or 1))
+
+
+def timeout_por_defecto():
+    return real_env("CERTIFICADOS_TIMEOUT_CONVERSION", 120.0)
+
+
+class OrquestadorConversion:
+    """Procesos externos (LibreOffice, Ghostscript, pdftoppm) lanzados desde un solo event loop.
+
+    El loop corre en un hilo propio y usa asyncio.create_subprocess_exec, de
+    modo que los procesos en curso no ocupan un hilo cada uno. Un semáforo
+    limita cuántos corren a la vez; cada uno tiene un tiempo máximo y, si
+    se agota o se cancela su futuro, el proceso (y sus hijos) se termina.
+
+    ejecutar() es la fachada síncrona, con la misma semántica que
+    subprocess.run(capture_output=True): el código que ya llamaba a
+    subprocess.run sigue igual, pero espera sin bloquear el loop.
+    """
+
+    def __init__(self, limite=None, timeout=None):
+        self.limite = limite or limite_por_defecto()
+        self.timeout = timeout or timeout_por_defecto()
+        self.en_curso = 0
+        self.maximo_en_curso = 0
+        self._listo = threading.Event()
+        self._hilo = threading.Thread(target=self._correr_loop, name="orquestador-conversion", daemon=True)
+        self._hilo.start()
+        self._listo.wait()
+
+    def _correr_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._semaforo = asyncio.Semaphore(self.limite)
+        self._listo.set()
+        self.loop.run_forever()
+
+    @staticmethod
+    def _matar(proceso):
+        """Terminar el proceso y sus hijos (soffice lanza soffice.bin)"""
+        try:
+            if ON_WINDOWS:
+                proceso.kill()
+            else:
+                os.killpg(proceso.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    async def correr(self, cmd, timeout=None):
+        """Ejecutar un comando; devuelve subprocess.CompletedProcess o lanza subprocess.TimeoutExpired"""
+        timeout = timeout or self.timeout
+        cmd = [str(parte) for parte in cmd]
+        async with self._semaforo:
+            self.en_curso += 1
+            self.maximo_en_curso = max(self.maximo_en_curso, self.en_curso)
+            try:
+                proceso = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    # Grupo propio, para poder terminar también los procesos hijos
+                    start_new_session=not ON_WINDOWS,
+                )
+                try:
+                    salida, errores = await asyncio.wait_for(proceso.communicate(), timeout)
+                except asyncio.TimeoutError:
+                    self._matar(proceso)
+                    await proceso.wait()
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                except asyncio.CancelledError:
+                    self._matar(proceso)
+                    await proceso.wait()
+                    raise
+                return subprocess.CompletedProcess(cmd, proceso.returncode, salida, errores)
+            finally:
+                self.en_curso -= 1
+
+    def enviar(self, cmd, timeout=None):
+        """Lanzar un comando sin esperarlo; devuelve un concurrent.futures.Future cancelable"""
+        return asyncio.run_coroutine_threadsafe(self.correr(cmd, timeout), self.loop)
+
+    def ejecutar(self, cmd, check=False, timeout=None):
+        """Fachada síncrona: como subprocess.run(cmd, capture_output=True, check=check, timeout=timeout)"""
+        if threading.current_thread() is self._hilo:
+            raise RuntimeError("ejecutar() no puede llamarse desde el loop del orquestador; usa correr()")
+        futuro = self.enviar(cmd, timeout)
+        try:
+            resultado = futuro.result()
+        except BaseException:
+            # Por ejemplo KeyboardInterrupt: no dejar el proceso corriendo
+            futuro.cancel()
+            raise
+        if check and resultado.returncode != 0:
+            raise subprocess.CalledProcessError(resultado.returncode, resultado.args,
+                                                resultado.stdout, resultado.stderr)
+        return resultado
+
+    def ejecutar_varios(self, comandos, timeout=None):
+        """Ejecutar muchos comandos a la vez (hasta el límite) y esperarlos todos.
+
+        Devuelve, en el mismo orden, un CompletedProcess o la excepción de cada uno.
+        """
+        async def todos():
+            return await asyncio.gather(*(self.correr(cmd, timeout) for cmd in comandos),
+                                        return_exceptions=True)
+        return asyncio.run_coroutine_threadsafe(todos(), self.loop).result()
+
+    def cancelar(self):
+        """Cancelar todos los procesos en curso (se terminan) y los que esperan turno"""
+        def cancelar_tareas():
+            for tarea in asyncio.all_tasks(self.loop):
+                tarea.cancel()
+        self.loop.call_soon_threadsafe(cancelar_tareas)
+
+    def cerrar(self):
+        self.cancelar()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._hilo.join(timeout=5)
+
+
+_orquestador = None
+_orquestador_lock = threading.Lock()
+
+
+def orquestador():
+    """Orquestador compartido: el límite de procesos vale para todos los trabajos a la vez"""
+    global _orquestador
+    with _orquestador_lock:
+        if _orquestador is None:
+            _orquestador = OrquestadorConversion()
+        return _orquestador
@@ -0,0 +1,437 @@
+import os
+import re
+import ssl
+import json
+import time
+import queue
+import random
+import smtplib
+import logging
+import threading
+from pathlib import Path
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.message import EmailMessage
+from email.utils import make_msgid
+
+import pandas as pd
+
+from .columnas import normalizar_encabezado, resolver_columnas
+from .entorno import entero_env, real_env
+from .rutas import resource_path
+
+logger = logging.getLogger(__name__)
+
+# Archivo opcional con los correos de contacto por compañía: {"Empresa S.A.": ["rrhh@empresa.com"]}
+ARCHIVO_CONTACTOS = "contactos.json"
+
+# Estados de la columna envio
+ENVIADO = "enviado"
+SIN_DESTINATARIO = "sin destinatario"
+
+_CORREO_VALIDO = re.compile(r"[^@\s;,]+@[^@\s;,]+\.[^@\s;,]+")
+
+
+class ConfigSMTP:
+    """Servidor de correo y límites del envío.
+
+    seguridad es "starttls", "ssl" o "ninguna"; por defecto se elige según
+    el puerto (587 -> starttls, 465 -> ssl, otro -> ninguna, como un servidor
+    de pruebas local).
+    """
+
+    def __init__(self, host, puerto=587, usuario=None, clave=None, seguridad=None, remitente=None,
+                 conexiones=3, por_segundo=5.0, reintentos=3, timeout=30.0):
+        self.host = host
+        self.puerto = int(puerto)
+        self.usuario = usuario or None
+        self.clave = clave
+        self.seguridad = seguridad or {587: "starttls", 465: "ssl"}.get(self.puerto, "ninguna")
+        self.remitente = remitente or usuario
+        self.conexiones = max(1, int(conexiones))
+        self.por_segundo = por_segundo
+        self.reintentos = max(0, int(reintentos))
+        self.timeout = timeout
+        if not self.remitente:
+            raise ValueError("Falta el remitente del correo (CERTIFICADOS_SMTP_REMITENTE)")
+
+    @classmethod
+    def desde_entorno(cls):
+        """Configuración de las variables CERTIFICADOS_SMTP_*, o None si no hay servidor"""
+        host = os.environ.get("CERTIFICADOS_SMTP_HOST")
+        if not host:
+            return None
+        return cls(
+            host,
+            puerto=entero_env("CERTIFICADOS_SMTP_PUERTO", 587),
+            usuario=os.environ.get("CERTIFICADOS_SMTP_USUARIO"),
+            clave=os.environ.get("CERTIFICADOS_SMTP_CLAVE"),
+            seguridad=os.environ.get("CERTIFICADOS_SMTP_SEGURIDAD"),
+            remitente=os.environ.get("CERTIFICADOS_SMTP_REMITENTE"),
+            conexiones=entero_env("CERTIFICADOS_SMTP_CONEXIONES", 3),
+            por_segundo=real_env("CERTIFICADOS_SMTP_POR_SEGUNDO", 5.0),
+            reintentos=entero_env("CERTIFICADOS_SMTP_REINTENTOS", 3, minimo=0),
+        )
+
+
+class LimiteTasa:
+    """Reparte los turnos de envío para no pasar de por_segundo mensajes por segundo"""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo and por_segundo > 0 else 0.0
+        self._siguiente = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(self._siguiente, ahora)
+            self._siguiente = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def es_transitorio(error):
+    """¿Vale la pena reintentar? Desconexiones, red y respuestas 4xx del servidor"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= codigo < 500 for codigo, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    # Errores de red: conexión rechazada, timeout, etc.
+    return isinstance(error, OSError)
+
+
+class PoolSMTP:
+    """Conexiones SMTP reutilizables compartidas entre hilos.
+
+    Nunca hay más de config.conexiones conexiones abiertas; cada envío toma
+    una libre (o abre una nueva), respeta el límite de mensajes por segundo
+    y se reintenta con espera exponencial si el error es transitorio.
+    """
+
+    # Una conexión que lleva más de esto sin usarse se comprueba con NOOP antes de reutilizarla
+    MAX_INACTIVA = 30.0
+
+    def __init__(self, config):
+        self.config = config
+        self.limite = LimiteTasa(config.por_segundo)
+        self._libres = queue.LifoQueue()
+        self._turnos = threading.BoundedSemaphore(config.conexiones)
+        self._lock = threading.Lock()
+        # Conexiones abiertas desde que se creó el pool (para ver cuánto se reutilizan)
+        self.conexiones_abiertas = 0
+
+    def _conectar(self):
+        config = self.config
+        if config.seguridad == "ssl":
+            smtp = smtplib.SMTP_SSL(config.host, config.puerto, timeout=config.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(config.host, config.puerto, timeout=config.timeout)
+            if config.seguridad == "starttls":
+                smtp.starttls(context=ssl.create_default_context())
+        if config.usuario:
+            smtp.login(config.usuario, config.clave or "")
+        with self._lock:
+            self.conexiones_abiertas += 1
+        return smtp
+
+    def _tomar(self):
+        while True:
+            try:
+                smtp, ultimo_uso = self._libres.get_nowait()
+            except queue.Empty:
+                return self._conectar()
+            if time.monotonic() - ultimo_uso < self.MAX_INACTIVA:
+                return smtp
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except smtplib.SMTPException:
+                pass
+            self._descartar(smtp)
+
+    @staticmethod
+    def _descartar(smtp):
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    @contextmanager
+    def conexion(self):
+        with self._turnos:
+            smtp = self._tomar()
+            try:
+                yield smtp
+            except BaseException:
+                # El estado de la sesión es incierto después de un error
+                self._descartar(smtp)
+                raise
+            self._libres.put((smtp, time.monotonic()))
+
+    def enviar(self, mensaje):
+        """Enviar un mensaje; devuelve los destinatarios rechazados {correo: (código, texto)}"""
+        intento = 0
+        while True:
+            self.limite.esperar()
+            try:
+                with self.conexion() as smtp:
+                    return smtp.send_message(mensaje)
+            except Exception as e:
+                intento += 1
+                if intento > self.config.reintentos or not es_transitorio(e):
+                    raise
+                espera = min(30.0, 2 ** (intento - 1)) * random.uniform(0.5, 1.5)
+                logger.warning(f"Error enviando a {mensaje['To']} ({e}); reintento {intento} en {espera:.1f} s")
+                time.sleep(espera)
+
+    def cerrar(self):
+        while True:
+            try:
+                smtp, _ = self._libres.get_nowait()
+            except queue.Empty:
+                return
+            self._descartar(smtp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def separar_correos(texto):
+    """"a@x.com; b@y.com" -> (["a@x.com", "b@y.com"], inválidos)"""
+    if texto is None or pd.isna(texto):
+        return [], []
+    partes = [p for p in re.split(r"[;,\s]+", str(texto).strip()) if p]
+    validos = [p for p in partes if _CORREO_VALIDO.fullmatch(p)]
+    return validos, [p for p in partes if p not in validos]
+
+
+def cargar_contactos(path):
+    """Leer los correos por compañía de un JSON ({compañía: correo o [correos]}) o de un CSV
+    con columnas compañía y correo. Las claves quedan normalizadas como los encabezados."""
+    path = Path(path)
+    contactos = defaultdict(list)
+    if path.suffix.lower() == ".csv":
+        df = pd.read_csv(path, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+        df = df.rename(columns=resolver_columnas(df.columns))
+        pares = zip(df["compañia"], df["correo"])
+    else:
+        with open(path, encoding="utf-8") as f:
+            pares = json.load(f).items()
+    for compania, correos in pares:
+        if isinstance(correos, (list, tuple)):
+            correos = ";".join(map(str, correos))
+        validos, invalidos = separar_correos(correos)
+        if invalidos:
+            logger.warning(f"Contactos de {compania}: correos inválidos {invalidos}")
+        contactos[normalizar_encabezado(compania)].extend(validos)
+    return dict(contactos)
+
+
+def contactos_por_defecto():
+    """Contactos de CERTIFICADOS_CONTACTOS, o de contactos.json junto al ejecutable o en el directorio de trabajo"""
+    for path in (os.environ.get("CERTIFICADOS_CONTACTOS"), resource_path(ARCHIVO_CONTACTOS),
+                 Path.cwd() / ARCHIVO_CONTACTOS):
+        if path and os.path.exists(path):
+            try:
+                contactos = cargar_contactos(path)
+                logger.info(f"Contactos por compañía cargados desde: {path} ({len(contactos)} compañías)")
+                return contactos
+            except Exception as e:
+                logger.error(f"Error leyendo contactos {path}: {e}")
+    return {}
+
+
+class Envio:
+    """Un mensaje por enviar y las filas cuyo estado depende de él"""
+
+    def __init__(self, destinatarios, adjuntos, filas, asunto, cuerpo):
+        self.destinatarios = destinatarios
+        self.adjuntos = adjuntos
+        self.filas = filas  # [(subtrabajo, index)]
+        self.asunto = asunto
+        self.cuerpo = cuerpo
+
+    def mensaje(self, remitente):
+        mensaje = EmailMessage()
+        mensaje["From"] = remitente
+        mensaje["To"] = ", ".join(self.destinatarios)
+        mensaje["Subject"] = self.asunto
+        mensaje["Message-ID"] = make_msgid(domain=remitente.rpartition("@")[2] or None)
+        mensaje.set_content(self.cuerpo)
+        for adjunto in self.adjuntos:
+            mensaje.add_attachment(Path(adjunto).read_bytes(), maintype="application", subtype="pdf",
+                                   filename=Path(adjunto).name)
+        return mensaje
+
+
+class Entrega:
+    """Envío por correo de los certificados generados en un trabajo.
+
+    Cada fila con la columna correo recibe su certificado; las demás se
+    agrupan por compañía y se envían a los contactos de la compañía (un
+    mensaje por compañía, partido si los adjuntos pasan de max_adjuntos
+    bytes). El estado de cada fila queda en la columna envio y, si el
+    trabajo tiene journal, también en el journal: las filas ya enviadas en
+    una corrida anterior del mismo trabajo (al reanudarlo o al volver a subir
+    el mismo libro) no se vuelven a enviar.
+    """
+
+    ASUNTO_PARTICIPANTE = "Tu certificado - {nombre}"
+    CUERPO_PARTICIPANTE = "Hola {nombre},\n\nAdjuntamos tu certificado.\n\nSaludos."
+    ASUNTO_COMPANIA = "Certificados - {compania}"
+    CUERPO_COMPANIA = "Adjuntamos {n} certificados de {compania}:\n\n{lista}\n\nSaludos."
+
+    def __init__(self, pool, contactos=None, max_adjuntos=15 * 1024 * 1024):
+        self.pool = pool
+        self.contactos = contactos or {}
+        self.max_adjuntos = max_adjuntos
+
+    def _planificar(self, subtrabajos):
+        """(envíos, estados inmediatos {(sub, index): estado}, ya enviados {(sub, index): estado})"""
+        envios, estados, enviados = [], {}, {}
+        por_compania = defaultdict(list)
+        for sub in subtrabajos:
+            resultado = sub.resultado
+            if "envio" not in resultado.df.columns:
+                resultado.df["envio"] = None
+            resultado.df["envio"] = resultado.df["envio"].astype(object)
+            previos = resultado.journal.envios() if resultado.journal is not None else {}
+            for index in resultado.generadas:
+                archivo = resultado.archivos.get(index)
+                row = resultado.df.loc[index]
+                previo = previos.get(int(index), row["envio"])
+                if isinstance(previo, str) and previo.startswith(ENVIADO):
+                    enviados[(sub, index)] = previo
+                    continue
+                if archivo is None or Path(archivo).suffix.lower() != ".pdf":
+                    estados[(sub, index)] = "error: no hay PDF para enviar"
+                    continue
+
+                correos, invalidos = separar_correos(row.get("correo"))
+                if invalidos:
+                    estados[(sub, index)] = f"error: correo inválido {', '.join(invalidos)}"
+                elif correos:
+                    nombre = str(row["nombre"]).strip()
+                    envios.append(Envio(correos, [archivo], [(sub, index)],
+                                        self.ASUNTO_PARTICIPANTE.format(nombre=nombre),
+                                        self.CUERPO_PARTICIPANTE.format(nombre=nombre)))
+                elif self.contactos.get(normalizar_encabezado(row["compañia"])):
+                    por_compania[str(row["compañia"]).strip()].append((sub, index, Path(archivo)))
+                else:
+                    estados[(sub, index)] = SIN_DESTINATARIO
+
+        for compania, filas in por_compania.items():
+            destinatarios = self.contactos[normalizar_encabezado(compania)]
+            partes, actual, tamaño = [], [], 0
+            for fila in filas:
+                peso = fila[2].stat().st_size
+                if actual and tamaño + peso > self.max_adjuntos:
+                    partes.append(actual)
+                    actual, tamaño = [], 0
+                actual.append(fila)
+                tamaño += peso
+            partes.append(actual)
+            for n, parte in enumerate(partes, 1):
+                asunto = self.ASUNTO_COMPANIA.format(compania=compania)
+                if len(partes) > 1:
+                    asunto += f" ({n}/{len(partes)})"
+                adjuntos = [archivo for _, _, archivo in parte]
+                cuerpo = self.CUERPO_COMPANIA.format(
+                    n=len(parte), compania=compania, lista="\n".join(f"- {a.name}" for a in adjuntos)
+                )
+                envios.append(Envio(destinatarios, adjuntos, [(sub, index) for sub, index, _ in parte],
+                                    asunto, cuerpo))
+        return envios, estados, enviados
+
+    def _enviar_uno(self, envio):
+        try:
+            rechazados = self.pool.enviar(envio.mensaje(self.pool.config.remitente))
+        except Exception as e:
+            logger.error(f"Error enviando a {', '.join(envio.destinatarios)}: {e}")
+            return f"error: {e}"
+        aceptados = [d for d in envio.destinatarios if d not in rechazados]
+        estado = f"{ENVIADO} a {', '.join(aceptados)}"
+        if rechazados:
+            estado += f"; rechazado: {', '.join(rechazados)}"
+        return estado
+
+    def enviar(self, subtrabajos, al_registrar=None):
+        """Enviar los certificados generados de los subtrabajos.
+
+        El estado de cada fila se escribe en resultado.df["envio"] y se pasa a
+        al_registrar(sub, index, estado), por ejemplo para el libro. Devuelve
+        un resumen {enviados, fallidos, sin_destinatario, ya_enviados} por filas.
+        """
+        envios, estados, enviados = self._planificar(subtrabajos)
+        resumen = Counter()
+
+        for (sub, index), estado in enviados.items():
+            # Enviadas en una corrida anterior: solo se copia el estado al libro
+            sub.resultado.df.at[index, "envio"] = estado
+            sub.resultado.envios["ya_enviados"] += 1
+            resumen["ya_enviados"] += 1
+            if al_registrar is not None:
+                try:
+                    al_registrar(sub, index, estado)
+                except Exception as e:
+                    logger.error(f"Error registrando el envío de la fila {index}: {e}")
+        if enviados:
+            logger.info(f"{len(enviados)} filas ya se habían enviado en una corrida anterior")
+
+        def registrar(sub, index, estado):
+            sub.resultado.df.at[index, "envio"] = estado
+            if sub.resultado.journal is not None:
+                sub.resultado.journal.marcar_envio(index, estado)
+            if estado.startswith(ENVIADO):
+                clave = "enviados"
+            elif estado == SIN_DESTINATARIO:
+                clave = "sin_destinatario"
+            else:
+                clave = "fallidos"
+            sub.resultado.envios[clave] += 1
+            resumen[clave] += 1
+            if al_registrar is not None:
+                try:
+                    al_registrar(sub, index, estado)
+                except Exception as e:
+                    logger.error(f"Error registrando el envío de la fila {index}: {e}")
+
+        for (sub, index), estado in estados.items():
+            registrar(sub, index, estado)
+        if not envios:
+            return resumen
+
+        logger.info(f"Enviando {len(envios)} correos con {sum(len(e.adjuntos) for e in envios)} certificados")
+        with ThreadPoolExecutor(max_workers=self.pool.config.conexiones) as executor:
+            futuros = {executor.submit(self._enviar_uno, envio): envio for envio in envios}
+            for futuro in as_completed(futuros):
+                estado = futuro.result()
+                for sub, index in futuros[futuro].filas:
+                    registrar(sub, index, estado)
+
+        logger.info(f"Envío terminado: {dict(resumen)} ({self.pool.conexiones_abiertas} conexiones SMTP abiertas)")
+        return resumen
+
+    def cerrar(self):
+        self.pool.cerrar()
+
+
+def entrega_por_defecto():
+    """Entrega con la configuración SMTP del entorno y los contactos por compañía, o None"""
+    config = ConfigSMTP.desde_entorno()
+    if config is None:
+        return None
+    max_mb = real_env("CERTIFICADOS_CORREO_MAX_MB", 15.0)
+    return Entrega(PoolSMTP(config), contactos_por_defecto(), int(max_mb * 1024 * 1024))
@@ -0,0 +1,554 @@
+import os
+import json
+import time
+import shutil
+import socket
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+
+from .compactacion import compactacion_activada, compactador
+from .entorno import entero_env
+from .lotes import (
+    carpetas_lote,
+    preparar_lote,
+    terminar_lote,
+    workers_por_defecto,
+    hilos_render_por_defecto,
+)
+from .motor import FilaEnCurso, build_context, etapa_registrar, fila_fallida
+from .pipeline import Pipeline, Etapa
+from .plantillas import registro
+from .rutas import inicializar_com
+from .trabajos import CONVERTIDO, FALLIDO
+
+logger = logging.getLogger(__name__)
+
+# Estados de una tarea en la cola
+PENDIENTE = "pendiente"
+TOMADA = "tomada"
+HECHA = "hecha"
+FALLIDA = "fallida"
+
+# Estado de una fila cuyo documento se generó pero no se pudo convertir a PDF
+DOCUMENTO = "documento"
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS tareas (
+    id INTEGER PRIMARY KEY,
+    trabajo_id TEXT NOT NULL,
+    archivo TEXT NOT NULL,
+    hoja TEXT NOT NULL,
+    plantilla TEXT NOT NULL,
+    filas TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    trabajador TEXT,
+    ficha INTEGER NOT NULL DEFAULT 0,
+    vence REAL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    actualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tareas_estado ON tareas (estado, id);
+CREATE INDEX IF NOT EXISTS tareas_trabajo ON tareas (trabajo_id, estado);
+CREATE TABLE IF NOT EXISTS resultados (
+    id INTEGER PRIMARY KEY,
+    tarea_id INTEGER NOT NULL,
+    trabajo_id TEXT NOT NULL,
+    indice INTEGER NOT NULL,
+    estado TEXT NOT NULL,
+    salida TEXT,
+    error TEXT,
+    trabajador TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resultados_trabajo ON resultados (trabajo_id, id);
+CREATE TABLE IF NOT EXISTS trabajadores (
+    nombre TEXT PRIMARY KEY,
+    visto REAL NOT NULL,
+    filas INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def nombre_trabajador():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ColaTrabajo:
+    """Cola de tareas en una carpeta compartida entre varias máquinas.
+
+    Cada tarea es un grupo de filas de una hoja, con sus contextos ya
+    calculados y sus rutas de salida relativas a la raíz de la cola (cada
+    máquina puede montar la carpeta en otra ruta). Un trabajador toma una
+    tarea en préstamo por ``prestamo`` segundos y lo renueva mientras
+    trabaja; si muere, el préstamo vence y otro trabajador la retoma. La
+    ficha de cada préstamo impide que un trabajador que perdió la tarea
+    registre resultados sobre los de quien la retomó.
+
+    La cola es un SQLite en la carpeta compartida, sin WAL (que no funciona
+    en carpetas de red). Los vencimientos usan el reloj de cada máquina, que
+    deben estar razonablemente sincronizados.
+    """
+
+    NOMBRE = "cola.sqlite3"
+
+    def __init__(self, raiz, prestamo=120.0, max_intentos=3):
+        self.raiz = Path(raiz)
+        os.makedirs(self.raiz, exist_ok=True)
+        self.path = self.raiz / self.NOMBRE
+        self.prestamo = prestamo
+        self.max_intentos = max_intentos
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=DELETE")
+        self._con.executescript(ESQUEMA)
+
+    def relativa(self, path):
+        return Path(path).resolve().relative_to(self.raiz.resolve()).as_posix()
+
+    def absoluta(self, relativa):
+        return self.raiz / relativa
+
+    def publicar_plantilla(self, path):
+        """Copiar la plantilla a la carpeta compartida (una vez por versión); devuelve su ruta relativa"""
+        path = Path(path)
+        firma = hashlib.sha1(path.read_bytes()).hexdigest()[:12]
+        destino = self.raiz / "plantillas" / f"{firma}_{path.name}"
+        if not destino.exists():
+            os.makedirs(destino.parent, exist_ok=True)
+            temporal = destino.with_name(f".{destino.name}.{os.getpid()}.tmp")
+            shutil.copyfile(path, temporal)
+            os.replace(temporal, destino)
+        return self.relativa(destino)
+
+    @contextmanager
+    def _transaccion(self):
+        """Transacción con bloqueo de escritura desde el inicio (BEGIN IMMEDIATE)"""
+        with self._lock:
+            self._con.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._con
+            except BaseException:
+                self._con.execute("ROLLBACK")
+                raise
+            self._con.execute("COMMIT")
+
+    def encolar(self, trabajo_id, archivo, hoja, plantilla, filas):
+        """Agregar una tarea; filas es [{indice, contexto, documento, pdf}] con rutas relativas"""
+        with self._transaccion() as con:
+            cursor = con.execute(
+                "INSERT INTO tareas (trabajo_id, archivo, hoja, plantilla, filas, estado, actualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (trabajo_id, archivo, str(hoja), plantilla, json.dumps(filas, ensure_ascii=False), PENDIENTE,
+                 time.time()),
+            )
+            return cursor.lastrowid
+
+    def tomar(self, trabajador):
+        """Tomar en préstamo la tarea pendiente más antigua (o una con el préstamo vencido).
+
+        Devuelve un dict con la tarea y su ficha, o None si no hay nada que hacer.
+        """
+        ahora = time.time()
+        with self._transaccion() as con:
+            self._vencer(con, ahora)
+            fila = con.execute(
+                "SELECT id, trabajo_id, archivo, hoja, plantilla, filas, ficha FROM tareas "
+                "WHERE estado = ? OR (estado = ? AND vence < ?) ORDER BY id LIMIT 1",
+                (PENDIENTE, TOMADA, ahora),
+            ).fetchone()
+            if fila is None:
+                return None
+            tarea_id, ficha = fila[0], fila[6] + 1
+            con.execute(
+                "UPDATE tareas SET estado = ?, trabajador = ?, ficha = ?, vence = ?, intentos = intentos + 1, "
+                "actualizado = ? WHERE id = ?",
+                (TOMADA, trabajador, ficha, ahora + self.prestamo, ahora, tarea_id),
+            )
+            con.execute(
+                "INSERT INTO trabajadores (nombre, visto) VALUES (?, ?) "
+                "ON CONFLICT (nombre) DO UPDATE SET visto = excluded.visto",
+                (trabajador, ahora),
+            )
+        return {
+            "id": tarea_id, "trabajo_id": fila[1], "archivo": fila[2], "hoja": fila[3],
+            "plantilla": fila[4], "filas": json.loads(fila[5]), "ficha": ficha,
+        }
+
+    def renovar(self, tarea_id, ficha):
+        """Extender el préstamo; False si la tarea ya no es de este trabajador"""
+        with self._transaccion() as con:
+            cursor = con.execute(
+                "UPDATE tareas SET vence = ? WHERE id = ? AND ficha = ? AND estado = ?",
+                (time.time() + self.prestamo, tarea_id, ficha, TOMADA),
+            )
+            return cursor.rowcount == 1
+
+    def completar(self, tarea, trabajador, resultados):
+        """Registrar los resultados de una tarea, solo si el préstamo sigue siendo de este trabajador.
+
+        resultados es [(indice, estado, salida relativa, error)].
+        """
+        with self._transaccion() as con:
+            cursor = con.execute(
+                "UPDATE tareas SET estado = ?, vence = NULL, actualizado = ? WHERE id = ? AND ficha = ? AND estado = ?",
+                (HECHA, time.time(), tarea["id"], tarea["ficha"], TOMADA),
+            )
+            if cursor.rowcount != 1:
+                return False
+            con.executemany(
+                "INSERT INTO resultados (tarea_id, trabajo_id, indice, estado, salida, error, trabajador) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(tarea["id"], tarea["trabajo_id"], int(indice), estado, salida, error, trabajador)
+                 for indice, estado, salida, error in resultados],
+            )
+            con.execute(
+                "UPDATE trabajadores SET visto = ?, filas = filas + ? WHERE nombre = ?",
+                (time.time(), len(resultados), trabajador),
+            )
+        return True
+
+    def devolver(self, tarea, error):
+        """Devolver una tarea que falló por completo; se reintenta hasta max_intentos veces"""
+        with self._transaccion() as con:
+            con.execute(
+                "UPDATE tareas SET estado = CASE WHEN intentos >= ? THEN ? ELSE ? END, error = ?, vence = NULL, "
+                "actualizado = ? WHERE id = ? AND ficha = ? AND estado = ?",
+                (self.max_intentos, FALLIDA, PENDIENTE, error, time.time(), tarea["id"], tarea["ficha"], TOMADA),
+            )
+
+    def resultados(self, trabajo_id, desde=0):
+        """Resultados nuevos de un trabajo: [(id, tarea_id, indice, estado, salida, error, trabajador)]"""
+        with self._lock:
+            return self._con.execute(
+                "SELECT id, tarea_id, indice, estado, salida, error, trabajador FROM resultados "
+                "WHERE trabajo_id = ? AND id > ? ORDER BY id",
+                (trabajo_id, desde),
+            ).fetchall()
+
+    def fallidas(self, trabajo_id):
+        """{tarea_id: error} de las tareas que ya no se van a reintentar"""
+        with self._lock:
+            return dict(self._con.execute(
+                "SELECT id, error FROM tareas WHERE trabajo_id = ? AND estado = ?", (trabajo_id, FALLIDA)
+            ).fetchall())
+
+    def _vencer(self, con, ahora):
+        # Las tareas que vencieron demasiadas veces ya no se reintentan
+        con.execute(
+            "UPDATE tareas SET estado = ?, error = ?, actualizado = ? "
+            "WHERE estado = ? AND vence < ? AND intentos >= ?",
+            (FALLIDA, "El trabajador dejó de responder", ahora, TOMADA, ahora, self.max_intentos),
+        )
+
+    def vencer(self):
+        """Marcar como fallidas las tareas vencidas sin intentos restantes"""
+        with self._transaccion() as con:
+            self._vencer(con, time.time())
+
+    def limpiar(self, trabajo_id):
+        with self._transaccion() as con:
+            con.execute("DELETE FROM resultados WHERE trabajo_id = ?", (trabajo_id,))
+            con.execute("DELETE FROM tareas WHERE trabajo_id = ?", (trabajo_id,))
+
+    def resumen(self):
+        """Tareas por estado y trabajadores vistos, para /cola"""
+        with self._lock:
+            tareas = dict(self._con.execute("SELECT estado, COUNT(*) FROM tareas GROUP BY estado").fetchall())
+            trabajadores = [
+                {"nombre": nombre, "visto": visto, "filas": filas}
+                for nombre, visto, filas in self._con.execute(
+                    "SELECT nombre, visto, filas FROM trabajadores ORDER BY visto DESC"
+                )
+            ]
+        return {"raiz": str(self.raiz), "tareas": tareas, "trabajadores": trabajadores}
+
+    def cerrar(self):
+        with self._lock:
+            self._con.close()
+
+
+_colas = {}
+_colas_lock = threading.Lock()
+
+
+def abrir_cola(raiz):
+    """Cola compartida de una carpeta (una conexión por carpeta y proceso)"""
+    clave = str(Path(raiz).resolve())
+    with _colas_lock:
+        if clave not in _colas:
+            _colas[clave] = ColaTrabajo(raiz)
+        return _colas[clave]
+
+
+class FilaRemota:
+    """Una fila de una tarea mientras pasa por render -> conversión en un trabajador"""
+
+    def __init__(self, plantilla, indice, contexto, documento, pdf):
+        self.plantilla = plantilla
+        self.indice = indice
+        self.contexto = contexto
+        self.documento = documento
+        self.pdf = pdf
+        self.convertido = False
+        self.error = None
+
+
+def _render_remoto(fila):
+    try:
+        os.makedirs(fila.documento.parent, exist_ok=True)
+        fila.plantilla.render(fila.contexto, fila.documento)
+    except Exception as e:
+        fila.error = str(e)
+    return fila
+
+
+def _convertir_remoto(fila):
+    if fila.error is None:
+        try:
+            fila.convertido = fila.plantilla.backend.convert(fila.documento, fila.pdf)
+        except Exception as e:
+            fila.error = str(e)
+    return fila
+
+
+def _compactar_remoto(fila):
+    if fila.error is None and fila.convertido:
+        try:
+            compactador().compactar(fila.pdf)
+        except Exception as e:
+            logger.error(f"Error compactando {fila.pdf}: {e}")
+    return fila
+
+
+class Trabajador:
+    """Toma tareas de una ColaTrabajo y las genera con el pipeline local.
+
+    Puede correr en cualquier máquina que vea la carpeta compartida (ver
+    app.py --trabajador). workers es el número de conversiones simultáneas
+    en esta máquina.
+    """
+
+    def __init__(self, cola, nombre=None, workers=None):
+        self.cola = cola
+        self.nombre = nombre or nombre_trabajador()
+        self.workers = workers or workers_por_defecto()
+        self.filas_generadas = 0
+
+    def _renovar(self, tarea, terminada):
+        while not terminada.wait(self.cola.prestamo / 3):
+            if not self.cola.renovar(tarea["id"], tarea["ficha"]):
+                logger.warning(f"Se perdió el préstamo de la tarea {tarea['id']}; sus resultados se descartarán")
+                return
+
+    def procesar(self, tarea):
+        """Generar las filas de una tarea y registrar sus resultados en la cola"""
+        try:
+            plantilla = registro.obtener(self.cola.absoluta(tarea["plantilla"]))
+        except Exception as e:
+            logger.error(f"Tarea {tarea['id']}: no se pudo cargar la plantilla: {e}")
+            self.cola.devolver(tarea, f"Plantilla no disponible: {e}")
+            return False
+
+        terminada = threading.Event()
+        renovador = threading.Thread(target=self._renovar, args=(tarea, terminada), daemon=True)
+        renovador.start()
+        resultados = []
+        try:
+            etapas = [
+                Etapa("render", _render_remoto, hilos_render_por_defecto()),
+                Etapa("conversion", _convertir_remoto, self.workers, inicializar=inicializar_com),
+            ]
+            if compactacion_activada():
+                etapas.append(Etapa("compactacion", _compactar_remoto, self.workers))
+            etapas.append(Etapa("resultado", resultados.append, 1))
+            filas = (
+                FilaRemota(plantilla, f["indice"], f["contexto"],
+                           self.cola.absoluta(f["documento"]), self.cola.absoluta(f["pdf"]))
+                for f in tarea["filas"]
+            )
+            Pipeline(etapas, capacidad=2 * self.workers, al_fallar=fila_fallida).ejecutar(filas)
+        finally:
+            terminada.set()
+            renovador.join()
+
+        registros = []
+        for fila in resultados:
+            if fila.error is not None:
+                registros.append((fila.indice, FALLIDO, None, fila.error))
+            elif fila.convertido:
+                fila.documento.unlink(missing_ok=True)
+                registros.append((fila.indice, CONVERTIDO, self.cola.relativa(fila.pdf), None))
+            else:
+                registros.append((fila.indice, DOCUMENTO, self.cola.relativa(fila.documento), None))
+        if not self.cola.completar(tarea, self.nombre, registros):
+            logger.warning(f"Tarea {tarea['id']} descartada: otro trabajador la retomó")
+            return False
+        self.filas_generadas += len(registros)
+        logger.info(f"Tarea {tarea['id']}: {len(registros)} filas generadas por {self.nombre}")
+        return True
+
+    def ejecutar(self, detener=None, espera=2.0):
+        """Tomar y procesar tareas hasta que se pida detener (o para siempre)"""
+        detener = detener or threading.Event()
+        logger.info(f"Trabajador {self.nombre} esperando tareas en {self.cola.raiz}")
+        while not detener.is_set():
+            try:
+                tarea = self.cola.tomar(self.nombre)
+            except sqlite3.OperationalError as e:
+                # La carpeta compartida puede estar ocupada o no disponible un momento
+                logger.warning(f"Cola no disponible: {e}")
+                tarea = None
+            if tarea is None:
+                detener.wait(espera)
+                continue
+            try:
+                self.procesar(tarea)
+            except Exception as e:
+                logger.error(f"Error procesando la tarea {tarea['id']}: {e}")
+                self.cola.devolver(tarea, str(e))
+
+
+def _registrar_remoto(resultado, index, row, plantilla, estado, archivo=None, error=None):
+    """Aplicar al resultado local una fila generada por un trabajador (como etapa_registrar)"""
+    fila = FilaEnCurso(resultado, index, row, plantilla)
+    journal = resultado.journal
+    if estado == CONVERTIDO:
+        fila.archivo = Path(archivo)
+        if journal:
+            journal.marcar(index, CONVERTIDO, fila.archivo)
+            journal.descartar_documento_previo(index)
+    elif estado == DOCUMENTO:
+        # Documento sin PDF: etapa_registrar lo registra como fallido y lo conserva
+        fila.doc_file = Path(archivo)
+        fila.error = "No se pudo convertir a PDF"
+    else:
+        fila.error = error or "Error en el trabajador"
+    etapa_registrar(fila)
+
+
+def procesar_distribuido(subtrabajos, plantilla_path, cola, output_dir=None, journal=None, trabajo_id=None,
+                         en_curso=None, indice=None, entrega=None, filas_por_tarea=None, trabajar=True,
+                         espera=1.0):
+    """Como procesar_lote, pero repartiendo las filas entre los trabajadores de una cola compartida.
+
+    Las filas se encolan en tareas de filas_por_tarea filas
+    (CERTIFICADOS_FILAS_POR_TAREA, 25 por defecto); los trabajadores
+    (este proceso incluido, si trabajar es True) las generan en la carpeta
+    compartida, y aquí se van registrando a medida que terminan: un solo
+    libro actualizado, journal e índice de emisiones, como en un lote local.
+    La carpeta en curso (y por lo tanto output_dir) debe estar dentro de la
+    raíz de la cola.
+    """
+    filas_por_tarea = filas_por_tarea or entero_env("CERTIFICADOS_FILAS_POR_TAREA", 25)
+    trabajo_id = trabajo_id or hashlib.sha1(os.urandom(16)).hexdigest()[:16]
+    carpeta_final, output_dir = carpetas_lote(output_dir, en_curso, trabajo_id)
+    cola.relativa(output_dir)  # ValueError si la carpeta no es compartida
+    escritores, listas = preparar_lote(subtrabajos, plantilla_path, output_dir, journal, trabajo_id, indice,
+                                       carpeta_final)
+
+    # Tareas de un trabajo anterior interrumpido: sus filas ya hechas están en el journal
+    cola.limpiar(trabajo_id)
+    inicio = time.perf_counter()
+    pendientes = {}  # tarea_id -> (resultado, {index: (row, plantilla)})
+    reutilizadas = 0
+    plantillas_compartidas = {}
+    for sub, lista in zip(subtrabajos, listas):
+        grupo, plantilla_grupo = [], None
+        for resultado, index, row, plantilla in lista + [(None, None, None, None)]:
+            if plantilla is not plantilla_grupo or len(grupo) >= filas_por_tarea or resultado is None:
+                if grupo:
+                    if plantilla_grupo.path not in plantillas_compartidas:
+                        plantillas_compartidas[plantilla_grupo.path] = cola.publicar_plantilla(plantilla_grupo.path)
+                    tarea_id = cola.encolar(trabajo_id, sub.nombre_archivo, sub.hoja,
+                                            plantillas_compartidas[plantilla_grupo.path],
+                                            [f for f, _ in grupo])
+                    pendientes[tarea_id] = (sub.resultado, {f["indice"]: datos for f, datos in grupo})
+                grupo, plantilla_grupo = [], plantilla
+            if resultado is None:
+                break
+
+            estado, salida = resultado.journal.previo(index) if resultado.journal else (None, None)
+            if estado == CONVERTIDO and salida and Path(salida).exists():
+                _registrar_remoto(resultado, index, row, plantilla, CONVERTIDO, salida)
+                resultado.reutilizadas += 1
+                reutilizadas += 1
+                continue
+            documento, pdf = resultado.rutas[index]
+            grupo.append(({
+                "indice": int(index),
+                "contexto": build_context(row),
+                "documento": cola.relativa(documento),
+                "pdf": cola.relativa(pdf),
+            }, (row, plantilla)))
+    logger.info(f"Trabajo {trabajo_id}: {len(pendientes)} tareas en la cola {cola.raiz}"
+                + (f" ({reutilizadas} filas reutilizadas)" if reutilizadas else ""))
+
+    # Este proceso también trabaja, para que el lote avance aunque no haya otras máquinas
+    detener = threading.Event()
+    local = None
+    if trabajar and pendientes:
+        local = threading.Thread(target=Trabajador(cola, f"{nombre_trabajador()}-local").ejecutar,
+                                 args=(detener, espera), daemon=True)
+        local.start()
+
+    ultimo, por_trabajador, vistas_fallidas = 0, Counter(), set()
+    ultimo_aviso = time.monotonic()
+    try:
+        while pendientes:
+            for id_resultado, tarea_id, index, estado, salida, error, trabajador in cola.resultados(trabajo_id, ultimo):
+                ultimo = id_resultado
+                resultado, filas = pendientes.get(tarea_id, (None, {}))
+                if index in filas:
+                    row, plantilla = filas.pop(index)
+                    archivo = cola.absoluta(salida) if salida else None
+                    _registrar_remoto(resultado, index, row, plantilla, estado, archivo, error)
+                    por_trabajador[trabajador] += 1
+                if tarea_id in pendientes and not filas:
+                    del pendientes[tarea_id]
+
+            cola.vencer()
+            for tarea_id, error in cola.fallidas(trabajo_id).items():
+                if tarea_id in pendientes and tarea_id not in vistas_fallidas:
+                    vistas_fallidas.add(tarea_id)
+                    resultado, filas = pendientes.pop(tarea_id)
+                    for index, (row, plantilla) in filas.items():
+                        _registrar_remoto(resultado, index, row, plantilla, FALLIDO, error=f"Tarea fallida: {error}")
+
+            if not pendientes:
+                break
+            if time.monotonic() - ultimo_aviso >= 10:
+                ultimo_aviso = time.monotonic()
+                logger.info(f"Trabajo {trabajo_id}: {len(pendientes)} tareas por terminar, "
+                            f"filas por trabajador {dict(por_trabajador)}")
+            time.sleep(espera)
+    finally:
+        detener.set()
+        if local is not None:
+            local.join()
+        cola.limpiar(trabajo_id)
+
+    duracion = time.perf_counter() - inicio
+    nuevas = sum(por_trabajador.values())
+    if journal is not None and nuevas > 0:
+        journal.registrar_rendimiento(trabajo_id, nuevas, duracion)
+    reporte = [{"trabajador": nombre, "filas": filas} for nombre, filas in por_trabajador.most_common()]
+    for linea in reporte:
+        logger.info(f"Trabajador {linea['trabajador']}: {linea['filas']} filas")
+    for sub in subtrabajos:
+        sub.resultado.reporte_etapas = reporte
+
+    return terminar_lote(subtrabajos, escritores, output_dir, carpeta_final, journal, trabajo_id, indice, entrega)
+
+
+def ejecutar_trabajador(raiz, workers=None):
+    """Punto de entrada de una máquina trabajadora (app.py --trabajador --cola <carpeta>)"""
+    trabajador = Trabajador(abrir_cola(raiz), workers=workers)
+    try:
+        trabajador.ejecutar()
+    except KeyboardInterrupt:
+        logger.info(f"Trabajador {trabajador.nombre} detenido ({trabajador.filas_generadas} filas generadas)")
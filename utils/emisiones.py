@@ -0,0 +1,211 @@
+import os
+import hmac
+import json
+import sqlite3
+import secrets
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from .motor import certificado_code, texto_numero
+from .rutas import get_config_folder
+from .validacion import parse_fechas
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS emisiones (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT NOT NULL,
+    cedula TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    compania TEXT NOT NULL,
+    fecha TEXT,
+    horas TEXT,
+    archivo TEXT NOT NULL,
+    trabajo_id TEXT,
+    origen TEXT NOT NULL,
+    emitido TEXT NOT NULL,
+    firma TEXT NOT NULL,
+    UNIQUE (trabajo_id, origen)
+);
+CREATE INDEX IF NOT EXISTS emisiones_codigo ON emisiones (codigo);
+CREATE INDEX IF NOT EXISTS emisiones_cedula ON emisiones (cedula);
+CREATE INDEX IF NOT EXISTS emisiones_compania ON emisiones (compania);
+CREATE TRIGGER IF NOT EXISTS emisiones_sin_cambios BEFORE UPDATE ON emisiones
+BEGIN SELECT RAISE(ABORT, 'el registro de emisiones es de solo inserción'); END;
+CREATE TRIGGER IF NOT EXISTS emisiones_sin_borrado BEFORE DELETE ON emisiones
+BEGIN SELECT RAISE(ABORT, 'el registro de emisiones es de solo inserción'); END;
+"""
+
+# Campos firmados, en orden
+CAMPOS = ("codigo", "cedula", "nombre", "compania", "fecha", "horas", "archivo", "trabajo_id", "origen", "emitido")
+
+
+def _ahora():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def cargar_clave(output_dir):
+    """Clave de firma: CERTIFICADOS_CLAVE_FIRMA o un archivo generado la primera vez.
+
+    El archivo va en la carpeta de configuración del usuario, no junto al
+    índice: quien pueda leer o copiar la carpeta de salida no puede firmar
+    emisiones. Una clave que quedó en output_dir (versiones anteriores) se
+    mueve allí la primera vez, para que las firmas existentes sigan valiendo.
+    """
+    clave = os.environ.get("CERTIFICADOS_CLAVE_FIRMA")
+    if clave:
+        return clave.encode("utf-8")
+    path = get_config_folder() / "clave_emisiones"
+    anterior = Path(output_dir) / ".clave_emisiones"
+    if not path.exists():
+        texto = anterior.read_text(encoding="utf-8") if anterior.exists() else secrets.token_hex(32)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(texto.strip())
+        logger.info(f"Clave de firma de emisiones creada en {path}")
+    clave = path.read_text(encoding="utf-8").strip()
+    if anterior.exists():
+        if anterior.read_text(encoding="utf-8").strip() != clave:
+            logger.warning(f"{anterior} no coincide con la clave de {path}; no se borra")
+        else:
+            try:
+                anterior.unlink()
+                logger.info(f"Clave de firma movida de {anterior} a {path}")
+            except OSError as e:
+                logger.warning(f"No se pudo borrar la clave anterior {anterior}: {e}")
+    return clave.encode("utf-8")
+
+
+def datos_emision(row, archivo):
+    """Campos de la emisión de una fila generada"""
+    fecha = row.get("fecha")
+    if fecha is not None and not pd.isna(fecha):
+        fecha = fecha if hasattr(fecha, "strftime") else parse_fechas(pd.Series([fecha])).iloc[0]
+    return {
+        "codigo": certificado_code(row.get("id_formacion", ""), row.get("item", "")),
+        "cedula": row["cedula"].strip() if isinstance(row["cedula"], str) else texto_numero(row["cedula"]),
+        "nombre": str(row["nombre"]).strip(),
+        "compania": str(row["compañia"]).strip(),
+        "fecha": None if fecha is None or pd.isna(fecha) else fecha.strftime("%Y-%m-%d"),
+        "horas": texto_numero(row.get("horas", "")),
+        # Compañía/archivo, que no cambia al publicar el trabajo
+        "archivo": f"{Path(archivo).parent.name}/{Path(archivo).name}",
+    }
+
+
+class IndiceEmisiones:
+    """Registro de solo inserción de los certificados emitidos, con firma HMAC por fila.
+
+    Está indexado por código, cédula y compañía, de modo que una verificación
+    es una búsqueda en el índice sin tocar las carpetas de PDF.
+    """
+
+    NOMBRE = "emisiones.sqlite3"
+
+    def __init__(self, output_dir, clave=None, cada_filas=100):
+        self.output_dir = Path(output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.path = self.output_dir / self.NOMBRE
+        self.clave = clave or cargar_clave(self.output_dir)
+        self.cada_filas = cada_filas
+        self._pendientes = 0
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.executescript(ESQUEMA)
+
+    def firmar(self, emision):
+        mensaje = json.dumps([emision.get(campo) for campo in CAMPOS], ensure_ascii=False)
+        return hmac.new(self.clave, mensaje.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def registrar(self, emision):
+        """Agregar una emisión; una misma fila de un trabajo se registra una sola vez"""
+        emision = dict(emision, emitido=_ahora())
+        emision["firma"] = self.firmar(emision)
+        columnas = CAMPOS + ("firma",)
+        with self._lock:
+            self._con.execute(
+                f"INSERT OR IGNORE INTO emisiones ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+                [emision[c] for c in columnas],
+            )
+            self._pendientes += 1
+            if self._pendientes >= self.cada_filas:
+                self._con.commit()
+                self._pendientes = 0
+
+    def confirmar(self):
+        with self._lock:
+            self._con.commit()
+            self._pendientes = 0
+
+    def observador(self, trabajo_id, etiqueta):
+        """Callback para ResultadoProceso.al_terminar_fila; etiqueta identifica la hoja"""
+        def al_terminar_fila(resultado, index, row, archivo, error):
+            # Solo los PDF: si la conversión falla queda el documento de Word/PowerPoint,
+            # y el registro (de solo inserción) no se podría corregir al reanudar
+            if archivo is None or Path(archivo).suffix.lower() != ".pdf":
+                return
+            emision = datos_emision(row, archivo)
+            emision.update(trabajo_id=trabajo_id, origen=f"{etiqueta} fila {int(index) + 2}")
+            self.registrar(emision)
+        return al_terminar_fila
+
+    def _consultar(self, where, parametros):
+        with self._lock:
+            cursor = self._con.execute(
+                f"SELECT {', '.join(CAMPOS)}, firma FROM emisiones WHERE {where} ORDER BY id", parametros
+            )
+            filas = cursor.fetchall()
+        emisiones = []
+        for fila in filas:
+            emision = dict(zip(CAMPOS + ("firma",), fila))
+            emision["firma_valida"] = hmac.compare_digest(emision["firma"], self.firmar(emision))
+            emisiones.append(emision)
+        return emisiones
+
+    def por_codigo(self, codigo):
+        return self._consultar("codigo = ?", (codigo,))
+
+    def por_cedula(self, cedula):
+        return self._consultar("cedula = ?", (cedula,))
+
+    def exportar(self, destino, compania=None, desde=None):
+        """Exportar las emisiones a CSV, opcionalmente filtradas por compañía o fecha de emisión"""
+        condiciones, parametros = [], []
+        if compania:
+            condiciones.append("compania = ?")
+            parametros.append(compania)
+        if desde:
+            condiciones.append("emitido >= ?")
+            parametros.append(desde)
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._lock:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(CAMPOS)}, firma FROM emisiones{where} ORDER BY id", self._con, params=parametros
+            )
+        df.to_csv(destino, index=False, encoding="utf-8-sig")
+        return len(df)
+
+    def cerrar(self):
+        with self._lock:
+            self._con.commit()
+            self._con.close()
+
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def abrir_indice(output_dir):
+    """Índice de emisiones compartido de una carpeta de salida"""
+    clave = str(Path(output_dir).resolve())
+    with _indices_lock:
+        if clave not in _indices:
+            _indices[clave] = IndiceEmisiones(output_dir)
+        return _indices[clave]
@@ -0,0 +1,17 @@
+import os
+
+
+def entero_env(nombre, por_defecto, minimo=1):
+    """Entero de la variable de entorno nombre (al menos minimo), o por_defecto si falta o no es válido"""
+    try:
+        return max(minimo, int(os.environ[nombre]))
+    except (KeyError, ValueError):
+        return por_defecto
+
+
+def real_env(nombre, por_defecto, minimo=0.0):
+    """Número de la variable de entorno nombre (al menos minimo), o por_defecto si falta o no es válido"""
+    try:
+        return max(minimo, float(os.environ[nombre]))
+    except (KeyError, ValueError):
+        return por_defecto
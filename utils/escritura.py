@@ -0,0 +1,92 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+
+from .columnas import resolver_columnas
+
+logger = logging.getLogger(__name__)
+
+
+class EscritorEstado:
+    """Actualiza la columna certificado (y envio) directamente sobre el libro original.
+
+    El libro se abre una sola vez con openpyxl, de modo que se conservan
+    formatos, fórmulas y hojas no procesadas; solo cambian las celdas de
+    certificado de las filas generadas. Durante trabajos largos se guarda un
+    punto de control cada ``cada_filas`` filas o ``cada_segundos`` segundos.
+    """
+
+    def __init__(self, origen, destino, cada_filas=200, cada_segundos=30.0):
+        from openpyxl import load_workbook
+
+        if hasattr(origen, "seek"):
+            origen.seek(0)
+        self.libro = load_workbook(origen)
+        self.destino = Path(destino)
+        self.cada_filas = cada_filas
+        self.cada_segundos = cada_segundos
+        self._columnas = {}
+        self._cambios = 0
+        self._ultimo_guardado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _hoja(self, hoja):
+        if isinstance(hoja, int):
+            return self.libro.worksheets[hoja]
+        return self.libro[hoja]
+
+    def _columna(self, hoja, nombre="certificado"):
+        """Número de columna (1..n) de nombre en la hoja, según el encabezado.
+
+        Si la hoja no tiene la columna se agrega al final, con ese encabezado.
+        """
+        if (hoja, nombre) not in self._columnas:
+            ws = self._hoja(hoja)
+            encabezados = [c.value for c in next(ws.iter_rows(min_row=1, max_row=1))]
+            mapping = resolver_columnas(encabezados)
+            numero = next(
+                (i + 1 for i, encabezado in enumerate(encabezados) if mapping.get(encabezado) == nombre), None
+            )
+            if numero is None:
+                numero = ws.max_column + 1
+                ws.cell(row=1, column=numero, value=nombre)
+            self._columnas[(hoja, nombre)] = numero
+        return self._columnas[(hoja, nombre)]
+
+    def marcar(self, hoja, index, valor="si", columna="certificado"):
+        """Escribir el estado de una fila (index del DataFrame; el encabezado es la fila 1)"""
+        with self._lock:
+            self._hoja(hoja).cell(row=int(index) + 2, column=self._columna(hoja, columna), value=valor)
+            self._cambios += 1
+            if (self._cambios >= self.cada_filas
+                    or time.monotonic() - self._ultimo_guardado >= self.cada_segundos):
+                self._guardar()
+
+    def observador(self, hoja):
+        """Callback para ResultadoProceso.al_terminar_fila"""
+        def al_terminar_fila(resultado, index, row, archivo, error):
+            # Solo un PDF cuenta como certificado emitido
+            if archivo is not None and Path(archivo).suffix.lower() == ".pdf":
+                self.marcar(hoja, index)
+        return al_terminar_fila
+
+    def _guardar(self):
+        # Escribir a un temporal y reemplazar, para no dejar un libro corrupto
+        temporal = self.destino.with_name(f".{self.destino.name}.tmp")
+        self.libro.save(temporal)
+        os.replace(temporal, self.destino)
+        logger.info(f"Punto de control guardado: {self.destino} ({self._cambios} cambios)")
+        self._cambios = 0
+        self._ultimo_guardado = time.monotonic()
+
+    def guardar(self):
+        with self._lock:
+            self._guardar()
+        return self.destino
+
+
+def puede_escribir_en_sitio(nombre_archivo):
+    """Solo los .xlsx se parchean en sitio; los .xls se reescriben con pandas"""
+    return Path(nombre_archivo).suffix.lower() == ".xlsx"
@@ -0,0 +1,127 @@
+import os
+import csv
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+from .columnas import columna_necesaria, resolver_columnas
+from .motor import _actualizar_certificado
+
+logger = logging.getLogger(__name__)
+
+# Formatos tabulares (una sola "hoja") además de Excel
+FORMATOS_TABLA = (".csv", ".parquet")
+
+# Columnas que se leen como texto: conservan ceros a la izquierda y no pasan por float
+COLUMNAS_TEXTO = ("nombre", "cedula", "compañia", "certificado", "plantilla", "correo", "envio")
+
+CODIFICACIONES = ("utf-8", "cp1252", "latin-1")
+
+
+def es_tabla(nombre_archivo):
+    return Path(nombre_archivo).suffix.lower() in FORMATOS_TABLA
+
+
+def _muestra(archivo, tamaño=65536):
+    if hasattr(archivo, "read"):
+        archivo.seek(0)
+        datos = archivo.read(tamaño)
+        archivo.seek(0)
+        return datos
+    with open(archivo, "rb") as f:
+        return f.read(tamaño)
+
+
+def detectar_csv(archivo):
+    """(codificación, separador) de un CSV, a partir de una muestra del inicio"""
+    muestra = _muestra(archivo)
+    if muestra.startswith(b"\xef\xbb\xbf"):
+        codificacion = "utf-8-sig"
+        texto = muestra[3:].decode("utf-8", errors="ignore")
+    else:
+        # Cortar en el último salto de línea para no partir un carácter multibyte
+        completa = muestra[:muestra.rfind(b"\n") + 1] or muestra
+        for codificacion in CODIFICACIONES:
+            try:
+                texto = completa.decode(codificacion)
+                break
+            except UnicodeDecodeError:
+                continue
+
+    try:
+        separador = csv.Sniffer().sniff(texto[:8192], delimiters=",;\t|").delimiter
+    except csv.Error:
+        separador = ","
+    return codificacion, separador
+
+
+def _tipos_texto(columnas):
+    """dtype para read_csv: las columnas de texto reconocidas como str"""
+    mapping = resolver_columnas(columnas)
+    return {original: str for original, std in mapping.items() if std in COLUMNAS_TEXTO}
+
+
+def leer_csv(archivo):
+    """Leer solo las columnas que usa el motor, con codificación y separador detectados"""
+    codificacion, separador = detectar_csv(archivo)
+    opciones = {"sep": separador, "encoding": codificacion}
+    encabezados = pd.read_csv(archivo, nrows=0, **opciones).columns
+    if hasattr(archivo, "seek"):
+        archivo.seek(0)
+    logger.info(f"CSV con codificación {codificacion} y separador {separador!r}")
+    df = pd.read_csv(archivo, usecols=columna_necesaria, dtype=_tipos_texto(encabezados), **opciones)
+    df.attrs["encabezados"] = list(encabezados)
+    return df
+
+
+def leer_parquet(archivo):
+    """Leer solo las columnas reconocidas (proyección de columnas de Parquet)"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Para leer archivos Parquet instala pyarrow (pip install pyarrow)")
+    encabezados = pq.ParquetFile(archivo).schema_arrow.names
+    columnas = [c for c in encabezados if columna_necesaria(c)]
+    if hasattr(archivo, "seek"):
+        archivo.seek(0)
+    # Parquet ya trae los tipos de cada columna; no hace falta inferirlos
+    df = pd.read_parquet(archivo, columns=columnas)
+    df.attrs["encabezados"] = list(encabezados)
+    return df
+
+
+def leer_tabla(archivo, nombre_archivo):
+    if hasattr(archivo, "seek"):
+        archivo.seek(0)
+    if Path(nombre_archivo).suffix.lower() == ".csv":
+        return leer_csv(archivo)
+    return leer_parquet(archivo)
+
+
+def guardar_tabla(resultados, nombre_archivo, origen, output_dir):
+    """Guardar el CSV o Parquet actualizado en el mismo formato (y codificación y separador)"""
+    try:
+        resultado = next(iter(resultados.values()))
+        destino = Path(output_dir) / Path(nombre_archivo).name
+        temporal = destino.with_name(f".{destino.name}.tmp")
+        if hasattr(origen, "seek"):
+            origen.seek(0)
+
+        if destino.suffix.lower() == ".csv":
+            codificacion, separador = detectar_csv(origen)
+            # Todo como texto, para reescribir los demás valores tal como venían
+            original = pd.read_csv(origen, sep=separador, encoding=codificacion, dtype=str, keep_default_na=False)
+            _actualizar_certificado(original, resultado.df).to_csv(
+                temporal, sep=separador, encoding=codificacion, index=False
+            )
+        else:
+            original = pd.read_parquet(origen)
+            _actualizar_certificado(original, resultado.df).to_parquet(temporal, index=False)
+
+        os.replace(temporal, destino)
+        logger.info(f"Archivo actualizado guardado: {destino}")
+        return destino
+    except Exception as e:
+        logger.error(f"Error guardando {nombre_archivo}: {e}")
+        return None
@@ -0,0 +1,333 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from .compactacion import pdf_valido
+from .rutas import resource_path
+
+logger = logging.getLogger(__name__)
+
+EMU_POR_PULGADA = 914400
+
+# Nombres con que se registran las fuentes TrueType propias
+FUENTE = "Certificado"
+FUENTE_NEGRITA = "Certificado-Bold"
+
+# Estilos del renderizador de respaldo: (negrita, tamaño, color)
+ESTILOS = {
+    "titulo": (True, 16, "darkblue"),
+    "subtitulo": (True, 14, "black"),
+    "dato": (True, 12, "navy"),
+    "firma": (True, 10, "black"),
+    "normal": (False, 11, "black"),
+}
+
+_fuentes = None
+_fuentes_lock = threading.Lock()
+
+
+def _buscar_fuente(variable, nombres):
+    ruta = os.environ.get(variable)
+    if ruta and os.path.exists(ruta):
+        return ruta
+    carpeta = Path(resource_path("fonts"))
+    for nombre in nombres:
+        if (carpeta / nombre).exists():
+            return str(carpeta / nombre)
+    return None
+
+
+def registrar_fuentes():
+    """Registrar una sola vez las fuentes TrueType; devuelve (normal, negrita).
+
+    Se usan CERTIFICADOS_FUENTE / CERTIFICADOS_FUENTE_NEGRITA o los archivos de
+    la carpeta fonts/; si no hay, Helvetica.
+    """
+    global _fuentes
+    with _fuentes_lock:
+        if _fuentes is not None:
+            return _fuentes
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        normal = _buscar_fuente("CERTIFICADOS_FUENTE", ["Regular.ttf", "fuente.ttf"])
+        negrita = _buscar_fuente("CERTIFICADOS_FUENTE_NEGRITA", ["Bold.ttf", "fuente_negrita.ttf"])
+        _fuentes = ("Helvetica", "Helvetica-Bold")
+        if normal:
+            try:
+                pdfmetrics.registerFont(TTFont(FUENTE, normal))
+                nombre_negrita = FUENTE
+                if negrita:
+                    pdfmetrics.registerFont(TTFont(FUENTE_NEGRITA, negrita))
+                    nombre_negrita = FUENTE_NEGRITA
+                _fuentes = (FUENTE, nombre_negrita)
+                logger.info(f"Fuentes registradas: {normal}, {negrita or normal}")
+            except Exception as e:
+                logger.error(f"No se pudo registrar la fuente {normal}: {e}")
+        return _fuentes
+
+
+class ImagenPDF:
+    """Imagen decodificada (y reducida si es muy grande) una sola vez, reutilizable en cualquier canvas.
+
+    Se guarda un ImageReader con los píxeles ya leídos, y cada documento la
+    dibuja con canvas.drawImage, que la incluye una sola vez por PDF.
+    """
+
+    def __init__(self, datos, max_lado=None):
+        from PIL import Image
+        from reportlab.lib.utils import ImageReader
+
+        self.nombre = hashlib.sha1(datos).hexdigest()
+        imagen = Image.open(io.BytesIO(datos))
+        if max_lado and max(imagen.size) > max_lado:
+            imagen.thumbnail((max_lado, max_lado), Image.LANCZOS)
+        imagen.load()
+        self._lector = ImageReader(imagen)
+        # Leer los píxeles ahora, no en el primer documento (ni desde varios hilos a la vez)
+        self._lector.getRGBData()
+        self.ancho, self.alto = self._lector.getSize()
+
+    def dibujar(self, c, x, y, ancho, alto):
+        c.drawImage(self._lector, x, y, ancho, alto, mask="auto")
+
+
+def _estilo_para(texto, orden):
+    """Estilo de un cuadro de texto según su posición y contenido"""
+    mayusculas = texto.upper()
+    if orden == 0 or "INSTITUTO" in mayusculas or "CAMPUSLANDS" in mayusculas:
+        return "titulo"
+    if "HACE CONSTAR" in mayusculas:
+        return "subtitulo"
+    if any(p in texto for p in ("{{NOMBRE}}", "{{CEDULA}}", "{{HORAS}}")):
+        return "dato"
+    if "RECTOR" in mayusculas or "COORDINADOR" in mayusculas:
+        return "firma"
+    return "normal"
+
+
+def _centrado(texto, orden):
+    mayusculas = texto.upper()
+    return orden < 3 or any(p in mayusculas for p in ("INSTITUTO", "CAMPUSLANDS", "HACE CONSTAR"))
+
+
+class DisenoPresentacion:
+    """Posiciones e imágenes de una plantilla, calculadas una sola vez.
+
+    Solo depende de la geometría de las diapositivas, no del texto de una
+    fila: están todos los cuadros de texto (también los que quedan vacíos en
+    algunas filas), de arriba hacia abajo. El estilo de cada cuadro se decide
+    al dibujar, con el texto de la fila.
+    """
+
+    def __init__(self, renderizador, prs):
+        from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+        ancho_pagina, alto_pagina = renderizador.pagesize
+        ancho_slide = prs.slide_width / EMU_POR_PULGADA
+        alto_slide = prs.slide_height / EMU_POR_PULGADA
+        escala = min(ancho_pagina / ancho_slide, alto_pagina / alto_slide) * 0.9  # 90% para margen
+        self.escala = escala
+        desplazamiento_x = (ancho_pagina - ancho_slide * escala) / 2
+        desplazamiento_y = (alto_pagina - alto_slide * escala) / 2
+
+        def a_puntos(shape):
+            x = shape.left / EMU_POR_PULGADA * escala + desplazamiento_x
+            arriba = alto_pagina - (shape.top / EMU_POR_PULGADA * escala + desplazamiento_y)
+            return x, arriba, shape.width / EMU_POR_PULGADA * escala, shape.height / EMU_POR_PULGADA * escala
+
+        self.diapositivas = []
+        for slide in prs.slides:
+            imagenes, elementos = [], []
+            for shape in slide.shapes:
+                if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
+                    x, arriba, ancho, alto = a_puntos(shape)
+                    imagenes.append((renderizador.imagen(shape.image.blob), x, arriba - alto, ancho, alto))
+                elif getattr(shape, "has_text_frame", False):
+                    x, arriba, _, _ = a_puntos(shape)
+                    elementos.append((shape.shape_id, x, arriba))
+
+            # De arriba hacia abajo (orden estable para cuadros a la misma altura)
+            elementos.sort(key=lambda e: -e[2])
+            self.diapositivas.append((imagenes, elementos))
+
+
+def firma_presentacion(prs):
+    """Geometría de una presentación: igual para todas las filas de una plantilla"""
+    return (prs.slide_width, prs.slide_height) + tuple(
+        tuple((s.shape_id, s.left, s.top, s.width, s.height) for s in slide.shapes) for slide in prs.slides
+    )
+
+
+class RenderizadorPDF:
+    """Renderizador de respaldo con reportlab, reutilizable entre certificados.
+
+    Las fuentes se registran una vez, las imágenes se decodifican una vez
+    (ImagenPDF) y el diseño de cada plantilla se calcula una vez: para cada
+    fila solo se lee el texto de la presentación, se elige el estilo de cada
+    cuadro y se dibuja.
+    """
+
+    def __init__(self, pagesize=None, max_lado_imagen=2400):
+        from reportlab.lib.pagesizes import landscape, A4
+
+        self.pagesize = pagesize or landscape(A4)
+        self.max_lado_imagen = max_lado_imagen
+        self.fuente, self.fuente_negrita = registrar_fuentes()
+        self._imagenes = {}
+        self._disenos = {}
+        self._estilos_parrafo = None
+        self._lock = threading.Lock()
+
+    def imagen(self, fuente):
+        """ImagenPDF en caché a partir de bytes o de una ruta"""
+        if isinstance(fuente, (str, Path)):
+            with open(fuente, "rb") as f:
+                fuente = f.read()
+        clave = hashlib.sha1(fuente).hexdigest()
+        with self._lock:
+            imagen = self._imagenes.get(clave)
+        if imagen is None:
+            imagen = ImagenPDF(fuente, self.max_lado_imagen)
+            with self._lock:
+                imagen = self._imagenes.setdefault(clave, imagen)
+        return imagen
+
+    def diseno(self, prs):
+        firma = firma_presentacion(prs)
+        with self._lock:
+            diseno = self._disenos.get(firma)
+        if diseno is None:
+            diseno = DisenoPresentacion(self, prs)
+            with self._lock:
+                diseno = self._disenos.setdefault(firma, diseno)
+            logger.info(f"Diseño de plantilla calculado ({len(diseno.diapositivas)} diapositivas)")
+        return diseno
+
+    def _color(self, nombre):
+        from reportlab.lib import colors
+        return getattr(colors, nombre)
+
+    def pptx_a_pdf(self, pptx_path, pdf_path):
+        """Dibujar la presentación con el diseño en caché. Devuelve True si el PDF es válido"""
+        from pptx import Presentation
+        from reportlab.pdfgen import canvas
+
+        prs = Presentation(pptx_path)
+        diseno = self.diseno(prs)
+        ancho_pagina, alto_pagina = self.pagesize
+        c = canvas.Canvas(str(pdf_path), pagesize=self.pagesize)
+
+        for numero, (slide, (imagenes, elementos)) in enumerate(zip(prs.slides, diseno.diapositivas)):
+            if numero > 0:
+                c.showPage()
+            for imagen, x, y, ancho, alto in imagenes:
+                imagen.dibujar(c, x, y, ancho, alto)
+
+            textos = {shape.shape_id: shape.text.strip() for shape in slide.shapes
+                      if getattr(shape, "has_text_frame", False)}
+            # orden cuenta solo los cuadros con texto en esta fila, como antes del caché
+            orden = 0
+            for shape_id, x, arriba in elementos:
+                texto = textos.get(shape_id)
+                if not texto:
+                    continue
+                estilo, centrado = _estilo_para(texto, orden), _centrado(texto, orden)
+                orden += 1
+                negrita, tamaño, color = ESTILOS[estilo]
+                fuente = self.fuente_negrita if negrita else self.fuente
+                c.setFont(fuente, tamaño)
+                c.setFillColor(self._color(color))
+                for j, linea in enumerate(texto.split("\n")):
+                    if not linea.strip():
+                        continue
+                    y = arriba - j * 15
+                    if centrado:
+                        c.drawCentredString(ancho_pagina / 2, y, linea)
+                    else:
+                        c.drawString(x, y, linea)
+
+            # Bordes decorativos en la primera página
+            if numero == 0:
+                c.setStrokeColor(self._color("darkblue"))
+                c.setLineWidth(3)
+                c.rect(20, 20, ancho_pagina - 40, alto_pagina - 40)
+                c.setStrokeColor(self._color("navy"))
+                c.setLineWidth(1)
+                c.rect(30, 30, ancho_pagina - 60, alto_pagina - 60)
+
+        c.save()
+        return pdf_valido(pdf_path)
+
+    def imagenes_a_pdf(self, rutas, pdf_path, margen=20):
+        """Una página por imagen (por ejemplo diapositivas exportadas), centrada y escalada"""
+        from reportlab.pdfgen import canvas
+
+        ancho_pagina, alto_pagina = self.pagesize
+        c = canvas.Canvas(str(pdf_path), pagesize=self.pagesize)
+        for numero, ruta in enumerate(rutas):
+            if numero > 0:
+                c.showPage()
+            with open(ruta, "rb") as f:
+                # Cada diapositiva exportada es distinta: no se guarda en caché
+                imagen = ImagenPDF(f.read(), self.max_lado_imagen)
+            escala = min((ancho_pagina - 2 * margen) / imagen.ancho, (alto_pagina - 2 * margen) / imagen.alto)
+            ancho, alto = imagen.ancho * escala, imagen.alto * escala
+            imagen.dibujar(c, (ancho_pagina - ancho) / 2, (alto_pagina - alto) / 2, ancho, alto)
+        c.save()
+        return pdf_valido(pdf_path)
+
+    def estilos_parrafo(self):
+        """Estilos de platypus para el PDF de solo texto, creados una vez"""
+        with self._lock:
+            if self._estilos_parrafo is None:
+                from reportlab.lib.enums import TA_CENTER
+                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+                base = getSampleStyleSheet()
+                self._estilos_parrafo = (
+                    ParagraphStyle("CustomTitle", parent=base["Title"], fontName=self.fuente_negrita,
+                                   fontSize=24, spaceAfter=30, alignment=TA_CENTER, textColor="navy"),
+                    ParagraphStyle("CustomNormal", parent=base["Normal"], fontName=self.fuente,
+                                   fontSize=14, spaceAfter=12, alignment=TA_CENTER),
+                )
+            return self._estilos_parrafo
+
+    def pptx_a_pdf_texto(self, pptx_path, pdf_path):
+        """PDF básico con el texto de cada diapositiva (título y párrafos centrados)"""
+        from pptx import Presentation
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+        titulo, normal = self.estilos_parrafo()
+        story = []
+        for numero, slide in enumerate(Presentation(pptx_path).slides):
+            if numero > 0:
+                story.append(Spacer(1, 0.5 * inch))
+            textos = [shape.text.strip() for shape in slide.shapes
+                      if hasattr(shape, "text") and shape.text.strip()]
+            if textos:
+                story.append(Paragraph(textos[0], titulo))
+                for texto in textos[1:]:
+                    story.append(Paragraph(texto, normal))
+                    story.append(Spacer(1, 0.2 * inch))
+
+        SimpleDocTemplate(str(pdf_path), pagesize=A4).build(story)
+        return pdf_valido(pdf_path)
+
+
+_renderizador = None
+_renderizador_lock = threading.Lock()
+
+
+def renderizador():
+    """Renderizador compartido (fuentes, imágenes y diseños en caché)"""
+    global _renderizador
+    with _renderizador_lock:
+        if _renderizador is None:
+            _renderizador = RenderizadorPDF()
+        return _renderizador
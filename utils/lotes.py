@@ -0,0 +1,264 @@
+import os
+import uuid
+import logging
+from pathlib import Path
+from itertools import zip_longest
+
+import pandas as pd
+
+from .columnas import columna_necesaria
+from .entorno import entero_env
+from .escritura import EscritorEstado, puede_escribir_en_sitio
+from .motor import (
+    ColumnasFaltantesError,
+    normalizar_columnas,
+    pendientes_mask,
+    resolver_plantillas,
+    preparar_trabajo,
+    guardar_libro,
+    FilaEnCurso,
+    etapa_render,
+    etapa_convertir,
+    etapa_compactar,
+    etapa_registrar,
+    fila_fallida,
+)
+from .compactacion import compactacion_activada
+from .formatos import es_tabla, leer_tabla, guardar_tabla
+from .pipeline import Pipeline, Etapa
+from .planificador import planificador
+from .salidas import PlanSalidas, carpeta_en_curso, publicar
+from .trabajos import JournalHoja
+from .rutas import inicializar_com, get_downloads_folder
+from .validacion import validar_dataframe
+
+logger = logging.getLogger(__name__)
+
+
+def workers_por_defecto():
+    """Conversiones simultáneas (procesos de LibreOffice/Word en paralelo)"""
+    return entero_env("CERTIFICADOS_WORKERS", min(4, os.cpu_count() or 1))
+
+
+def hilos_render_por_defecto():
+    return entero_env("CERTIFICADOS_HILOS_RENDER", min(2, os.cpu_count() or 1))
+
+
+class SubTrabajo:
+    """Una hoja de un libro subido, procesada de forma independiente"""
+
+    def __init__(self, archivo, nombre_archivo, hoja, df):
+        self.archivo = archivo
+        self.nombre_archivo = nombre_archivo
+        self.hoja = hoja
+        self.df = df
+        self.omitir = set()
+        self.resultado = None
+
+    @property
+    def etiqueta(self):
+        return f"{self.nombre_archivo} [{self.hoja}]"
+
+
+def leer_hojas(archivo, nombre_archivo):
+    """Leer todas las hojas de un libro; las que no tienen las columnas requeridas se ignoran.
+
+    Los CSV y Parquet se leen como un libro de una sola hoja (0).
+    Devuelve (subtrabajos, errores) donde errores es {hoja: mensaje}.
+    """
+    if hasattr(archivo, "seek"):
+        archivo.seek(0)
+    if es_tabla(nombre_archivo):
+        hojas = {0: leer_tabla(archivo, nombre_archivo)}
+    else:
+        # Primero solo los encabezados, para el mensaje de una columna faltante
+        encabezados = pd.read_excel(archivo, sheet_name=None, nrows=0)
+        if hasattr(archivo, "seek"):
+            archivo.seek(0)
+        hojas = pd.read_excel(archivo, sheet_name=None, usecols=columna_necesaria)
+        for hoja, df in hojas.items():
+            df.attrs["encabezados"] = list(encabezados[hoja].columns)
+    subtrabajos, errores = [], {}
+    for hoja, df in hojas.items():
+        try:
+            subtrabajos.append(SubTrabajo(archivo, nombre_archivo, hoja, normalizar_columnas(df)))
+        except ColumnasFaltantesError as e:
+            logger.warning(f"Hoja '{hoja}' de {nombre_archivo} ignorada: {e}")
+            errores[hoja] = str(e)
+    return subtrabajos, errores
+
+
+def validar_subtrabajos(subtrabajos):
+    """Reporte de validación conjunto, con columnas archivo y hoja"""
+    reportes = []
+    for sub in subtrabajos:
+        reporte = validar_dataframe(sub.df)
+        sub.omitir = set(reporte.index)
+        reporte.insert(0, "hoja", sub.hoja)
+        reporte.insert(0, "archivo", sub.nombre_archivo)
+        reportes.append(reporte)
+    if not reportes:
+        return pd.DataFrame(columns=["archivo", "hoja", "fila", "columna", "valor", "error"])
+    return pd.concat(reportes)
+
+
+def plantillas_del_lote(subtrabajos, plantilla_path):
+    """Rutas de las plantillas que usarán las filas pendientes del lote (para id_trabajo)"""
+    rutas = {str(plantilla_path)}
+    for sub in subtrabajos:
+        df = normalizar_columnas(sub.df)
+        rutas.update(map(str, resolver_plantillas(df.loc[pendientes_mask(df)], plantilla_path).dropna()))
+    return sorted(rutas)
+
+
+def intercalar(listas):
+    """Orden round-robin: una tarea de cada lista por turno"""
+    for grupo in zip_longest(*listas):
+        for tarea in grupo:
+            if tarea is not None:
+                yield tarea
+
+
+def carpetas_lote(output_dir, en_curso, trabajo_id):
+    """(carpeta final, carpeta en curso) de un lote"""
+    if output_dir is None:
+        output_dir = get_downloads_folder() / "Certificados"
+    carpeta_final = Path(output_dir)
+    if en_curso is None:
+        en_curso = carpeta_en_curso(carpeta_final, trabajo_id or uuid.uuid4().hex)
+    os.makedirs(en_curso, exist_ok=True)
+    return carpeta_final, Path(en_curso)
+
+
+def preparar_lote(subtrabajos, plantilla_path, output_dir, journal=None, trabajo_id=None, indice=None,
+                  carpeta_final=None):
+    """Preparar las hojas de un lote para generarlas en output_dir (y publicarlas en carpeta_final).
+
+    Devuelve (escritores, listas): los libros que se actualizan en sitio y,
+    por hoja, las tareas (resultado, index, row, plantilla) por generar.
+    """
+    # Un libro actualizado por archivo subido, con todas sus hojas. Los .xlsx se
+    # parchean en sitio a medida que avanzan las filas (con puntos de control)
+    escritores = {}
+    for sub in subtrabajos:
+        if sub.nombre_archivo not in escritores and puede_escribir_en_sitio(sub.nombre_archivo):
+            destino = Path(output_dir) / Path(sub.nombre_archivo).name
+            escritores[sub.nombre_archivo] = EscritorEstado(sub.archivo, destino)
+
+    # Las rutas de salida de todas las hojas se calculan juntas, sin repetir nombres
+    plan = PlanSalidas(output_dir, carpeta_final)
+    listas = []
+    for sub in subtrabajos:
+        sub.resultado, tareas = preparar_trabajo(sub.df, plantilla_path, output_dir, sub.omitir, plan)
+        if journal is not None:
+            sub.resultado.journal = JournalHoja(journal, trabajo_id, sub.nombre_archivo, sub.hoja)
+            sub.resultado.journal.registrar([index for index, _, _ in tareas])
+        if sub.nombre_archivo in escritores:
+            sub.resultado.al_terminar_fila.append(escritores[sub.nombre_archivo].observador(sub.hoja))
+        if indice is not None:
+            sub.resultado.al_terminar_fila.append(indice.observador(trabajo_id, sub.etiqueta))
+        logger.info(f"{sub.etiqueta}: {len(tareas)} certificados por generar")
+        listas.append([(sub.resultado, *tarea) for tarea in tareas])
+    return escritores, listas
+
+
+def terminar_lote(subtrabajos, escritores, output_dir, carpeta_final, journal=None, trabajo_id=None,
+                  indice=None, entrega=None):
+    """Enviar por correo, guardar los libros y publicar un lote ya generado en output_dir"""
+    if indice is not None:
+        indice.confirmar()
+
+    # El envío va antes de guardar los libros, para que su estado quede en ellos
+    if entrega is not None:
+        def registrar_envio(sub, index, estado):
+            if sub.nombre_archivo in escritores:
+                escritores[sub.nombre_archivo].marcar(sub.hoja, index, estado, columna="envio")
+        entrega.enviar(subtrabajos, registrar_envio)
+
+    for escritor in escritores.values():
+        try:
+            escritor.guardar()
+        except Exception as e:
+            logger.error(f"Error guardando Excel: {e}")
+
+    libros = {}
+    for sub in subtrabajos:
+        if sub.nombre_archivo not in escritores:
+            libros.setdefault(sub.nombre_archivo, (sub.archivo, {}))[1][sub.hoja] = sub.resultado
+    for nombre_archivo, (archivo, resultados) in libros.items():
+        if es_tabla(nombre_archivo):
+            guardar_tabla(resultados, nombre_archivo, archivo, output_dir)
+        else:
+            guardar_libro(resultados, nombre_archivo, archivo, output_dir)
+
+    renombrados = publicar(output_dir, carpeta_final)
+    for sub in subtrabajos:
+        sub.resultado.output_dir = carpeta_final
+        archivos = {
+            index: carpeta_final / Path(archivo).relative_to(output_dir)
+            if Path(archivo).is_relative_to(output_dir) else archivo
+            for index, archivo in sub.resultado.archivos.items()
+        }
+        sub.resultado.archivos = {index: renombrados.get(archivo, archivo) for index, archivo in archivos.items()}
+    if journal is not None:
+        journal.reubicar(trabajo_id, output_dir, carpeta_final, renombrados)
+        journal.terminar(trabajo_id)
+
+    creados = sum(sub.resultado.certificados_creados for sub in subtrabajos)
+    logger.info(f"Lote completado: {len(subtrabajos)} hojas, {creados} certificados creados")
+    if compactacion_activada():
+        ahorrados = sum(sub.resultado.bytes_ahorrados for sub in subtrabajos)
+        logger.info(f"Compactación de PDF: {ahorrados / 1024:.1f} KB ahorrados en el trabajo")
+    return [sub.resultado for sub in subtrabajos]
+
+
+def procesar_lote(subtrabajos, plantilla_path, output_dir=None, workers=None, journal=None, trabajo_id=None,
+                  en_curso=None, indice=None, entrega=None, prioridad=1.0):
+    """Procesar varias hojas a la vez en un pipeline compartido.
+
+    Las filas de todas las hojas se intercalan para que ninguna espere a que
+    termine otra más grande. workers es el número de conversiones
+    simultáneas. Cada libro se guarda actualizado al final.
+    Con un Journal, el avance de cada fila queda registrado y las filas
+    terminadas en una corrida anterior no se vuelven a generar. Con un
+    IndiceEmisiones, cada certificado generado queda registrado para
+    verificarlo después. Con una Entrega, los certificados generados se
+    envían por correo y el estado de cada envío queda en la columna envio.
+
+    El render y la conversión piden turno al planificador compartido, que
+    reparte los conversores entre los lotes en curso según su prioridad
+    (peso); la espera en cola y el procesamiento quedan en resultado.planificacion.
+
+    Todo se escribe primero en la carpeta en_curso (por defecto
+    output_dir/.en_curso/<trabajo_id>) y se publica en output_dir al terminar,
+    así nunca se ve un trabajo a medias en la carpeta de salida.
+    """
+    workers = workers or workers_por_defecto()
+    carpeta_final, output_dir = carpetas_lote(output_dir, en_curso, trabajo_id)
+    escritores, listas = preparar_lote(subtrabajos, plantilla_path, output_dir, journal, trabajo_id, indice,
+                                       carpeta_final)
+    turnos = planificador().registrar(trabajo_id or output_dir.name, subtrabajos[0].nombre_archivo, prioridad)
+
+    # Render, conversión y registro se solapan; el registro (DataFrame, journal,
+    # libro) queda en un solo hilo. La compactación opcional usa tantos hilos
+    # como la conversión
+    etapas = [
+        Etapa("render", turnos.envolver("render", etapa_render), hilos_render_por_defecto()),
+        Etapa("conversion", turnos.envolver("conversion", etapa_convertir), workers, inicializar=inicializar_com),
+    ]
+    if compactacion_activada():
+        etapas.append(Etapa("compactacion", etapa_compactar, workers))
+    etapas.append(Etapa("registro", etapa_registrar, 1))
+    pipeline = Pipeline(etapas, capacidad=2 * workers, al_fallar=fila_fallida)
+    try:
+        reporte = pipeline.ejecutar(FilaEnCurso(*tarea) for tarea in intercalar(listas))
+    finally:
+        planificador().retirar(turnos)
+    nuevas = sum(len(lista) for lista in listas) - sum(sub.resultado.reutilizadas for sub in subtrabajos)
+    if journal is not None and nuevas > 0:
+        journal.registrar_rendimiento(trabajo_id, nuevas, pipeline.duracion, workers)
+    for sub in subtrabajos:
+        sub.resultado.reporte_etapas = reporte
+        sub.resultado.planificacion = turnos.estado()
+
+    return terminar_lote(subtrabajos, escritores, output_dir, carpeta_final, journal, trabajo_id, indice, entrega)
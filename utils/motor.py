@@ -0,0 +1,497 @@
+import os
+import logging
+import threading
+from pathlib import Path
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+from .compactacion import compactador
+from .columnas import resolver_columnas, faltantes, columna_necesaria
+from .escritura import EscritorEstado, puede_escribir_en_sitio
+from .plantillas import registro
+from .trabajos import RENDERIZADO, CONVERTIDO, FALLIDO
+from .rutas import get_downloads_folder, com_thread
+from .salidas import PlanSalidas
+from .validacion import pendientes_mask, parse_fechas
+
+logger = logging.getLogger(__name__)
+
+MESES = {
+    "01": "Enero", "02": "Febrero", "03": "Marzo",
+    "04": "Abril", "05": "Mayo", "06": "Junio",
+    "07": "Julio", "08": "Agosto", "09": "Septiembre",
+    "10": "Octubre", "11": "Noviembre", "12": "Diciembre"
+}
+
+# Nombres de plantilla buscados, en orden de preferencia
+PLANTILLAS_POR_DEFECTO = {
+    "docx": ["plantilla_final.docx", "plantilla.docx"],
+    "pptx": ["plantilla_final.pptx", "plantilla.pptx"],
+}
+
+
+class ColumnasFaltantesError(ValueError):
+    """El Excel no tiene alguna de las columnas requeridas"""
+
+
+class ResultadoProceso:
+    """Resumen de una ejecución del motor"""
+
+    def __init__(self, df, output_dir):
+        self.df = df
+        self.output_dir = output_dir
+        self.certificados_por_compania = defaultdict(list)
+        self.certificados_creados = 0
+        self.errores = {}
+        self.generadas = []
+        self.pendientes = int(pendientes_mask(df).sum())
+        self.lock = threading.Lock()
+        # Callbacks (resultado, index, row, archivo, error) al terminar cada fila;
+        # archivo es None si la fila falló
+        self.al_terminar_fila = []
+        # JournalHoja opcional para poder reanudar el trabajo
+        self.journal = None
+        # Utilización por etapa del pipeline (ver procesar_lote)
+        self.reporte_etapas = []
+        # {index: (documento, pdf)} precalculado por preparar_trabajo
+        self.rutas = {}
+        # Bytes ahorrados por la compactación de PDF (ver etapa_compactar)
+        self.bytes_ahorrados = 0
+        # Filas cuyo PDF se reutilizó de una corrida anterior
+        self.reutilizadas = 0
+        # {index: archivo} de las filas generadas
+        self.archivos = {}
+        # Filas por estado del envío por correo (ver Entrega.enviar)
+        self.envios = Counter()
+        # Espera en cola y procesamiento por recurso (ver Planificador)
+        self.planificacion = {}
+
+    def notificar(self, index, row, archivo=None, error=None):
+        for callback in self.al_terminar_fila:
+            try:
+                callback(self, index, row, archivo, error)
+            except Exception as e:
+                logger.error(f"Error registrando el estado de la fila {index}: {e}")
+
+
+def buscar_plantilla(nombre):
+    """Buscar una plantilla por nombre de archivo. Devuelve None si no existe"""
+    return registro.buscar(nombre)
+
+
+def get_plantilla_path(tipo="docx"):
+    """Buscar la plantilla por defecto del tipo indicado"""
+    nombres = PLANTILLAS_POR_DEFECTO[tipo]
+    for nombre in nombres:
+        path = buscar_plantilla(nombre)
+        if path:
+            return path
+
+    raise FileNotFoundError(f"No se encontró {nombres[-1]} en ninguna ubicación")
+
+
+def texto_numero(valor):
+    """20.0 -> "20"; vacío -> "" """
+    if pd.isna(valor) or str(valor).strip() == "":
+        return ""
+    try:
+        numero = float(valor)
+        return str(int(numero)) if numero.is_integer() else str(numero)
+    except (TypeError, ValueError):
+        return str(valor).strip()
+
+
+def candidatos_plantilla(plantilla, horas, extension):
+    """Nombres de archivo a probar para una fila, del más al menos específico"""
+    nombres = []
+    if plantilla:
+        if Path(plantilla).suffix:
+            nombres.append(plantilla)
+        else:
+            nombres += [f"{plantilla}{extension}", f"plantilla_{plantilla}{extension}"]
+    if horas:
+        nombres += [f"plantilla_{horas}h{extension}", f"plantilla_{horas}_horas{extension}"]
+    return nombres
+
+
+def resolver_plantillas(df, plantilla_por_defecto):
+    """Ruta de plantilla para cada fila según las columnas 'plantilla' y 'horas'.
+
+    La búsqueda en disco se hace una vez por combinación distinta, no por fila.
+    Las filas que piden una plantilla explícita inexistente quedan en None.
+    """
+    extension = Path(plantilla_por_defecto).suffix
+    if "plantilla" in df.columns:
+        plantilla = df["plantilla"].fillna("").astype(str).str.strip()
+    else:
+        plantilla = pd.Series("", index=df.index)
+    horas = df["horas"].map(texto_numero) if "horas" in df.columns else pd.Series("", index=df.index)
+    claves = list(zip(plantilla, horas))
+
+    resueltas = {}
+    for clave in dict.fromkeys(claves):
+        nombre_plantilla, texto_horas = clave
+        path = None
+        for nombre in candidatos_plantilla(nombre_plantilla, texto_horas, extension):
+            path = buscar_plantilla(nombre)
+            if path:
+                break
+        if path is None and nombre_plantilla:
+            logger.error(f"No se encontró la plantilla '{nombre_plantilla}'")
+        elif path is None:
+            path = plantilla_por_defecto
+        resueltas[clave] = path
+
+    return pd.Series([resueltas[clave] for clave in claves], index=df.index, dtype=object)
+
+
+def normalizar_columnas(df):
+    """Renombrar las columnas del Excel a los nombres estándar.
+
+    Si se leyó solo con las columnas reconocidas, df.attrs["encabezados"]
+    guarda los encabezados originales de la hoja, que son los que se muestran
+    cuando falta una columna (el encabezado mal escrito es justo el que no se leyó).
+    """
+    column_mapping = resolver_columnas(df.columns)
+    faltan = faltantes(column_mapping)
+    if faltan:
+        disponibles = [str(c) for c in df.attrs.get("encabezados", df.columns)]
+        raise ColumnasFaltantesError(
+            f"No se encontró la columna '{faltan[0]}' en el Excel. Columnas disponibles: {disponibles}"
+        )
+    return df.rename(columns=column_mapping)
+
+
+def leer_excel(archivo):
+    """Leer solo las columnas que usa el motor; el resto de la hoja se ignora"""
+    encabezados = list(pd.read_excel(archivo, nrows=0).columns)
+    if hasattr(archivo, "seek"):
+        archivo.seek(0)
+    df = pd.read_excel(archivo, usecols=columna_necesaria)
+    df.attrs["encabezados"] = encabezados
+    return df
+
+
+def certificado_code(id_form, item):
+    if pd.notna(id_form) and id_form != "" and pd.notna(item) and item != "":
+        try:
+            return f"{int(id_form):04d}-{int(item):04d}"
+        except Exception:
+            return f"{id_form}-{item}"
+    return ""
+
+
+def build_context(row):
+    """Preparar el contexto de la plantilla para una fila"""
+    fecha = row["fecha"] if not pd.isna(row["fecha"]) else None
+    if fecha is not None and not hasattr(fecha, "strftime"):
+        fecha = parse_fechas(pd.Series([fecha])).iloc[0]
+        fecha = None if pd.isna(fecha) else fecha
+    if fecha:
+        dia = fecha.strftime("%d")
+        mes = MESES[fecha.strftime("%m")]
+        año = fecha.strftime("%Y")
+    else:
+        dia = mes = año = ""
+
+    return {
+        "NOMBRE": str(row["nombre"]),
+        "CEDULA": str(row["cedula"]),
+        "DIA": dia,
+        "MES": mes,
+        "AÑO": año,
+        "COMPANIA": str(row["compañia"]),
+        "HORAS": str(row.get("horas", "")),
+        "CERTIFICADO": certificado_code(row.get("id_formacion", ""), row.get("item", "")),
+        # Usados por plantilla_final.pptx
+        "ID_FORM": texto_numero(row.get("id_formacion", "")),
+        "ITEM": texto_numero(row.get("item", "")),
+    }
+
+
+def preparar_trabajo(df, plantilla_path, output_dir=None, omitir=None, plan=None):
+    """Normalizar, resolver plantillas y armar la lista de filas a generar.
+
+    Devuelve (resultado, tareas); cada tarea es (index, row, plantilla) y las
+    tareas quedan agrupadas por plantilla. Las rutas de salida de todas las
+    filas se calculan aquí (resultado.rutas) con el PlanSalidas del trabajo,
+    compartido entre hojas para que los nombres no se repitan. Ver
+    procesar_dataframe.
+    """
+    df = normalizar_columnas(df)
+
+    if output_dir is None:
+        output_dir = get_downloads_folder() / "Certificados"
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"Carpeta de salida: {output_dir}")
+
+    resultado = ResultadoProceso(df, output_dir)
+    if not resultado.pendientes:
+        return resultado, []
+
+    pendientes = df.loc[pendientes_mask(df)]
+    if omitir:
+        pendientes = pendientes.drop(index=list(omitir), errors="ignore")
+        logger.info(f"Se omiten {len(omitir)} filas con errores de validación")
+    plantillas_por_fila = resolver_plantillas(pendientes, plantilla_path)
+
+    # Tomar cada plantilla referenciada del registro una sola vez al inicio del trabajo
+    plantillas = {}
+    for path in plantillas_por_fila.dropna().unique():
+        plantillas[path] = registro.obtener(path)
+        logger.info(f"Plantilla cargada: {path}")
+
+    for index in plantillas_por_fila.index[plantillas_por_fila.isna()]:
+        resultado.errores[index] = "Plantilla no encontrada"
+
+    con_plantilla = plantillas_por_fila.dropna()
+    if plan is None:
+        plan = PlanSalidas(output_dir)
+    extensiones = con_plantilla.map(lambda path: plantillas[path].backend.extension)
+    resultado.rutas = plan.asignar(pendientes.loc[con_plantilla.index], extensiones)
+
+    # Filas agrupadas por plantilla
+    tareas = []
+    for path, grupo in pendientes.groupby(plantillas_por_fila, sort=False):
+        plantilla = plantillas[path]
+        logger.info(f"{len(grupo)} certificados con {plantilla.nombre}")
+        tareas += [(index, row, plantilla) for index, row in grupo.iterrows()]
+    return resultado, tareas
+
+
+class FilaEnCurso:
+    """Estado de una fila mientras pasa por las etapas render -> conversión -> registro"""
+
+    def __init__(self, resultado, index, row, plantilla):
+        self.resultado = resultado
+        self.index = index
+        self.row = row
+        self.plantilla = plantilla
+        self.doc_file = None
+        self.pdf_file = None
+        self.archivo = None  # archivo final, si la fila ya está resuelta
+        self.convertido = False
+        self.error = None
+
+    @property
+    def terminada(self):
+        return self.archivo is not None or self.error is not None
+
+
+def fila_fallida(fila, error):
+    """Fila en la que una etapa lanzó una excepción: sigue hasta el registro como fallida"""
+    fila.error = str(error) or type(error).__name__
+    return fila
+
+
+def etapa_render(fila):
+    """Renderizar el documento, o reutilizar lo hecho en una corrida anterior"""
+    resultado, index, row = fila.resultado, fila.index, fila.row
+    journal = resultado.journal
+    try:
+        estado, salida = journal.previo(index) if journal else (None, None)
+        if estado == CONVERTIDO and salida and Path(salida).exists():
+            logger.info(f"Reutilizando certificado ya generado: {salida}")
+            fila.archivo = Path(salida)
+            fila.convertido = True
+            with resultado.lock:
+                resultado.reutilizadas += 1
+            return fila
+
+        fila.doc_file, fila.pdf_file = resultado.rutas[index]
+        if estado == RENDERIZADO and salida and Path(salida).exists():
+            fila.doc_file = Path(salida)
+        else:
+            logger.info(f"Procesando certificado para: {row['nombre']}")
+            fila.plantilla.render(build_context(row), fila.doc_file)
+            if journal:
+                journal.marcar(index, RENDERIZADO, fila.doc_file)
+    except Exception as e:
+        fila.error = str(e)
+    return fila
+
+
+def etapa_convertir(fila):
+    if fila.terminada:
+        return fila
+    try:
+        fila.convertido = fila.plantilla.backend.convert(fila.doc_file, fila.pdf_file)
+    except Exception as e:
+        fila.error = str(e)
+    return fila
+
+
+def etapa_compactar(fila):
+    """Compactar el PDF recién convertido (etapa opcional, CERTIFICADOS_COMPACTAR)"""
+    if fila.terminada or not fila.convertido:
+        return fila
+    try:
+        antes, despues = compactador().compactar(fila.pdf_file)
+        with fila.resultado.lock:
+            fila.resultado.bytes_ahorrados += antes - despues
+    except Exception as e:
+        # Un PDF sin compactar sigue siendo válido
+        logger.error(f"Error compactando {fila.pdf_file}: {e}")
+    return fila
+
+
+def es_pdf(path):
+    """Si path es un PDF no vacío (empieza con la cabecera %PDF-)"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(5) == b"%PDF-"
+    except (OSError, TypeError):
+        return False
+
+
+def etapa_registrar(fila):
+    """Borrar el intermedio y registrar el resultado en el DataFrame, el journal y los callbacks.
+
+    Solo una fila con PDF válido queda con certificado = "si"; si la conversión
+    falla se conserva el documento, pero la fila queda fallida (y pendiente en
+    el libro) igual que en el journal.
+    """
+    resultado, index, row = fila.resultado, fila.index, fila.row
+    journal = resultado.journal
+    try:
+        if fila.error is None and fila.archivo is None:
+            if fila.convertido and es_pdf(fila.pdf_file):
+                os.remove(fila.doc_file)
+                fila.archivo = fila.pdf_file
+                if journal:
+                    journal.marcar(index, CONVERTIDO, fila.archivo)
+                    journal.descartar_documento_previo(index)
+            else:
+                # Mantener el documento si falla la conversión a PDF
+                logger.info(f"Manteniendo archivo {fila.plantilla.backend.nombre}: {fila.doc_file}")
+                fila.error = "No se pudo convertir a PDF"
+    except Exception as e:
+        fila.error = str(e)
+
+    if fila.error is not None:
+        logger.error(f"Error procesando fila {index}: {fila.error}")
+        with resultado.lock:
+            resultado.errores[index] = fila.error
+        if journal:
+            # El journal guarda el documento que quedó, para reemplazarlo al reanudar
+            conservado = fila.doc_file if fila.doc_file is not None and Path(fila.doc_file).exists() else None
+            journal.marcar(index, FALLIDO, conservado, fila.error)
+        resultado.notificar(index, row, error=fila.error)
+        return False
+
+    with resultado.lock:
+        # Actualizar DataFrame
+        resultado.df.at[index, "certificado"] = "si"
+        resultado.generadas.append(index)
+        resultado.archivos[index] = fila.archivo
+        resultado.certificados_por_compania[row["compañia"]].append(fila.archivo.name)
+        resultado.certificados_creados += 1
+    resultado.notificar(index, row, archivo=fila.archivo)
+    return True
+
+
+def ejecutar_tarea(resultado, index, row, plantilla):
+    """Generar el certificado de una fila y registrar el resultado.
+
+    Con un journal (resultado.journal), las filas ya convertidas en una
+    corrida anterior reutilizan su PDF y el avance queda registrado.
+    """
+    fila = FilaEnCurso(resultado, index, row, plantilla)
+    return etapa_registrar(etapa_convertir(etapa_render(fila)))
+
+
+def procesar_dataframe(df, plantilla_path, output_dir=None, omitir=None, escritor=None):
+    """Generar los certificados pendientes de un DataFrame ya leído del Excel.
+
+    plantilla_path es la plantilla por defecto; cada fila puede elegir otra
+    con las columnas 'plantilla' u 'horas' (ver resolver_plantillas).
+    omitir es un conjunto de índices que no se procesan (por ejemplo las
+    filas rechazadas por validar_dataframe); quedan con certificado = "no".
+    Con un EscritorEstado, el estado de cada fila se va guardando en el libro
+    original mientras avanza el trabajo.
+    """
+    resultado, tareas = preparar_trabajo(df, plantilla_path, output_dir, omitir)
+    if escritor is not None:
+        resultado.al_terminar_fila.append(escritor.observador(0))
+
+    with com_thread():
+        for tarea in tareas:
+            ejecutar_tarea(resultado, *tarea)
+
+    if escritor is not None:
+        escritor.guardar()
+
+    logger.info(f"Procesamiento completado. Certificados creados: {resultado.certificados_creados}")
+    return resultado
+
+
+def _actualizar_certificado(original, df):
+    """Copiar la columna certificado de df sobre la hoja original completa.
+
+    Si el trabajo envió correos también se copia la columna envio (se agrega
+    al final si la hoja no la tenía).
+    """
+    mapping = resolver_columnas(original.columns)
+    columna = next(c for c, std in mapping.items() if std == "certificado")
+    original[columna] = df["certificado"].reindex(original.index).fillna(original[columna])
+    if "envio" in df.columns:
+        columna = next((c for c, std in mapping.items() if std == "envio"), "envio")
+        envio = df["envio"].reindex(original.index)
+        original[columna] = envio.fillna(original[columna]) if columna in original.columns else envio
+    return original
+
+
+def guardar_excel(resultado, excel_filename, origen=None):
+    """Guardar el Excel actualizado en la carpeta de salida con el mismo nombre.
+
+    Si se indica el archivo de origen, se conservan todas sus columnas (también
+    las que no se leyeron) y solo se actualiza la columna certificado.
+    """
+    if origen is not None and puede_escribir_en_sitio(excel_filename):
+        try:
+            escritor = EscritorEstado(origen, resultado.output_dir / Path(excel_filename).name)
+            for index in resultado.generadas:
+                escritor.marcar(0, index)
+            return escritor.guardar()
+        except Exception as e:
+            logger.error(f"Error guardando Excel: {e}")
+            return None
+    if origen is not None:
+        return guardar_libro({0: resultado}, excel_filename, origen, resultado.output_dir)
+    try:
+        original_name = Path(excel_filename).name
+        excel_actualizado = resultado.output_dir / original_name
+        resultado.df.to_excel(excel_actualizado, index=False)
+        logger.info(f"Excel actualizado guardado: {excel_actualizado}")
+        return excel_actualizado
+    except Exception as e:
+        logger.error(f"Error guardando Excel: {e}")
+        return None
+
+
+def guardar_libro(resultados, excel_filename, origen, output_dir):
+    """Guardar un libro con varias hojas procesadas.
+
+    resultados es {hoja: ResultadoProceso}; la hoja puede indicarse por
+    nombre o por posición. Las hojas no procesadas se copian sin cambios.
+    """
+    try:
+        if hasattr(origen, "seek"):
+            origen.seek(0)
+        hojas = pd.read_excel(origen, sheet_name=None)
+        nombres = list(hojas)
+        for hoja, resultado in resultados.items():
+            nombre = nombres[hoja] if isinstance(hoja, int) else hoja
+            hojas[nombre] = _actualizar_certificado(hojas[nombre], resultado.df)
+
+        excel_actualizado = Path(output_dir) / Path(excel_filename).name
+        with pd.ExcelWriter(excel_actualizado) as writer:
+            for nombre, df in hojas.items():
+                df.to_excel(writer, sheet_name=nombre, index=False)
+        logger.info(f"Excel actualizado guardado: {excel_actualizado}")
+        return excel_actualizado
+    except Exception as e:
+        logger.error(f"Error guardando Excel: {e}")
+        return None
@@ -0,0 +1,116 @@
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_FIN = object()
+
+
+class Etapa:
+    """Una etapa del pipeline: una función aplicada por un número fijo de hilos"""
+
+    def __init__(self, nombre, funcion, hilos=1, inicializar=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.hilos = max(1, int(hilos))
+        self.inicializar = inicializar
+        self.procesados = 0
+        self.ocupado = 0.0  # segundos trabajando, sumando todos los hilos
+        self.bloqueado = 0.0  # segundos esperando lugar en la cola siguiente
+        self._lock = threading.Lock()
+        self._terminados = 0
+
+    def reporte(self, duracion):
+        capacidad = duracion * self.hilos
+        return {
+            "etapa": self.nombre,
+            "hilos": self.hilos,
+            "procesados": self.procesados,
+            "utilizacion": round(self.ocupado / capacidad, 3) if capacidad else 0.0,
+            "espera_cola_siguiente": round(self.bloqueado, 3),
+        }
+
+
+class Pipeline:
+    """Etapas encadenadas por colas acotadas.
+
+    Cada etapa corre en sus propios hilos, de modo que el renderizado (CPU) y la
+    conversión (procesos externos) se solapan. Las colas tienen tamaño máximo:
+    si una etapa se atrasa, las anteriores se detienen en lugar de acumular
+    documentos en memoria.
+
+    Si la función de una etapa lanza una excepción, al_fallar(item, excepción)
+    da el item que sigue a la etapa siguiente (marcado como fallido), para que
+    el fallo llegue al registro; sin al_fallar el item se descarta.
+    """
+
+    def __init__(self, etapas, capacidad=8, al_fallar=None):
+        self.etapas = etapas
+        self.al_fallar = al_fallar
+        self.colas = [queue.Queue(maxsize=capacidad) for _ in etapas]
+        self.duracion = 0.0
+
+    def _trabajar(self, i):
+        etapa = self.etapas[i]
+        entrada = self.colas[i]
+        salida = self.colas[i + 1] if i + 1 < len(self.etapas) else None
+        if etapa.inicializar is not None:
+            etapa.inicializar()
+
+        while True:
+            item = entrada.get()
+            if item is _FIN:
+                break
+            inicio = time.perf_counter()
+            try:
+                resultado = etapa.funcion(item)
+            except Exception as e:
+                # Las funciones de etapa manejan sus errores; esto es solo una red de seguridad
+                logger.error(f"Error no controlado en etapa {etapa.nombre}: {e}")
+                resultado = self.al_fallar(item, e) if self.al_fallar is not None else None
+            fin = time.perf_counter()
+            with etapa._lock:
+                etapa.procesados += 1
+                etapa.ocupado += fin - inicio
+            if salida is not None and resultado is not None:
+                salida.put(resultado)
+                with etapa._lock:
+                    etapa.bloqueado += time.perf_counter() - fin
+
+        # El último hilo en terminar avisa a la etapa siguiente
+        with etapa._lock:
+            etapa._terminados += 1
+            ultimo = etapa._terminados == etapa.hilos
+        if ultimo and salida is not None:
+            for _ in range(self.etapas[i + 1].hilos):
+                salida.put(_FIN)
+
+    def ejecutar(self, items):
+        """Procesar todos los items y devolver el reporte de utilización por etapa"""
+        inicio = time.perf_counter()
+        hilos = []
+        for i, etapa in enumerate(self.etapas):
+            for n in range(etapa.hilos):
+                hilo = threading.Thread(target=self._trabajar, args=(i,),
+                                        name=f"{etapa.nombre}-{n}", daemon=True)
+                hilo.start()
+                hilos.append(hilo)
+
+        for item in items:
+            self.colas[0].put(item)
+        for _ in range(self.etapas[0].hilos):
+            self.colas[0].put(_FIN)
+
+        for hilo in hilos:
+            hilo.join()
+        self.duracion = time.perf_counter() - inicio
+
+        reporte = [etapa.reporte(self.duracion) for etapa in self.etapas]
+        for linea in reporte:
+            logger.info(
+                f"Etapa {linea['etapa']}: {linea['procesados']} items, {linea['hilos']} hilos, "
+                f"utilización {linea['utilizacion']:.0%}, espera {linea['espera_cola_siguiente']}s"
+            )
+        return reporte
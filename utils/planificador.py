@@ -0,0 +1,261 @@
+import time
+import logging
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class TrabajoPlanificado:
+    """Un trabajo registrado en el Planificador: su peso, si está pausado y sus tiempos.
+
+    Por recurso se acumulan las filas atendidas, los segundos que esperaron
+    turno en la cola y los segundos de procesamiento (sumando todos los hilos).
+    """
+
+    def __init__(self, planificador, trabajo_id, nombre="", peso=1.0):
+        self.planificador = planificador
+        self.trabajo_id = trabajo_id
+        self.nombre = nombre
+        self.peso = peso
+        self.pausado = False
+        self.inicio = time.time()
+        self.filas = Counter()
+        self.espera = Counter()
+        self.proceso = Counter()
+        self.en_curso = Counter()
+        self._esperando = {recurso: deque() for recurso in planificador.plazas}
+        self._final = dict.fromkeys(planificador.plazas, 0.0)
+        self._usos = 0
+
+    @contextmanager
+    def turno(self, recurso):
+        """Esperar turno en recurso, ejecutar el bloque y liberar el turno"""
+        llegada = time.perf_counter()
+        self.planificador._esperar(self, recurso)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            fin = time.perf_counter()
+            self.planificador._liberar(self, recurso, inicio - llegada, fin - inicio)
+
+    def envolver(self, recurso, funcion):
+        """La función de una Etapa, ejecutada con un turno de recurso"""
+        def con_turno(item):
+            with self.turno(recurso):
+                return funcion(item)
+        return con_turno
+
+    def estado(self):
+        return {
+            "trabajo": self.trabajo_id,
+            "nombre": self.nombre,
+            "peso": self.peso,
+            "pausado": self.pausado,
+            "inicio": self.inicio,
+            "filas": dict(self.filas),
+            "en_curso": dict(self.en_curso),
+            "esperando": {recurso: len(cola) for recurso, cola in self._esperando.items()},
+            "espera_cola_s": {recurso: round(s, 3) for recurso, s in self.espera.items()},
+            "procesamiento_s": {recurso: round(s, 3) for recurso, s in self.proceso.items()},
+        }
+
+    def resumen(self):
+        """Una línea para el log: espera en cola y procesamiento por recurso"""
+        partes = [
+            f"{recurso} {self.filas[recurso]} filas, espera {self.espera[recurso]:.1f}s, "
+            f"procesamiento {self.proceso[recurso]:.1f}s"
+            for recurso in self.planificador.plazas if self.filas[recurso]
+        ]
+        return f"Trabajo {self.trabajo_id}: " + "; ".join(partes or ["sin filas"])
+
+
+class Planificador:
+    """Turnos de render y conversión repartidos entre los trabajos en curso.
+
+    Cada trabajo conserva su propio pipeline, pero sus hilos de render y de
+    conversión piden un turno antes de cada fila. Hay un número fijo de turnos
+    por recurso para todos los trabajos juntos, y cuando se libera uno se le da
+    al trabajo que va más atrasado según su peso (weighted fair queuing, con
+    etiquetas de inicio): cada fila atendida adelanta el reloj virtual del
+    trabajo en 1/peso. Un trabajo recién llegado empieza en el reloj virtual
+    actual, así que una corrección de 5 filas se atiende en cuanto llega
+    aunque haya un lote de 20 000 en curso. Un trabajo con peso 3 recibe tres
+    veces más turnos que uno con peso 1; uno pausado no recibe turnos (sus
+    filas en curso terminan) hasta que se reanuda.
+    """
+
+    def __init__(self, plazas):
+        self.plazas = dict(plazas)
+        self._libres = dict(self.plazas)
+        self._virtual = dict.fromkeys(self.plazas, 0.0)
+        self._trabajos = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, trabajo_id, nombre="", peso=1.0):
+        """Registrar un trabajo (o volver a usar el que tiene el mismo id)"""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None:
+                trabajo = TrabajoPlanificado(self, trabajo_id, nombre, max(float(peso), 0.01))
+                self._trabajos[trabajo_id] = trabajo
+            trabajo._usos += 1
+            return trabajo
+
+    def retirar(self, trabajo):
+        with self._lock:
+            trabajo._usos -= 1
+            if trabajo._usos <= 0 and self._trabajos.get(trabajo.trabajo_id) is trabajo:
+                del self._trabajos[trabajo.trabajo_id]
+        logger.info(trabajo.resumen())
+
+    def trabajo(self, trabajo_id):
+        with self._lock:
+            return self._trabajos.get(trabajo_id)
+
+    def cambiar_peso(self, trabajo_id, peso):
+        """Cambiar la prioridad de un trabajo en curso; devuelve el trabajo, o None si no está en curso"""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None:
+                return None
+            trabajo.peso = max(float(peso), 0.01)
+            self._despachar_todo()
+        logger.info(f"Trabajo {trabajo_id}: prioridad {trabajo.peso}")
+        return trabajo
+
+    def pausar(self, trabajo_id, pausado=True):
+        """Pausar (o reanudar) un trabajo en curso; devuelve el trabajo, o None si no está en curso"""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None:
+                return None
+            trabajo.pausado = pausado
+            self._despachar_todo()
+        logger.info(f"Trabajo {trabajo_id}: {'pausado' if pausado else 'reanudado'}")
+        return trabajo
+
+    def reanudar(self, trabajo_id):
+        return self.pausar(trabajo_id, pausado=False)
+
+    def estado(self):
+        with self._lock:
+            return {
+                "plazas": dict(self.plazas),
+                "libres": dict(self._libres),
+                "trabajos": [trabajo.estado() for trabajo in self._trabajos.values()],
+            }
+
+    def _esperar(self, trabajo, recurso):
+        turno = threading.Event()
+        with self._lock:
+            trabajo._esperando[recurso].append(turno)
+            self._despachar(recurso)
+        turno.wait()
+
+    def _liberar(self, trabajo, recurso, espera, proceso):
+        with self._lock:
+            trabajo.en_curso[recurso] -= 1
+            trabajo.filas[recurso] += 1
+            trabajo.espera[recurso] += espera
+            trabajo.proceso[recurso] += proceso
+            self._libres[recurso] += 1
+            self._despachar(recurso)
+
+    def _despachar_todo(self):
+        for recurso in self.plazas:
+            self._despachar(recurso)
+
+    def _despachar(self, recurso):
+        """Dar los turnos libres de recurso, por etiqueta de inicio (con el lock tomado)"""
+        while self._libres[recurso] > 0:
+            candidatos = [
+                (max(self._virtual[recurso], trabajo._final[recurso]), orden, trabajo)
+                for orden, trabajo in enumerate(self._trabajos.values())
+                if trabajo._esperando[recurso] and not trabajo.pausado
+            ]
+            if not candidatos:
+                return
+            inicio, _, trabajo = min(candidatos, key=lambda c: c[:2])
+            self._virtual[recurso] = inicio
+            trabajo._final[recurso] = inicio + 1.0 / trabajo.peso
+            trabajo.en_curso[recurso] += 1
+            self._libres[recurso] -= 1
+            trabajo._esperando[recurso].popleft().set()
+
+
+class Admision:
+    """Lotes que se generan a la vez; los demás esperan en cola en lugar de rechazarse.
+
+    Cuando se libera un lugar entra el lote con menos filas por generar, así
+    una corrección de pocas filas no queda detrás de dos lotes grandes en
+    espera. Un lote que ya esperó más de espera_maxima segundos pasa adelante
+    (por orden de llegada), para que los grandes no esperen para siempre.
+    Dentro del lote, el Planificador reparte los turnos de render y conversión.
+    """
+
+    def __init__(self, plazas, espera_maxima=30.0):
+        self.plazas = max(int(plazas), 1)
+        self.espera_maxima = espera_maxima
+        self._en_curso = 0
+        self._esperando = []
+        self._llegadas = 0
+        self._condicion = threading.Condition()
+
+    def _siguiente(self):
+        ahora = time.monotonic()
+        vencidos = [e for e in self._esperando if ahora - e[1] >= self.espera_maxima]
+        if vencidos:
+            return min(vencidos, key=lambda e: e[2])
+        return min(self._esperando)
+
+    @contextmanager
+    def turno(self, filas):
+        """Esperar un lugar para un lote de filas, ejecutar el bloque y liberarlo"""
+        with self._condicion:
+            self._llegadas += 1
+            espera = (filas, time.monotonic(), self._llegadas)
+            self._esperando.append(espera)
+            if self._en_curso >= self.plazas:
+                logger.info(f"Lote de {filas} filas en cola: {self._en_curso} lotes en curso")
+            # Se revisa cada segundo para adelantar a los que llevan esperando demasiado
+            while self._en_curso >= self.plazas or self._siguiente() is not espera:
+                self._condicion.wait(timeout=1.0)
+            self._esperando.remove(espera)
+            self._en_curso += 1
+            # Puede quedar otro lugar libre para el siguiente de la cola
+            self._condicion.notify_all()
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._en_curso -= 1
+                self._condicion.notify_all()
+
+    def estado(self):
+        with self._condicion:
+            return {"plazas": self.plazas, "en_curso": self._en_curso, "esperando": len(self._esperando)}
+
+
+_planificador = None
+_planificador_lock = threading.Lock()
+
+
+def planificador():
+    """Planificador compartido por todos los lotes locales del proceso.
+
+    Los turnos de conversión son los procesos simultáneos del orquestador, así
+    el planificador decide quién usa los conversores en lugar de la cola FIFO
+    del orquestador.
+    """
+    global _planificador
+    # Import diferido: lotes usa este módulo
+    from .lotes import hilos_render_por_defecto
+    from .conversor import limite_por_defecto
+
+    with _planificador_lock:
+        if _planificador is None:
+            _planificador = Planificador({"render": hilos_render_por_defecto(), "conversion": limite_por_defecto()})
+        return _planificador
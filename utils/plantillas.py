@@ -0,0 +1,123 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+
+from .backends import BACKENDS, backend_for
+from .rutas import resource_path, get_downloads_folder
+
+logger = logging.getLogger(__name__)
+
+
+def directorios_plantillas():
+    return [
+        Path(resource_path(".")),  # Empaquetada con exe
+        Path.cwd(),  # Directorio de trabajo
+        get_downloads_folder() / "certificados",  # En carpeta certificados
+    ]
+
+
+class RegistroPlantillas:
+    """Índice de plantillas disponibles con su contenido cargado en memoria.
+
+    Los directorios se recorren una sola vez (o al pedir un nombre que no está
+    en el índice, como mucho cada ``intervalo_escaneo`` segundos). Cada
+    plantilla se lee del disco la primera vez que se usa y se recarga solo si
+    cambia su fecha de modificación.
+    """
+
+    def __init__(self, directorios=None, intervalo_escaneo=5.0, intervalo_stat=1.0):
+        self._directorios = directorios
+        self.intervalo_escaneo = intervalo_escaneo
+        self.intervalo_stat = intervalo_stat
+        self._indice = {}
+        self._cargadas = {}
+        self._verificadas = {}
+        self._ultimo_escaneo = None
+        self._lock = threading.RLock()
+
+    @property
+    def directorios(self):
+        if self._directorios is None:
+            return directorios_plantillas()
+        return [Path(d) for d in self._directorios]
+
+    def escanear(self):
+        """Recorrer los directorios configurados y rehacer el índice nombre -> ruta"""
+        indice = {}
+        for directorio in self.directorios:
+            try:
+                archivos = sorted(directorio.iterdir())
+            except OSError:
+                continue
+            for path in archivos:
+                if path.suffix.lower() in BACKENDS and not path.name.startswith("~$"):
+                    # El primer directorio de la lista tiene prioridad
+                    indice.setdefault(path.name, str(path))
+        with self._lock:
+            self._indice = indice
+            self._ultimo_escaneo = time.monotonic()
+        logger.info(f"Plantillas disponibles: {sorted(indice)}")
+        return indice
+
+    def buscar(self, nombre):
+        """Ruta de la plantilla con ese nombre de archivo, o None si no existe"""
+        with self._lock:
+            if self._ultimo_escaneo is None:
+                self.escanear()
+            path = self._indice.get(nombre)
+            if path is None and time.monotonic() - self._ultimo_escaneo > self.intervalo_escaneo:
+                path = self.escanear().get(nombre)
+            return path
+
+    def obtener(self, path):
+        """Plantilla cargada en memoria, recargándola si cambió en disco"""
+        path = str(path)
+        with self._lock:
+            cargada = self._cargadas.get(path)
+            ahora = time.monotonic()
+            if cargada is not None and ahora - self._verificadas.get(path, 0) < self.intervalo_stat:
+                return cargada
+
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self._cargadas.pop(path, None)
+                self._indice = {n: p for n, p in self._indice.items() if p != path}
+                raise
+
+            if cargada is None or cargada.mtime != mtime:
+                if cargada is not None:
+                    logger.info(f"Plantilla modificada, recargando: {path}")
+                cargada = backend_for(path).load(path)
+                self._cargadas[path] = cargada
+            self._verificadas[path] = ahora
+            return cargada
+
+    def listar(self):
+        """Resumen de las plantillas disponibles para mostrar en la interfaz"""
+        with self._lock:
+            if self._ultimo_escaneo is None:
+                self.escanear()
+            indice = dict(self._indice)
+
+        resumen = []
+        for nombre, path in sorted(indice.items()):
+            try:
+                plantilla = self.obtener(path)
+            except Exception as e:
+                logger.error(f"Error cargando plantilla {path}: {e}")
+                continue
+            resumen.append({
+                "nombre": nombre,
+                "ruta": plantilla.path,
+                "tipo": plantilla.backend.nombre,
+                "placeholders": plantilla.placeholders,
+                "cargada_en": plantilla.cargada_en.isoformat(timespec="seconds"),
+            })
+        return resumen
+
+
+# Registro compartido por el motor y la interfaz web
+registro = RegistroPlantillas()
@@ -0,0 +1,454 @@
+import os
+import subprocess
+import logging
+import threading
+from pptx import Presentation
+
+from .conversor import orquestador
+from .rutas import ON_WINDOWS, perfil_libreoffice
+
+logger = logging.getLogger(__name__)
+
+# funciones para manejo de PPTX y PDF
+
+def safe_filename(s: str) -> str:
+    keep = (" ", ".", "_", "-")
+    return "".join(c for c in s if c.isalnum() or c in keep).rstrip()
+
+def build_placeholder_map(context: dict) -> dict:
+    mapping = {}
+    for k, v in context.items():
+        vstr = "" if v is None else str(v)
+        mapping[f"{{{{{k.upper()}}}}}"] = vstr
+        mapping[f"{{{{{k.lower()}}}}}"] = vstr
+        mapping[k.upper()] = vstr
+        mapping[k.lower()] = vstr
+    return mapping
+
+def replace_placeholders_in_presentation(prs: Presentation, mapping: dict):
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if not hasattr(shape, "text"):
+                continue
+            try:
+                tf = shape.text_frame
+            except Exception:
+                continue
+
+            for paragraph in tf.paragraphs:
+                for run in paragraph.runs:
+                    orig = run.text or ""
+                    new = orig
+                    for ph, val in mapping.items():
+                        if ph in new:
+                            new = new.replace(ph, val)
+                    if new != orig:
+                        run.text = new
+
+def render_pptx_template(template_path, context: dict, out_pptx_path: str):
+    """template_path puede ser una ruta o un flujo en memoria con la plantilla"""
+    logger.info(f"Renderizando PPTX: {getattr(template_path, 'name', 'plantilla en memoria')} -> {out_pptx_path}")
+    prs = Presentation(template_path)
+    mapping = build_placeholder_map(context)
+    replace_placeholders_in_presentation(prs, mapping)
+    prs.save(out_pptx_path)
+
+
+def convert_pptx_to_pdf_powerpoint_fixed(pptx_path: str, pdf_path: str) -> bool:
+    """
+    Versión mejorada de conversión con PowerPoint COM
+    """
+    if not ON_WINDOWS:
+        logger.error("Conversión con PowerPoint solo disponible en Windows.")
+        return False
+
+    try:
+        import win32com.client
+        import pythoncom
+        
+        logger.info(f"Iniciando conversión con PowerPoint: {pptx_path} -> {pdf_path}")
+
+        # Inicializar COM
+        pythoncom.CoInitialize()
+        
+        # Rutas absolutas
+        pptx_path_abs = os.path.abspath(pptx_path)
+        pdf_path_abs = os.path.abspath(pdf_path)
+        
+        if not os.path.exists(pptx_path_abs):
+            logger.error(f"Archivo PPTX no encontrado: {pptx_path_abs}")
+            return False
+        
+        # Crear aplicación PowerPoint
+        ppt_app = win32com.client.Dispatch("PowerPoint.Application")
+        
+        # Minimizar ventana en lugar de ocultarla completamente
+        ppt_app.Visible = 1
+        ppt_app.WindowState = 2  # Minimized
+        
+        logger.info(f"Abriendo presentación: {pptx_path_abs}")
+        presentation = ppt_app.Presentations.Open(
+            pptx_path_abs,
+            ReadOnly=1,
+            Untitled=1,
+            WithWindow=0
+        )
+        
+        logger.info(f"Exportando a PDF: {pdf_path_abs}")
+        
+        # Usar ExportAsFixedFormat con parámetros optimizados
+        presentation.ExportAsFixedFormat(
+            pdf_path_abs,
+            2,  # ppFixedFormatTypePDF
+            Intent=1,  # ppFixedFormatIntentPrint - Para impresión de calidad
+            FrameSlides=0,  # No enmarcar slides
+            HandoutOrder=1,
+            OutputType=2,  # ppPrintOutputSlides
+            PrintHiddenSlides=0,
+            PrintRange=None,
+            RangeType=1,  # ppPrintAll
+            SlideShowName="",
+            IncludeDocProps=1,
+            KeepIRMSettings=1,
+            DocStructureTags=1,
+            BitmapMissingFonts=1,
+            UseDocumentICCProfile=0
+        )
+        
+        # Cerrar y limpiar
+        presentation.Close()
+        ppt_app.Quit()
+        
+        # Liberar recursos COM
+        del presentation
+        del ppt_app
+        pythoncom.CoUninitialize()
+        
+        # Verificar resultado
+        if os.path.exists(pdf_path_abs) and os.path.getsize(pdf_path_abs) > 1000:  # Al menos 1KB
+            logger.info(f"PDF generado exitosamente: {pdf_path_abs} ({os.path.getsize(pdf_path_abs)} bytes)")
+            return True
+        else:
+            logger.error("PowerPoint no generó PDF válido")
+            return False
+
+    except Exception as e:
+        logger.error(f"Error en conversión PowerPoint: {str(e)}")
+        try:
+            if 'presentation' in locals():
+                presentation.Close()
+            if 'ppt_app' in locals():
+                ppt_app.Quit()
+            pythoncom.CoUninitialize()
+        except:
+            pass
+        return False
+
+
+def convert_pptx_to_pdf_advanced_python(pptx_path: str, pdf_path: str) -> bool:
+    """
+    Conversión avanzada usando python-pptx + reportlab
+    Intenta mantener el formato visual lo mejor posible. Usa el renderizador
+    compartido: fuentes, imágenes y diseño de la plantilla se preparan una vez
+    """
+    try:
+        from .lienzo import renderizador
+
+        logger.info(f"Conversión avanzada Python: {pptx_path} -> {pdf_path}")
+        if renderizador().pptx_a_pdf(pptx_path, pdf_path):
+            logger.info(f"PDF avanzado generado: {pdf_path} ({os.path.getsize(pdf_path)} bytes)")
+            return True
+        logger.error("No se generó PDF válido con método avanzado")
+        return False
+
+    except ImportError as e:
+        logger.error(f"Librerías no disponibles: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Error en conversión avanzada Python: {str(e)}")
+        return False
+
+
+# Ubicaciones posibles de LibreOffice, en orden
+POSIBLES_SOFFICE = [
+    "soffice",
+    r"C:\Program Files\LibreOffice\program\soffice.exe",
+    r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
+]
+
+_soffice = None
+_soffice_lock = threading.Lock()
+
+
+def buscar_soffice():
+    """Ruta de un LibreOffice que responde, o None. Se prueba una sola vez por proceso"""
+    global _soffice
+    with _soffice_lock:
+        if _soffice is None:
+            _soffice = ""
+            for path in POSIBLES_SOFFICE:
+                if not (os.path.exists(path) or path == "soffice"):
+                    continue
+                try:
+                    if orquestador().ejecutar([path, "--version"], timeout=10).returncode == 0:
+                        _soffice = path
+                        break
+                except (subprocess.TimeoutExpired, OSError):
+                    continue
+        return _soffice or None
+
+
+def convert_pptx_to_pdf_libreoffice(pptx_path: str, output_dir: str) -> bool:
+
+    """
+    Conversión usando LibreOffice (multiplataforma)
+    """
+    try:
+        pptx_path_abs = os.path.abspath(pptx_path)
+        output_dir_abs = os.path.abspath(output_dir)
+        
+        soffice_path = buscar_soffice()
+        if not soffice_path:
+            logger.error("LibreOffice no encontrado")
+            return False
+        
+        cmd = [
+            soffice_path,
+            perfil_libreoffice(),
+            "--headless",
+            "--convert-to", "pdf",
+            "--outdir", output_dir_abs,
+            pptx_path_abs
+        ]
+        
+        logger.info(f"Ejecutando LibreOffice: {' '.join(cmd)}")
+        result = orquestador().ejecutar(cmd, timeout=60)
+        
+        if result.returncode == 0:
+            base_name = os.path.splitext(os.path.basename(pptx_path))[0]
+            expected_pdf = os.path.join(output_dir_abs, f"{base_name}.pdf")
+            
+            if os.path.exists(expected_pdf) and os.path.getsize(expected_pdf) > 0:
+                logger.info(f"PDF generado con LibreOffice: {expected_pdf}")
+                return True
+                
+        logger.error(f"LibreOffice falló: {result.stderr.decode(errors='replace')}")
+        return False
+            
+    except Exception as e:
+        logger.error(f"Error con LibreOffice: {str(e)}")
+        return False
+
+
+def convert_pptx_to_pdf_with_preview(pptx_path: str, pdf_path: str) -> bool:
+    """
+    Método usando pillow para convertir slides a imágenes y luego a PDF
+    Mantiene exactamente el formato visual
+    """
+    try:
+        # Este método requiere que PowerPoint genere imágenes primero
+        import win32com.client
+        from .lienzo import renderizador
+        import tempfile
+        import shutil
+        
+        logger.info(f"Conversión con preview: {pptx_path} -> {pdf_path}")
+        
+        # Crear directorio temporal
+        temp_dir = tempfile.mkdtemp()
+        
+        try:
+            # Abrir PowerPoint y exportar como imágenes
+            ppt_app = win32com.client.Dispatch("PowerPoint.Application")
+            ppt_app.Visible = 1
+            ppt_app.WindowState = 2  # Minimized
+            
+            presentation = ppt_app.Presentations.Open(os.path.abspath(pptx_path))
+            
+            # Exportar cada slide como imagen
+            imagenes = []
+            for i in range(1, presentation.Slides.Count + 1):
+                img_path = os.path.join(temp_dir, f"slide_{i}.png")
+                presentation.Slides(i).Export(img_path, "PNG", 1920, 1080)  # Alta resolución
+                if os.path.exists(img_path):
+                    imagenes.append(img_path)
+            
+            presentation.Close()
+            ppt_app.Quit()
+            
+            # Crear PDF desde las imágenes
+            valido = renderizador().imagenes_a_pdf(imagenes, pdf_path)
+            
+            # Limpiar archivos temporales
+            shutil.rmtree(temp_dir)
+            
+            if valido:
+                logger.info(f"PDF con preview generado: {pdf_path}")
+                return True
+            return False
+                
+        except Exception as e:
+            logger.error(f"Error en conversión con preview: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return False
+            
+    except ImportError:
+        logger.error("Librerías para preview no disponibles (pillow)")
+        return False
+    except Exception as e:
+        logger.error(f"Error general en preview: {e}")
+        return False
+
+
+
+def convert_pptx_to_pdf_python_libs(pptx_path: str, pdf_path: str) -> bool:
+    """
+    Conversión usando librerías de Python (python-pptx + reportlab)
+    Este método es más básico pero no requiere software adicional
+    """
+    try:
+        from .lienzo import renderizador
+        
+        logger.info(f"Convirtiendo a PDF con librerías Python: {pptx_path} -> {pdf_path}")
+        
+        if renderizador().pptx_a_pdf_texto(pptx_path, pdf_path):
+            logger.info(f"PDF generado con librerías Python: {pdf_path}")
+            return True
+        else:
+            logger.error("No se pudo generar PDF con librerías Python")
+            return False
+            
+    except ImportError as e:
+        logger.error(f"Librerías no disponibles para conversión Python: {e}")
+        logger.error("Instala con: pip install reportlab")
+        return False
+    except Exception as e:
+        logger.error(f"Error en conversión con librerías Python: {str(e)}")
+        return False
+
+
+def convert_pptx_to_pdf_robust(pptx_path: str, pdf_path: str) -> bool:
+    """
+    Función principal que intenta todos los métodos disponibles
+    """
+    logger.info(f"Iniciando conversión robusta: {pptx_path} -> {pdf_path}")
+    
+    # Método 1: PowerPoint COM (Windows con Office)
+    if ON_WINDOWS:
+        logger.info("Intentando conversión con PowerPoint COM...")
+        if convert_pptx_to_pdf_powerpoint_fixed(pptx_path, pdf_path):
+            return True
+        logger.warning("PowerPoint COM falló, probando siguiente método...")
+    
+    # Método 2: LibreOffice
+    logger.info("Intentando conversión con LibreOffice...")
+    output_dir = os.path.dirname(pdf_path)
+    if convert_pptx_to_pdf_libreoffice(pptx_path, output_dir):
+        # LibreOffice genera el PDF con nombre base del PPTX
+        base_name = os.path.splitext(os.path.basename(pptx_path))[0]
+        generated_pdf = os.path.join(output_dir, f"{base_name}.pdf")
+        
+        if generated_pdf != pdf_path and os.path.exists(generated_pdf):
+            try:
+                if os.path.exists(pdf_path):
+                    os.remove(pdf_path)
+                os.rename(generated_pdf, pdf_path)
+                logger.info(f"PDF renombrado: {generated_pdf} -> {pdf_path}")
+            except Exception as e:
+                logger.error(f"Error renombrando PDF: {e}")
+                return False
+        return True
+    
+    logger.warning("LibreOffice falló, probando último método...")
+    
+    # Método 3: Librerías Python (básico pero funcional)
+    logger.info("Intentando conversión con librerías Python...")
+    if convert_pptx_to_pdf_python_libs(pptx_path, pdf_path):
+        return True
+    
+    logger.error("Todos los métodos de conversión fallaron")
+    return False
+
+
+def convert_pptx_to_pdf_ultimate(pptx_path: str, pdf_path: str) -> bool:
+    """
+    Función principal que intenta todos los métodos, priorizando calidad visual
+    """
+    logger.info(f"=== CONVERSIÓN DEFINITIVA ===")
+    logger.info(f"PPTX: {pptx_path}")
+    logger.info(f"PDF: {pdf_path}")
+    
+    # Método 1: PowerPoint COM mejorado (mejor calidad)
+    if ON_WINDOWS:
+        logger.info("🔄 Método 1: PowerPoint COM mejorado")
+        if convert_pptx_to_pdf_powerpoint_fixed(pptx_path, pdf_path):
+            logger.info("✅ PowerPoint COM exitoso")
+            return True
+        logger.warning("❌ PowerPoint COM falló")
+    
+    # Método 2: PowerPoint con preview (calidad perfecta)
+    if ON_WINDOWS:
+        logger.info("🔄 Método 2: PowerPoint con preview")
+        if convert_pptx_to_pdf_with_preview(pptx_path, pdf_path):
+            logger.info("✅ PowerPoint preview exitoso")
+            return True
+        logger.warning("❌ PowerPoint preview falló")
+    
+    # Método 3: LibreOffice (buena calidad, multiplataforma)
+    logger.info("🔄 Método 3: LibreOffice")
+    output_dir = os.path.dirname(pdf_path)
+    if convert_pptx_to_pdf_libreoffice(pptx_path, output_dir):
+        base_name = os.path.splitext(os.path.basename(pptx_path))[0]
+        generated_pdf = os.path.join(output_dir, f"{base_name}.pdf")
+        
+        if generated_pdf != pdf_path and os.path.exists(generated_pdf):
+            try:
+                if os.path.exists(pdf_path):
+                    os.remove(pdf_path)
+                os.rename(generated_pdf, pdf_path)
+                logger.info("✅ LibreOffice exitoso")
+                return True
+            except Exception as e:
+                logger.error(f"Error renombrando: {e}")
+        elif os.path.exists(generated_pdf):
+            logger.info("✅ LibreOffice exitoso")
+            return True
+    logger.warning("❌ LibreOffice falló")
+    
+    # Método 4: Python avanzado (respaldo mejorado)
+    logger.info("🔄 Método 4: Python avanzado")
+    if convert_pptx_to_pdf_advanced_python(pptx_path, pdf_path):
+        logger.info("✅ Python avanzado exitoso")
+        return True
+    logger.warning("❌ Python avanzado falló")
+    
+    logger.error("💥 TODOS LOS MÉTODOS FALLARON")
+    return False
+
+# Función auxiliar para instalar dependencias si es necesario
+def install_pdf_dependencies():
+    """
+    Instala las dependencias necesarias para la conversión a PDF
+    """
+    try:
+        import subprocess
+        import sys
+        
+        # Instalar reportlab si no está disponible
+        try:
+            import reportlab
+        except ImportError:
+            logger.info("Instalando reportlab...")
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "reportlab"])
+            
+        # Instalar pywin32 si estamos en Windows
+        if ON_WINDOWS:
+            try:
+                import win32com.client
+            except ImportError:
+                logger.info("Instalando pywin32...")
+                subprocess.check_call([sys.executable, "-m", "pip", "install", "pywin32"])
+                
+    except Exception as e:
+        logger.error(f"Error instalando dependencias: {e}")
+
@@ -0,0 +1,102 @@
+import os
+import platform
+import subprocess
+import sys
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Detectar sistema operativo
+ON_WINDOWS = platform.system() == "Windows"
+
+
+# Configuración para PyInstaller
+def resource_path(relative_path):
+    """Obtener ruta absoluta de recursos, funciona tanto en desarrollo como en .exe"""
+    try:
+        # PyInstaller crea una carpeta temporal y almacena la ruta en _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+
+    return os.path.join(base_path, relative_path)
+
+
+def get_downloads_folder():
+    try:
+        home = Path.home()
+        downloads = home / "Downloads"
+        if not downloads.exists():
+            downloads = home / "Descargas"  # Para sistemas en español
+            if not downloads.exists():
+                downloads = home
+        return downloads
+    except Exception as e:
+        logger.error(f"Error obteniendo carpeta de descargas: {e}")
+        return Path.cwd()
+
+
+def get_config_folder():
+    """Carpeta de configuración del usuario (fuera de las carpetas de salida compartidas)"""
+    if ON_WINDOWS:
+        base = Path(os.environ.get("APPDATA") or Path.home() / "AppData" / "Roaming")
+    elif platform.system() == "Darwin":
+        base = Path.home() / "Library" / "Application Support"
+    else:
+        base = Path(os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config")
+    carpeta = Path(os.environ.get("CERTIFICADOS_CONFIG") or base / "Certificados")
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def open_folder(path):
+    """Abrir la carpeta de salida en el explorador del sistema"""
+    try:
+        if ON_WINDOWS:
+            os.startfile(str(path))
+        elif platform.system() == "Darwin":  # Mac
+            subprocess.run(["open", str(path)])
+        else:  # Linux
+            subprocess.run(["xdg-open", str(path)])
+    except Exception as e:
+        logger.error(f"No se pudo abrir automáticamente la carpeta: {e}")
+
+
+@contextmanager
+def com_thread():
+    """Inicializar COM en el hilo actual (solo Windows) mientras dure el bloque"""
+    pythoncom = None
+    if ON_WINDOWS:
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+        except Exception:
+            pass  # Ya está inicializado o no disponible
+    try:
+        yield
+    finally:
+        if pythoncom is not None:
+            try:
+                pythoncom.CoUninitialize()
+            except Exception:
+                pass
+
+
+def inicializar_com():
+    """Inicializador de hilos del pool: COM debe inicializarse en cada hilo (Windows)"""
+    if ON_WINDOWS:
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+        except Exception:
+            pass
+
+
+def perfil_libreoffice():
+    """Argumento de perfil propio por hilo; dos soffice con el mismo perfil no pueden correr a la vez"""
+    perfil = Path(tempfile.gettempdir()) / "certificados_lo" / f"hilo_{threading.get_ident()}"
+    return f"-env:UserInstallation={perfil.as_uri()}"
@@ -0,0 +1,202 @@
+import os
+import shutil
+import logging
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Caracteres que Windows no admite en nombres de carpeta
+_INVALIDOS_CARPETA = r'[<>:"|?*\x00-\x1f]'
+
+
+def _como_texto(serie):
+    """Valores de una columna como texto: 123.0 -> "123", NaN -> "".
+
+    Los valores que ya son texto no se tocan ("01234" conserva el cero).
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        numeros = serie
+    else:
+        numeros = pd.to_numeric(serie.mask(serie.map(type).eq(str)), errors="coerce")
+    enteros = numeros.notna() & (numeros % 1 == 0)
+    texto = serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+    texto[enteros] = numeros[enteros].astype("int64").astype(str)
+    return texto
+
+
+def sanitizar(serie):
+    """Texto apto para nombre de archivo: espacios -> "_", solo letras, dígitos, "_" y "-" """
+    return (
+        _como_texto(serie)
+        .str.replace(r"\s+", "_", regex=True)
+        # Filtro por carácter: en las cadenas de pyarrow \w solo cubre ASCII y se perderían tildes y ñ
+        .map(lambda texto: "".join(c for c in texto if c.isalnum() or c in "_-"))
+    )
+
+
+def sanitizar_carpeta(serie):
+    """Nombre de la subcarpeta por compañía (mismo formato de siempre: espacios y "/" -> "_")"""
+    return (
+        _como_texto(serie)
+        .str.replace(r"[\s/\\]", "_", regex=True)
+        .str.replace(_INVALIDOS_CARPETA, "", regex=True)
+        .str.rstrip(". ")
+        .replace("", "sin_compania")
+    )
+
+
+def nombres_base(df):
+    """Nombre de archivo (sin extensión) de cada fila.
+
+    Incluye la cédula (o el código de certificado si no hay cédula) para que
+    dos personas con el mismo nombre y horas no compartan archivo.
+    """
+    if "horas" in df.columns:
+        horas = sanitizar(df["horas"]).replace("", "general")
+    else:
+        horas = pd.Series("general", index=df.index)
+    base = "certificado_0" + horas + "_horas_" + sanitizar(df["nombre"])
+
+    ident = sanitizar(df["cedula"])
+    if "id_formacion" in df.columns and "item" in df.columns:
+        codigo = sanitizar(df["id_formacion"]) + "-" + sanitizar(df["item"])
+        ident = ident.where(ident != "", codigo.where(codigo != "-", ""))
+    return base.where(ident == "", base + "_" + ident)
+
+
+# Nombres reservados por los trabajos en curso de este proceso, por carpeta
+# definitiva: {carpeta final: {carpeta en curso: {(compañía, nombre)}}}
+_reservas = {}
+_reservas_lock = threading.Lock()
+
+
+def _clave(carpeta):
+    return os.path.normcase(os.path.abspath(carpeta))
+
+
+class PlanSalidas:
+    """Rutas de salida de todas las filas de un trabajo, calculadas antes de empezar.
+
+    Un mismo plan se comparte entre las hojas de un lote: los nombres no se
+    repiten dentro del trabajo (se agrega _2, _3... si hace falta) y cada
+    carpeta de compañía se crea una sola vez. Tampoco se repiten los nombres
+    que ya existen en la carpeta final ni los reservados por otro trabajo en
+    curso hacia la misma carpeta, así un trabajo nunca pisa los certificados
+    de otro al publicarse.
+    """
+
+    def __init__(self, raiz, final=None):
+        self.raiz = Path(raiz)
+        self.final = Path(final) if final is not None else self.raiz
+        self._usados = set()
+        self._carpetas = set()
+        self._lock = threading.Lock()
+
+    def _ocupado(self, carpeta, nombre, extension, ajenos):
+        if (carpeta, nombre.casefold()) in self._usados or (carpeta, nombre.casefold()) in ajenos:
+            return True
+        destino = self.final / carpeta
+        return (destino / f"{nombre}{extension}").exists() or (destino / f"{nombre}.pdf").exists()
+
+    def asignar(self, df, extensiones):
+        """{index: (documento, pdf)} para las filas de df.
+
+        extensiones es una Serie con la extensión del documento intermedio
+        de cada fila (según su plantilla).
+        """
+        carpetas = sanitizar_carpeta(df["compañia"])
+        bases = nombres_base(df)
+
+        rutas = {}
+        with self._lock, _reservas_lock:
+            for carpeta in carpetas.unique():
+                if carpeta not in self._carpetas:
+                    os.makedirs(self.raiz / carpeta, exist_ok=True)
+                    self._carpetas.add(carpeta)
+
+            reservas = _reservas.setdefault(_clave(self.final), {})
+            ajenos = set().union(*(
+                nombres for raiz, nombres in reservas.items() if raiz != _clave(self.raiz)
+            ))
+            for index, carpeta, base, extension in zip(df.index, carpetas, bases, extensiones.reindex(df.index)):
+                # Sin distinguir mayúsculas, como en Windows
+                nombre, n = base, 2
+                while self._ocupado(carpeta, nombre, extension, ajenos):
+                    nombre, n = f"{base}_{n}", n + 1
+                self._usados.add((carpeta, nombre.casefold()))
+                destino = self.raiz / carpeta
+                rutas[index] = (destino / f"{nombre}{extension}", destino / f"{nombre}.pdf")
+            if self.final != self.raiz:
+                reservas[_clave(self.raiz)] = set(self._usados)
+        return rutas
+
+
+def carpeta_en_curso(output_dir, trabajo_id):
+    """Carpeta temporal donde se escribe un trabajo hasta publicarlo"""
+    return Path(output_dir) / ".en_curso" / trabajo_id
+
+
+def _mover_sin_pisar(origen, destino):
+    """Mover origen a destino solo si destino no existe (FileExistsError si existe).
+
+    os.link falla si el destino ya existe, así la comprobación y la creación
+    son una sola operación; donde no hay enlaces duros se copia a un archivo
+    abierto con O_EXCL.
+    """
+    try:
+        os.link(origen, destino)
+    except FileExistsError:
+        raise
+    except OSError:
+        with open(origen, "rb") as leer, open(os.open(destino, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644), "wb") as escribir:
+            shutil.copyfileobj(leer, escribir)
+        shutil.copystat(origen, destino)
+    os.unlink(origen)
+
+
+def publicar(origen, destino):
+    """Mover el resultado de un trabajo a su carpeta definitiva sin pisar archivos.
+
+    Si el destino no existe se renombra la carpeta entera (una sola operación
+    atómica); si ya existe, cada archivo se mueve sin reemplazar los que ya
+    están: si el nombre está tomado (otro trabajo lo publicó entretanto) se
+    publica como nombre_2, nombre_3... Devuelve {ruta prevista: ruta real}
+    de los archivos que cambiaron de nombre.
+    """
+    origen, destino = Path(origen), Path(destino)
+    renombrados = {}
+    if not origen.is_dir():
+        return renombrados
+
+    if not destino.exists():
+        os.makedirs(destino.parent, exist_ok=True)
+        try:
+            os.rename(origen, destino)
+        except OSError:
+            # Otro trabajo creó el destino entretanto: se publica archivo por archivo
+            pass
+    if origen.exists():
+        for carpeta, _, archivos in os.walk(origen):
+            relativa = Path(carpeta).relative_to(origen)
+            os.makedirs(destino / relativa, exist_ok=True)
+            for archivo in archivos:
+                prevista = destino / relativa / archivo
+                final, n = prevista, 2
+                while True:
+                    try:
+                        _mover_sin_pisar(Path(carpeta) / archivo, final)
+                        break
+                    except FileExistsError:
+                        final, n = prevista.with_name(f"{prevista.stem}_{n}{prevista.suffix}"), n + 1
+                if final != prevista:
+                    logger.warning(f"{prevista} ya existe; publicado como {final.name}")
+                    renombrados[prevista] = final
+        shutil.rmtree(origen, ignore_errors=True)
+
+    with _reservas_lock:
+        _reservas.get(_clave(destino), {}).pop(_clave(origen), None)
+    logger.info(f"Trabajo publicado en {destino}")
+    return renombrados
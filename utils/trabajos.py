@@ -0,0 +1,350 @@
+import os
+import json
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Estados de una fila en el journal
+PENDIENTE = "pendiente"
+RENDERIZADO = "renderizado"
+CONVERTIDO = "convertido"
+FALLIDO = "fallido"
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    creado TEXT NOT NULL,
+    actualizado TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    plantilla TEXT,
+    fuentes TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS filas (
+    trabajo_id TEXT NOT NULL,
+    archivo TEXT NOT NULL,
+    hoja TEXT NOT NULL,
+    indice INTEGER NOT NULL,
+    estado TEXT NOT NULL,
+    salida TEXT,
+    error TEXT,
+    envio TEXT,
+    actualizado TEXT NOT NULL,
+    PRIMARY KEY (trabajo_id, archivo, hoja, indice)
+);
+CREATE TABLE IF NOT EXISTS rendimiento (
+    trabajo_id TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    filas INTEGER NOT NULL,
+    segundos REAL NOT NULL,
+    workers INTEGER
+);
+"""
+
+
+def _ahora():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def id_trabajo(archivos, plantillas=()):
+    """Identificador estable a partir del contenido de los archivos subidos y de las plantillas.
+
+    Volver a subir los mismos archivos después de una caída da el mismo id, y
+    así el trabajo se reanuda en lugar de empezar de cero. Si se edita o se
+    cambia alguna plantilla el id cambia, para no reutilizar PDF generados
+    con la plantilla anterior.
+    """
+    h = hashlib.sha1()
+    for plantilla in sorted(map(str, plantillas)):
+        h.update(plantilla.encode("utf-8"))
+        with open(plantilla, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+    for nombre, archivo in sorted(archivos, key=lambda a: a[0]):
+        h.update(Path(nombre).name.encode("utf-8"))
+        if hasattr(archivo, "read"):
+            archivo.seek(0)
+            for bloque in iter(lambda: archivo.read(1 << 20), b""):
+                h.update(bloque)
+            archivo.seek(0)
+        else:
+            with open(archivo, "rb") as f:
+                for bloque in iter(lambda: f.read(1 << 20), b""):
+                    h.update(bloque)
+    return h.hexdigest()[:16]
+
+
+class Journal:
+    """Registro durable del avance de cada fila, en SQLite dentro de la carpeta de salida"""
+
+    NOMBRE = "trabajos.sqlite3"
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.path = self.output_dir / self.NOMBRE
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.executescript(ESQUEMA)
+        # Journals creados antes de que existiera el envío por correo
+        columnas = {fila[1] for fila in self._con.execute("PRAGMA table_info(filas)")}
+        if "envio" not in columnas:
+            self._con.execute("ALTER TABLE filas ADD COLUMN envio TEXT")
+
+    def carpeta_fuentes(self, trabajo_id):
+        return self.output_dir / ".trabajos" / trabajo_id
+
+    def iniciar(self, trabajo_id, archivos, plantilla_path):
+        """Crear el trabajo o reanudarlo si ya existía. Devuelve las rutas de los archivos fuente.
+
+        Los archivos se copian a la carpeta del trabajo para poder reanudarlo
+        más tarde sin que el usuario tenga que volver a subirlos. Las copias
+        se borran cuando el trabajo se completa; si se vuelve a subir, se
+        copian de nuevo.
+        """
+        with self._lock:
+            fila = self._con.execute("SELECT fuentes FROM trabajos WHERE id = ?", (trabajo_id,)).fetchone()
+            if fila:
+                self._con.execute(
+                    "UPDATE trabajos SET estado = 'en_proceso', actualizado = ? WHERE id = ?",
+                    (_ahora(), trabajo_id),
+                )
+                self._con.commit()
+                logger.info(f"Reanudando trabajo {trabajo_id}")
+                fuentes = [Path(p) for p in json.loads(fila[0])]
+                if all(p.exists() for p in fuentes):
+                    return fuentes
+
+        carpeta = self.carpeta_fuentes(trabajo_id)
+        os.makedirs(carpeta, exist_ok=True)
+        fuentes = []
+        for nombre, archivo in archivos:
+            destino = carpeta / Path(nombre).name
+            if hasattr(archivo, "read"):
+                archivo.seek(0)
+                with open(destino, "wb") as f:
+                    shutil.copyfileobj(archivo, f)
+                archivo.seek(0)
+            elif Path(archivo) != destino:
+                shutil.copyfile(archivo, destino)
+            fuentes.append(destino)
+
+        with self._lock:
+            if fila:
+                self._con.execute(
+                    "UPDATE trabajos SET fuentes = ? WHERE id = ?", (json.dumps([str(p) for p in fuentes]), trabajo_id)
+                )
+            else:
+                self._con.execute(
+                    "INSERT INTO trabajos (id, creado, actualizado, estado, plantilla, fuentes) VALUES (?, ?, ?, 'en_proceso', ?, ?)",
+                    (trabajo_id, _ahora(), _ahora(), str(plantilla_path), json.dumps([str(p) for p in fuentes])),
+                )
+            self._con.commit()
+        if not fila:
+            logger.info(f"Trabajo nuevo {trabajo_id}")
+        return fuentes
+
+    def registrar_filas(self, trabajo_id, archivo, hoja, indices):
+        """Registrar como pendientes las filas que aún no están en el journal"""
+        ahora = _ahora()
+        with self._lock:
+            self._con.executemany(
+                "INSERT OR IGNORE INTO filas (trabajo_id, archivo, hoja, indice, estado, actualizado) VALUES (?, ?, ?, ?, ?, ?)",
+                [(trabajo_id, archivo, str(hoja), int(i), PENDIENTE, ahora) for i in indices],
+            )
+            self._con.commit()
+
+    def estados(self, trabajo_id, archivo, hoja):
+        """{indice: (estado, salida)} de las filas de una hoja"""
+        with self._lock:
+            filas = self._con.execute(
+                "SELECT indice, estado, salida FROM filas WHERE trabajo_id = ? AND archivo = ? AND hoja = ?",
+                (trabajo_id, archivo, str(hoja)),
+            ).fetchall()
+        return {indice: (estado, salida) for indice, estado, salida in filas}
+
+    def actualizar(self, trabajo_id, archivo, hoja, indice, estado, salida=None, error=None):
+        with self._lock:
+            self._con.execute(
+                "UPDATE filas SET estado = ?, salida = ?, error = ?, actualizado = ? "
+                "WHERE trabajo_id = ? AND archivo = ? AND hoja = ? AND indice = ?",
+                (estado, None if salida is None else str(salida), error, _ahora(),
+                 trabajo_id, archivo, str(hoja), int(indice)),
+            )
+            self._con.commit()
+
+    def envios(self, trabajo_id, archivo, hoja):
+        """{indice: estado del envío por correo} de las filas de una hoja que ya tienen uno"""
+        with self._lock:
+            filas = self._con.execute(
+                "SELECT indice, envio FROM filas WHERE trabajo_id = ? AND archivo = ? AND hoja = ? AND envio IS NOT NULL",
+                (trabajo_id, archivo, str(hoja)),
+            ).fetchall()
+        return dict(filas)
+
+    def actualizar_envio(self, trabajo_id, archivo, hoja, indice, envio):
+        with self._lock:
+            self._con.execute(
+                "UPDATE filas SET envio = ?, actualizado = ? "
+                "WHERE trabajo_id = ? AND archivo = ? AND hoja = ? AND indice = ?",
+                (envio, _ahora(), trabajo_id, archivo, str(hoja), int(indice)),
+            )
+            self._con.commit()
+
+    def reubicar(self, trabajo_id, origen, destino, renombrados=None):
+        """Actualizar las rutas de salida de un trabajo después de publicarlo.
+
+        renombrados es {ruta prevista: ruta real} de los archivos que publicar
+        tuvo que renombrar para no pisar otros.
+        """
+        origen, destino = str(Path(origen)), str(Path(destino))
+        renombrados = {str(prevista): str(real) for prevista, real in (renombrados or {}).items()}
+        with self._lock:
+            filas = self._con.execute(
+                "SELECT archivo, hoja, indice, salida FROM filas WHERE trabajo_id = ? AND salida LIKE ?",
+                (trabajo_id, origen + "%"),
+            ).fetchall()
+            self._con.executemany(
+                "UPDATE filas SET salida = ? WHERE trabajo_id = ? AND archivo = ? AND hoja = ? AND indice = ?",
+                [(renombrados.get(destino + salida[len(origen):], destino + salida[len(origen):]),
+                  trabajo_id, archivo, hoja, indice)
+                 for archivo, hoja, indice, salida in filas if salida.startswith(origen)],
+            )
+            self._con.commit()
+
+    def terminar(self, trabajo_id):
+        """Marcar el trabajo como completado, o incompleto si quedan filas pendientes o fallidas.
+
+        Un trabajo incompleto se puede reanudar (POST /jobs/<id>/resume); al
+        completarse se borran las copias de los archivos subidos.
+        """
+        resumen = self.resumen(trabajo_id)
+        faltan = any(resumen["filas"].get(estado) for estado in (PENDIENTE, RENDERIZADO, FALLIDO))
+        estado = "incompleto" if faltan else "completado"
+        with self._lock:
+            self._con.execute(
+                "UPDATE trabajos SET estado = ?, actualizado = ? WHERE id = ?", (estado, _ahora(), trabajo_id)
+            )
+            self._con.commit()
+        if estado == "completado":
+            shutil.rmtree(self.carpeta_fuentes(trabajo_id), ignore_errors=True)
+        return estado
+
+    def registrar_rendimiento(self, trabajo_id, filas, segundos, workers=None):
+        """Guardar cuántas filas se generaron y en cuánto tiempo, para estimar trabajos futuros"""
+        with self._lock:
+            self._con.execute(
+                "INSERT INTO rendimiento (trabajo_id, fecha, filas, segundos, workers) VALUES (?, ?, ?, ?, ?)",
+                (trabajo_id, _ahora(), int(filas), float(segundos), workers),
+            )
+            self._con.commit()
+
+    def rendimiento(self, ultimos=20):
+        """Filas por segundo de las últimas corridas, o None si aún no hay datos"""
+        with self._lock:
+            filas, segundos = self._con.execute(
+                "SELECT SUM(filas), SUM(segundos) FROM (SELECT filas, segundos FROM rendimiento "
+                "WHERE filas > 0 AND segundos > 0 ORDER BY fecha DESC LIMIT ?)", (ultimos,)
+            ).fetchone()
+        if not filas or not segundos:
+            return None
+        return filas / segundos
+
+    def trabajo(self, trabajo_id):
+        with self._lock:
+            fila = self._con.execute(
+                "SELECT id, creado, actualizado, estado, plantilla, fuentes FROM trabajos WHERE id = ?", (trabajo_id,)
+            ).fetchone()
+        if not fila:
+            return None
+        return {
+            "id": fila[0], "creado": fila[1], "actualizado": fila[2], "estado": fila[3],
+            "plantilla": fila[4], "fuentes": json.loads(fila[5]),
+        }
+
+    def resumen(self, trabajo_id):
+        trabajo = self.trabajo(trabajo_id)
+        if trabajo is None:
+            return None
+        with self._lock:
+            conteo = self._con.execute(
+                "SELECT estado, COUNT(*) FROM filas WHERE trabajo_id = ? GROUP BY estado", (trabajo_id,)
+            ).fetchall()
+        trabajo["filas"] = dict(conteo)
+        return trabajo
+
+    def listar(self):
+        with self._lock:
+            ids = [f[0] for f in self._con.execute("SELECT id FROM trabajos ORDER BY actualizado DESC")]
+        return [self.resumen(trabajo_id) for trabajo_id in ids]
+
+    def cerrar(self):
+        with self._lock:
+            self._con.close()
+
+
+class JournalHoja:
+    """Vista del journal limitada a una hoja de un trabajo"""
+
+    def __init__(self, journal, trabajo_id, archivo, hoja):
+        self.journal = journal
+        self.trabajo_id = trabajo_id
+        self.archivo = archivo
+        self.hoja = hoja
+        self.previos = {}
+
+    def registrar(self, indices):
+        """Dar de alta las filas a generar y leer lo que ya se hizo en corridas anteriores"""
+        self.journal.registrar_filas(self.trabajo_id, self.archivo, self.hoja, indices)
+        self.previos = self.journal.estados(self.trabajo_id, self.archivo, self.hoja)
+        hechas = sum(1 for estado, _ in self.previos.values() if estado == CONVERTIDO)
+        if hechas:
+            logger.info(f"{self.archivo} [{self.hoja}]: {hechas} filas ya convertidas en una corrida anterior")
+
+    def previo(self, index):
+        """(estado, salida) de la fila en corridas anteriores"""
+        return self.previos.get(int(index), (PENDIENTE, None))
+
+    def marcar(self, index, estado, salida=None, error=None):
+        self.journal.actualizar(self.trabajo_id, self.archivo, self.hoja, index, estado, salida, error)
+
+    def descartar_documento_previo(self, index):
+        """Borrar el documento que quedó publicado en una corrida anterior cuya conversión falló.
+
+        Se llama cuando la fila ya se convirtió a PDF al reanudar, para no dejar
+        el .docx/.pptx viejo junto al PDF nuevo.
+        """
+        estado, salida = self.previo(index)
+        if estado != FALLIDO or not salida or Path(salida).suffix.lower() == ".pdf":
+            return
+        try:
+            Path(salida).unlink(missing_ok=True)
+            logger.info(f"Documento de la corrida anterior borrado: {salida}")
+        except OSError as e:
+            logger.warning(f"No se pudo borrar {salida}: {e}")
+
+    def envios(self):
+        """{indice: estado del envío por correo} registrado en corridas anteriores"""
+        return self.journal.envios(self.trabajo_id, self.archivo, self.hoja)
+
+    def marcar_envio(self, index, envio):
+        self.journal.actualizar_envio(self.trabajo_id, self.archivo, self.hoja, index, envio)
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def abrir_journal(output_dir):
+    """Journal compartido de una carpeta de salida (una conexión por carpeta)"""
+    clave = str(Path(output_dir).resolve())
+    with _journals_lock:
+        if clave not in _journals:
+            _journals[clave] = Journal(output_dir)
+        return _journals[clave]
@@ -0,0 +1,83 @@
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_REPORTE = ["fila", "columna", "valor", "error"]
+
+
+def pendientes_mask(df):
+    return df["certificado"].astype(str).str.lower().str.strip() == "no"
+
+
+def _vacios(serie):
+    return serie.isna() | (serie.astype(str).str.strip() == "")
+
+
+def parse_fechas(serie):
+    """Convertir la columna fecha a datetime; lo que no se entiende queda en NaT.
+
+    Las fechas ISO (2024-03-05) se leen primero como año-mes-día; dayfirst
+    solo se aplica al resto (05/03/2024), o las ISO con día <= 12 quedarían
+    con el día y el mes invertidos.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    fechas = pd.to_datetime(serie, errors="coerce", format="ISO8601")
+    resto = fechas.isna() & serie.notna()
+    if resto.any():
+        fechas[resto] = pd.to_datetime(serie[resto], errors="coerce", dayfirst=True, format="mixed")
+    return fechas
+
+
+def _errores(df, mask, columna, error):
+    """Filas del reporte para las posiciones marcadas en mask"""
+    filas = df.loc[mask]
+    # Número de fila tal como se ve en Excel (encabezado en la fila 1)
+    numero_fila = filas.index + 2 if pd.api.types.is_integer_dtype(filas.index) else filas.index
+    return pd.DataFrame({
+        "fila": numero_fila,
+        "columna": columna,
+        "valor": filas[columna].fillna("").astype(str),
+        "error": error,
+    }, index=filas.index)
+
+
+def validar_dataframe(df):
+    """Revisar todas las filas pendientes en una sola pasada, antes de generar nada.
+
+    Recibe el DataFrame con las columnas ya normalizadas y devuelve un reporte
+    con una fila por problema encontrado; el índice del reporte es el índice
+    de la fila en df. Un reporte vacío significa que todo está en orden.
+    """
+    pendientes = df.loc[pendientes_mask(df)]
+    reportes = []
+
+    nombre_vacio = _vacios(pendientes["nombre"])
+    reportes.append(_errores(pendientes, nombre_vacio, "nombre", "Nombre vacío"))
+
+    cedula_vacia = _vacios(pendientes["cedula"])
+    reportes.append(_errores(pendientes, cedula_vacia, "cedula", "Cédula vacía"))
+
+    cedulas = pendientes["cedula"].astype(str).str.strip()
+    duplicada = cedulas.duplicated(keep=False) & ~cedula_vacia
+    reportes.append(_errores(pendientes, duplicada, "cedula", "Cédula duplicada"))
+
+    fechas = parse_fechas(pendientes["fecha"])
+    fecha_invalida = fechas.isna() & ~_vacios(pendientes["fecha"])
+    reportes.append(_errores(pendientes, fecha_invalida, "fecha", "Fecha no reconocida"))
+
+    for columna in ("id_formacion", "item"):
+        numeros = pd.to_numeric(pendientes[columna], errors="coerce")
+        no_numerico = numeros.isna() & ~_vacios(pendientes[columna])
+        reportes.append(_errores(pendientes, no_numerico, columna, "Debe ser numérico"))
+
+    reporte = pd.concat(reportes).sort_index(kind="stable")
+    if len(reporte):
+        logger.warning(f"Validación: {len(reporte)} problemas en {reporte.index.nunique()} filas")
+    return reporte[COLUMNAS_REPORTE]
+
+
+def filas_invalidas(reporte):
+    return set(reporte.index)
@@ -0,0 +1,199 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+import subprocess
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .lotes import workers_por_defecto
+from .motor import build_context, resolver_plantillas
+from .conversor import orquestador
+from .plantillas import registro
+from .rutas import com_thread
+from .trabajos import CONVERTIDO
+from .validacion import pendientes_mask
+
+logger = logging.getLogger(__name__)
+
+
+def primeras_pendientes(subtrabajos, n):
+    """Las primeras n filas pendientes, en el orden de los libros y hojas: [(subtrabajo, index, row)]"""
+    filas = []
+    for sub in subtrabajos:
+        pendientes = sub.df.loc[pendientes_mask(sub.df)]
+        for index, row in pendientes.head(n - len(filas)).iterrows():
+            filas.append((sub, index, row))
+        if len(filas) >= n:
+            break
+    return filas
+
+
+class VistaPrevia:
+    """Certificados de muestra generados en una carpeta temporal, con caché.
+
+    Cada PDF se guarda por el contenido de su contexto y la versión de la
+    plantilla: repetir la vista previa de las mismas filas es inmediato, y
+    cambiar la plantilla la invalida sola.
+    """
+
+    def __init__(self, carpeta=None, max_archivos=300):
+        self.carpeta = Path(carpeta or Path(tempfile.gettempdir()) / "certificados_preview")
+        os.makedirs(self.carpeta, exist_ok=True)
+        self.max_archivos = max_archivos
+
+    def clave(self, plantilla, contexto):
+        datos = json.dumps([str(plantilla.path), plantilla.mtime, contexto], sort_keys=True, default=str)
+        return hashlib.sha1(datos.encode("utf-8")).hexdigest()
+
+    def pdf_fila(self, row, plantilla):
+        """PDF de una fila; se genera solo si no está en caché"""
+        contexto = build_context(row)
+        clave = self.clave(plantilla, contexto)
+        pdf = self.carpeta / f"{clave}.pdf"
+        if pdf.exists():
+            return pdf
+
+        # Nombre único mientras se genera: dos vistas previas iguales pueden correr a la vez
+        temporal = self.carpeta / f"{clave}-{uuid.uuid4().hex[:8]}"
+        documento = temporal.with_suffix(plantilla.backend.extension)
+        pdf_temporal = temporal.with_suffix(".pdf")
+        try:
+            plantilla.render(contexto, documento)
+            if not plantilla.backend.convert(documento, pdf_temporal):
+                raise RuntimeError(f"No se pudo convertir a PDF con la plantilla {plantilla.nombre}")
+            os.replace(pdf_temporal, pdf)
+        finally:
+            for archivo in (documento, pdf_temporal):
+                if archivo.exists():
+                    archivo.unlink()
+        return pdf
+
+    def _limpiar(self):
+        archivos = sorted(self.carpeta.iterdir(), key=lambda p: p.stat().st_mtime)
+        for archivo in archivos[:max(0, len(archivos) - self.max_archivos)]:
+            archivo.unlink(missing_ok=True)
+
+    def generar(self, subtrabajos, plantilla_path, n=3):
+        """PDF con los certificados de las primeras n filas pendientes"""
+        filas = primeras_pendientes(subtrabajos, n)
+        if not filas:
+            raise ValueError("No hay filas pendientes para la vista previa")
+
+        tareas = []
+        for sub, index, row in filas:
+            path = resolver_plantillas(sub.df.loc[[index]], plantilla_path).iloc[0]
+            if path is None:
+                raise ValueError(f"{sub.etiqueta} fila {int(index) + 2}: plantilla no encontrada")
+            tareas.append((row, registro.obtener(path)))
+
+        def generar_fila(tarea):
+            with com_thread():
+                return self.pdf_fila(*tarea)
+
+        with ThreadPoolExecutor(max_workers=min(len(tareas), workers_por_defecto())) as pool:
+            pdfs = list(pool.map(generar_fila, tareas))
+
+        self._limpiar()
+        if len(pdfs) == 1:
+            return pdfs[0]
+        return self.unir(pdfs)
+
+    def unir(self, pdfs):
+        """Un solo PDF con todas las páginas (en caché por su contenido)"""
+        clave = hashlib.sha1("".join(p.stem for p in pdfs).encode("utf-8")).hexdigest()
+        destino = self.carpeta / f"muestra_{clave}.pdf"
+        if destino.exists():
+            return destino
+        try:
+            import pikepdf
+        except ImportError:
+            logger.warning("pikepdf no está instalado; la vista previa muestra solo el primer certificado")
+            return pdfs[0]
+
+        temporal = destino.with_name(f".{destino.name}.{uuid.uuid4().hex[:8]}")
+        with pikepdf.new() as salida:
+            for pdf in pdfs:
+                with pikepdf.open(pdf) as origen:
+                    salida.pages.extend(origen.pages)
+            salida.save(temporal)
+        os.replace(temporal, destino)
+        return destino
+
+    def pagina_png(self, pdf, pagina=1, dpi=80):
+        """Imagen PNG de una página del PDF, o None si no hay con qué rasterizar.
+
+        Usa PyMuPDF si está instalado, o pdftoppm (poppler).
+        """
+        destino = self.carpeta / f"{Path(pdf).stem}_p{pagina}_{dpi}.png"
+        if destino.exists():
+            return destino.read_bytes()
+
+        try:
+            import fitz  # PyMuPDF
+        except ImportError:
+            fitz = None
+        if fitz is not None:
+            with fitz.open(pdf) as documento:
+                if not 1 <= pagina <= documento.page_count:
+                    return None
+                documento[pagina - 1].get_pixmap(dpi=dpi).save(str(destino))
+            return destino.read_bytes()
+
+        pdftoppm = shutil.which("pdftoppm")
+        if pdftoppm is None:
+            return None
+        try:
+            orquestador().ejecutar([
+                pdftoppm, "-png", "-r", str(dpi), "-f", str(pagina), "-l", str(pagina),
+                "-singlefile", str(pdf), str(destino.with_suffix("")),
+            ], check=True, timeout=30)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            logger.error(f"Error rasterizando la vista previa: {e}")
+            return None
+        return destino.read_bytes() if destino.exists() else None
+
+
+def planificar(subtrabajos, plantilla_path, rendimiento=None, journal=None, trabajo_id=None):
+    """Simulación: qué se generaría, por compañía y plantilla, y cuánto tardaría.
+
+    Espera subtrabajos ya validados (validar_subtrabajos), cuyas filas con
+    errores se cuentan aparte. rendimiento es filas por segundo medido en
+    trabajos anteriores (Journal.rendimiento); sin él no hay estimación. Con
+    journal y trabajo_id se descuentan las filas que ya se generaron.
+    """
+    por_compania, por_plantilla = Counter(), Counter()
+    pendientes_total = con_errores = sin_plantilla = ya_generadas = 0
+    for sub in subtrabajos:
+        pendientes = sub.df.loc[pendientes_mask(sub.df)]
+        pendientes_total += len(pendientes)
+        validas = pendientes.drop(index=list(sub.omitir), errors="ignore")
+        con_errores += len(pendientes) - len(validas)
+
+        plantillas = resolver_plantillas(validas, plantilla_path)
+        sin_plantilla += int(plantillas.isna().sum())
+        validas = validas.loc[plantillas.notna()]
+        por_compania.update(validas["compañia"].astype(str).value_counts().to_dict())
+        por_plantilla.update(plantillas.dropna().map(lambda p: Path(p).name).value_counts().to_dict())
+
+        if journal is not None and trabajo_id:
+            estados = journal.estados(trabajo_id, sub.nombre_archivo, sub.hoja)
+            ya_generadas += sum(1 for index in validas.index if estados.get(int(index), (None,))[0] == CONVERTIDO)
+
+    a_generar = sum(por_compania.values())
+    por_convertir = a_generar - ya_generadas
+    return {
+        "filas_pendientes": pendientes_total,
+        "filas_a_generar": a_generar,
+        "filas_con_errores": con_errores,
+        "filas_sin_plantilla": sin_plantilla,
+        "ya_generadas": ya_generadas,
+        "por_compania": dict(por_compania.most_common()),
+        "por_plantilla": dict(por_plantilla.most_common()),
+        "filas_por_segundo": round(rendimiento, 3) if rendimiento else None,
+        "segundos_estimados": round(por_convertir / rendimiento, 1) if rendimiento else None,
+    }